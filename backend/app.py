@@ -1,26 +1,43 @@
 # -*- coding: utf-8 -*-
 """
 Transcriptotem — Backend FastAPI (versión simplificada)
-Sin daemons, sin polling, sin nada en background.
+Sin daemons ni polling: lo único en background es el hilo de la cola
+de trabajos (/api/jobs), que vive dentro del propio servidor.
 El servidor muere cuando cierras la Terminal.
 """
-import io
+import asyncio
 import json
 import os
 import re
 import shutil
-import subprocess
 import tempfile
+import threading
 import time
 import traceback
-import zipfile
+from concurrent.futures import Future
 from pathlib import Path
+from typing import Optional
 
-from fastapi import FastAPI, File, Form, HTTPException, UploadFile
+from fastapi import FastAPI, File, Form, HTTPException, Query, Request, UploadFile, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, HTMLResponse, StreamingResponse
-
-from backend.transcriber import transcribe
+from fastapi.responses import FileResponse, HTMLResponse, PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+
+from backend import config, metrics, workers
+from backend.audio import decode_stats, probe
+from backend.cache import DiskCache
+from backend.export import DEPENDENCIA, MIME, Exporter, adelantar, disponible, nombre_unico, zip_stream
+from backend.jobs import ColaLlena, Job, JobQueue, TrabajoCancelado
+from backend.live import LiveSession, activas as streams_en_vivo, guardar as guardar_transcripcion
+from backend.pipeline import FolderPipeline, Manifest
+from backend.search import SearchIndex
+from backend.transcriber import (ENGINES, batch_scheduler, cache_key, estimate_eta, eta_estimator, get_engine,
+                                 model_registry, preload_models, transcribe, transcribe_stream,
+                                 transcribe_window, transcript_cache)
+from backend.uploads import (ChecksumInvalido, ConflictoOffset, SubidaNoEncontrada, TrozoDemasiadoGrande,
+                             UploadStore)
+from backend.watcher import FolderWatcher
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -31,6 +48,14 @@ TRANSCRITAS = ONEDRIVE / "Grabaciones Clases" / "Transcritas"
 ARCHIVADOS  = ONEDRIVE / "Grabaciones Clases" / "Archivados"
 
 EXTENSIONES = {".m4a", ".mp3", ".wav"}
+MODELO_POR_DEFECTO = "mlx-community/whisper-large-v3-turbo"
+
+# Índice de búsqueda de las transcripciones (Transcritas + las subidas desde el navegador)
+indice = SearchIndex(config.SEARCH_DB, TRANSCRITAS, config.SEARCH_PASSAGE_SECONDS,
+                     config.SEARCH_SYNC_SECONDS, config.SEARCH_RANK_LIMIT)
+# PDF/DOCX renderizados fuera del hilo de la petición y guardados por hash del contenido
+exportador = Exporter(DiskCache(config.EXPORT_CACHE_DIR, config.EXPORT_CACHE_MAX_MB * 1024 * 1024),
+                      config.EXPORT_WORKERS)
 
 app = FastAPI(title="Transcriptotem")
 
@@ -43,6 +68,201 @@ app.add_middleware(
 )
 
 
+class _MarcaInicio:
+    """Guarda el instante en que llega la petición, antes de recibir el cuerpo (etapa "upload")."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            scope.setdefault("state", {})["t_inicio"] = time.perf_counter()
+        await self.app(scope, receive, send)
+
+
+app.add_middleware(_MarcaInicio)
+
+
+def _validar_motor(engine: Optional[str]) -> None:
+    try:
+        get_engine(engine)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+
+def _tiempo_subida(request: Request, timings: dict) -> None:
+    t_inicio = getattr(request.state, "t_inicio", None)
+    if t_inicio is not None:
+        metrics.observe_stage(timings, "upload", time.perf_counter() - t_inicio)
+
+
+def _extension(filename: Optional[str]) -> str:
+    ext = Path(filename or "").suffix.lower()
+    if ext not in EXTENSIONES:
+        raise HTTPException(400, "Formato no soportado. Use .m4a, .mp3 o .wav")
+    return ext
+
+
+def _audio_recibido(file: Optional[UploadFile], upload_id: Optional[str],
+                    timings: dict) -> tuple[str, Optional[str], str, bool]:
+    """
+    (ruta, sha256 o None, nombre, ¿es temporal?) del audio de la petición:
+    un archivo en el formulario, que se copia a disco por bloques, o el
+    `upload_id` de una subida por trozos ya completa (ya tiene hash).
+    """
+    if upload_id:
+        try:
+            ruta, sha, nombre = subidas.path(upload_id)
+        except SubidaNoEncontrada:
+            raise HTTPException(404, "Subida no encontrada")
+        except ConflictoOffset as e:
+            raise HTTPException(409, str(e))
+        return str(ruta), sha, nombre or ruta.name, False
+    if file is None:
+        raise HTTPException(400, "Falta el archivo (file) o el upload_id")
+    ext = _extension(file.filename)
+    with metrics.stage(timings, "temp_write"):
+        with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as f:
+            shutil.copyfileobj(file.file, f, 1024 * 1024)
+    return f.name, None, file.filename, True
+
+
+def _sondear(ruta: str, audio_hash: Optional[str], model: str, engine: Optional[str],
+             language: Optional[str] = None, context: str = "") -> dict:
+    """
+    {"probe", "eta"} de un audio en el servidor. Con `language` y el hash
+    se mira además la caché de transcripciones (ETA 0 si ya está hecha).
+    """
+    try:
+        info = probe(ruta, audio_hash)
+    except OSError:
+        info = None
+    key = cache_key(audio_hash, language, model, context, None, engine) if audio_hash and language else None
+    eta = estimate_eta(info["duration_s"], model, engine, key) if info else None
+    return {"probe": info, "eta": eta}
+
+
+def _con_eta(estado: dict, model: Optional[str], engine: Optional[str],
+             language: Optional[str], context: str = "") -> dict:
+    """Una subida completa se responde con su duración y la ETA de transcribirla."""
+    if not estado.get("complete"):
+        return estado
+    try:
+        ruta, sha, _ = subidas.path(estado["upload_id"])
+    except (SubidaNoEncontrada, ConflictoOffset):
+        return estado
+    return dict(estado, **_sondear(str(ruta), sha, model or MODELO_POR_DEFECTO, engine, language, context))
+
+
+def _indexar(nombre: str, texto: str, segmentos: Optional[list], origen: str) -> Optional[str]:
+    """Agrega una transcripción sin archivo al índice de búsqueda; su id (None si falla o está vacía)."""
+    try:
+        return indice.add_text(nombre, texto, segmentos, origen=origen)
+    except Exception as e:  # la transcripción ya está hecha: el índice no la debe tumbar
+        metrics.count_error("index", e)
+        print(f"⚠️ No se pudo indexar {nombre}: {e}", flush=True)
+        return None
+
+
+# ══════════════════════════════════════════════════════════════════
+# SUBIDAS POR TROZOS (reanudables, deduplicadas por contenido)
+# ══════════════════════════════════════════════════════════════════
+
+subidas = UploadStore(config.UPLOADS_DIR, config.UPLOADS_MAX_MB * 1024 * 1024,
+                      config.UPLOAD_CHUNK_MB * 1024 * 1024,
+                      config.UPLOAD_MAX_FILE_MB * 1024 * 1024,
+                      config.UPLOAD_PARTIAL_HOURS * 3600)
+
+
+@app.post("/api/uploads")
+def api_crear_subida(payload: dict):
+    """
+    Abre (o retoma) una subida. Con `chunks` (SHA-256 de cada trozo de
+    `chunk_size` bytes) o `sha256`, un audio que el servidor ya tiene se
+    responde `complete` sin enviar nada. Las subidas completas traen
+    `probe` (duración, formato) y `eta` para `model`/`engine`/`language`.
+    """
+    _extension(payload.get("filename"))
+    _validar_motor(payload.get("engine"))
+    try:
+        estado = subidas.create(payload["filename"], payload.get("size", 0),
+                                chunk_size=payload.get("chunk_size"), chunks=payload.get("chunks"),
+                                sha256=payload.get("sha256"))
+    except (KeyError, TypeError, ValueError) as e:
+        raise HTTPException(400, str(e))
+    return _con_eta(estado, payload.get("model"), payload.get("engine"), payload.get("language"),
+                    payload.get("context") or "")
+
+
+@app.get("/api/uploads/{upload_id}")
+def api_estado_subida(upload_id: str):
+    try:
+        return subidas.status(upload_id)
+    except SubidaNoEncontrada:
+        raise HTTPException(404, "Subida no encontrada")
+
+
+@app.get("/api/uploads/{upload_id}/probe")
+def api_sondear_subida(upload_id: str, model: str = MODELO_POR_DEFECTO, engine: Optional[str] = None,
+                       language: Optional[str] = None, context: str = ""):
+    """Duración y formato (ffprobe, cacheado) y ETA de una subida completa."""
+    _validar_motor(engine)
+    ruta, sha, nombre, _ = _audio_recibido(None, upload_id, {})
+    return {"upload_id": upload_id, "filename": nombre,
+            **_sondear(ruta, sha, model, engine, language, context)}
+
+
+@app.put("/api/uploads/{upload_id}")
+async def api_trozo_subida(upload_id: str, offset: int, request: Request,
+                           model: Optional[str] = None, engine: Optional[str] = None,
+                           language: Optional[str] = None):
+    """
+    Un trozo que empieza en `offset`, en el cuerpo tal cual. Se escribe a
+    disco por bloques de 1 MB mientras llega; si falla el checksum o se
+    corta, el offset no avanza y el trozo se reenvía. El último trozo se
+    responde con `probe` y `eta`, como POST /api/uploads.
+    """
+    _validar_motor(engine)
+    try:
+        escritor = await run_in_threadpool(subidas.begin_chunk, upload_id, offset,
+                                           request.headers.get("x-chunk-sha256"))
+    except SubidaNoEncontrada:
+        raise HTTPException(404, "Subida no encontrada")
+    except ConflictoOffset as e:
+        raise HTTPException(409, {"message": str(e), "offset": e.offset})
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    try:
+        bloque = bytearray()
+        async for pieza in request.stream():
+            bloque += pieza
+            if len(bloque) >= 1024 * 1024:
+                await run_in_threadpool(escritor.write, bytes(bloque))
+                bloque.clear()
+        if bloque:
+            await run_in_threadpool(escritor.write, bytes(bloque))
+        estado = await run_in_threadpool(escritor.commit)
+    except ChecksumInvalido as e:
+        raise HTTPException(422, str(e))
+    except TrozoDemasiadoGrande as e:
+        await run_in_threadpool(escritor.abort)
+        raise HTTPException(413, str(e))
+    except ValueError as e:
+        await run_in_threadpool(escritor.abort)
+        raise HTTPException(400, str(e))
+    except BaseException:
+        await run_in_threadpool(escritor.abort)  # conexión cortada: el offset no avanza
+        raise
+    return await run_in_threadpool(_con_eta, estado, model, engine, language)
+
+
+@app.delete("/api/uploads/{upload_id}")
+def api_borrar_subida(upload_id: str):
+    if not subidas.delete(upload_id):
+        raise HTTPException(404, "Sesión de subida no encontrada")
+    return {"deleted": upload_id}
+
+
 # ══════════════════════════════════════════════════════════════════
 # FRONTEND
 # ══════════════════════════════════════════════════════════════════
@@ -61,226 +281,724 @@ def serve_index():
 
 @app.post("/api/transcribe")
 def api_transcribe(
-    file: UploadFile = File(...),
+    request: Request,
+    file: Optional[UploadFile] = File(None),
+    upload_id: Optional[str] = Form(None),
     language: str    = Form("es-chile"),
-    model: str       = Form("mlx-community/whisper-large-v3-turbo"),
+    model: str       = Form(MODELO_POR_DEFECTO),
     context: str     = Form(""),
+    cache: bool      = Form(True),
+    vad: Optional[bool] = Form(None),
+    engine: Optional[str] = Form(None),
 ):
-    ext = Path(file.filename or "").suffix.lower()
-    if ext not in EXTENSIONES:
-        raise HTTPException(400, "Formato no soportado. Use .m4a, .mp3 o .wav")
+    _validar_motor(engine)
 
+    timings = {}
+    _tiempo_subida(request, timings)
     tmp = None
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as f:
-            f.write(file.file.read())
-            tmp = f.name
+        ruta, audio_hash, nombre, temporal = _audio_recibido(file, upload_id, timings)
+        tmp = ruta if temporal else None
 
+        info = {"timings": timings}
         text, lang, segs = transcribe(
-            audio_path=tmp,
+            audio_path=ruta,
+            audio_hash=audio_hash,
             language_profile=language,
             model_name=model,
             context_text=context,
+            use_cache=cache,
+            vad=vad,
+            info=info,
+            engine=engine,
         )
-        return {"text": text, "language": lang, "model": model,
-                "segments_count": segs, "filename": file.filename}
+        metrics.TRANSCRIPTIONS.inc(source="upload", cached=bool(info.get("cached")))
+        transcript_id = _indexar(nombre, text, info.get("segments"), "upload")
+        return {"text": text, "language": lang, "model": model, "transcript_id": transcript_id,
+                "engine": get_engine(engine).name,
+                "segments_count": segs, "filename": nombre,
+                "vad": info.get("vad"), "decode": info.get("decode"),
+                "redecode": info.get("redecode"), "timings": timings}
+    except HTTPException:
+        raise
+    except Exception as e:
+        metrics.count_error("upload", e)
+        raise
     finally:
         if tmp and os.path.exists(tmp):
             try: os.unlink(tmp)
             except OSError: pass
 
 
+def _borrar_temporal(ruta: str) -> None:
+    try: os.unlink(ruta)
+    except OSError: pass
+
+
+@app.post("/api/transcribe-stream")
+def api_transcribe_stream(
+    request: Request,
+    file: Optional[UploadFile] = File(None),
+    upload_id: Optional[str] = Form(None),
+    language: str    = Form("es-chile"),
+    model: str       = Form(MODELO_POR_DEFECTO),
+    context: str     = Form(""),
+    cache: bool      = Form(True),
+    vad: Optional[bool] = Form(None),
+    engine: Optional[str] = Form(None),
+):
+    """
+    Como /api/transcribe, pero responde JSON Lines con cada segmento en cuanto
+    se decodifica ({"type": "segment", "start", "end", "text"}) y al final
+    {"type": "done", ...} con el mismo contenido que /api/transcribe.
+    """
+    _validar_motor(engine)
+
+    timings = {}
+    _tiempo_subida(request, timings)
+    ruta, audio_hash, nombre, temporal = _audio_recibido(file, upload_id, timings)
+
+    def generar():
+        segmentos = []
+        try:
+            yield _evento({"type": "start", "filename": nombre,
+                           **_sondear(ruta, audio_hash, model, engine, language if cache else None, context)})
+            for ev in transcribe_stream(audio_path=ruta, audio_hash=audio_hash, language_profile=language,
+                                        model_name=model, context_text=context,
+                                        use_cache=cache, vad=vad, engine=engine):
+                if ev["type"] == "segment":
+                    segmentos.append(ev)
+                    yield _evento(ev)
+                else:
+                    timings.update(ev["timings"])
+                    metrics.TRANSCRIPTIONS.inc(source="stream", cached=ev["cached"])
+                    yield _evento({"type": "done", "text": ev["text"], "language": ev["language"],
+                                   "transcript_id": _indexar(nombre, ev["text"], segmentos, "upload"),
+                                   "model": model, "engine": get_engine(engine).name,
+                                   "segments_count": ev["segments_count"],
+                                   "filename": nombre, "vad": ev["vad"],
+                                   "decode": ev["decode"], "redecode": ev.get("redecode"),
+                                   "timings": timings})
+        except Exception as e:
+            metrics.count_error("stream", e)
+            print(f"\n❌ ERROR en {nombre}:\n{traceback.format_exc()}", flush=True)
+            yield _evento({"type": "error", "archivo": nombre, "mensaje": str(e)})
+
+    # Como tarea de fondo y no en un finally del generador: se ejecuta aunque
+    # el cliente se desconecte antes de que empiece a recorrerse
+    return StreamingResponse(
+        generar(),
+        media_type="application/x-ndjson",
+        headers={"X-Content-Type-Options": "nosniff"},
+        background=BackgroundTask(_borrar_temporal, ruta) if temporal else None,
+    )
+
+
 # ══════════════════════════════════════════════════════════════════
-# TRANSCRIPCIÓN DE CARPETA (lee Pendientes, escribe en Transcritas)
-# Devuelve JSON Lines para que el frontend muestre progreso en vivo
+# EN VIVO (WebSocket: la grabadora envía el audio durante la clase)
 # ══════════════════════════════════════════════════════════════════
 
-def _audios_estables(carpeta: Path) -> list[Path]:
-    """Devuelve audios cuyo tamaño es estable (OneDrive terminó de sincronizar)."""
-    encontrados = []
-    for ext in EXTENSIONES:
-        encontrados.extend(carpeta.glob(f"*{ext}"))
-        encontrados.extend(carpeta.glob(f"*{ext.upper()}"))
+@app.websocket("/api/live")
+async def api_en_vivo(
+    ws: WebSocket,
+    language: str = "es-chile",
+    model: str = MODELO_POR_DEFECTO,
+    context: str = "",
+    engine: Optional[str] = None,
+    format: str = "pcm16",
+    sample_rate: int = 16000,
+    name: str = "",
+    vad: Optional[bool] = None,
+):
+    """
+    Mensajes binarios: audio en `format` (pcm16 | f32 mono a `sample_rate`,
+    u opus | webm | ogg tal como los entrega MediaRecorder). Mensaje de
+    texto {"type": "stop"} (o cerrar el socket) termina el stream.
+    Responde {"type": "ready", "stream_id", "name"}; luego "partial" (texto
+    provisional, la siguiente reemplaza a la anterior), "final" (definitivo,
+    con su latencia) y "stats" tras cada pasada; al terminar
+    {"type": "done", "text", "file", "stats"} con el .txt ya en Transcritas.
+    """
+    try:
+        get_engine(engine)
+    except ValueError as e:
+        await ws.close(code=1008, reason=str(e)[:120])
+        return
+    if len(streams_en_vivo()) >= config.LIVE_MAX_STREAMS:
+        await ws.close(code=1013, reason="Demasiados streams en vivo")
+        return
+    await ws.accept()
+
+    bucle = asyncio.get_running_loop()
+    salida: asyncio.Queue = asyncio.Queue()
+
+    def emitir(ev: Optional[dict]) -> None:  # desde el hilo de inferencia
+        bucle.call_soon_threadsafe(salida.put_nowait, ev)
+
+    def transcribir(audio, previo: str) -> list[dict]:
+        return transcribe_window(audio, language_profile=language, model_name=model,
+                                 context_text=context, previous_text=previo, engine=engine)
+
+    try:
+        sesion = LiveSession(transcribir, emitir, formato=format, sample_rate=sample_rate,
+                             nombre=name, model=model, vad=vad).start()
+    except (ValueError, RuntimeError) as e:
+        await ws.send_json({"type": "error", "mensaje": str(e)})
+        await ws.close(code=1003)
+        return
+
+    async def enviar():
+        while (ev := await salida.get()) is not None:
+            try:
+                await ws.send_json(ev)
+            except Exception:
+                pass  # el cliente se fue: igual se vacía la cola y se guarda el .txt
 
-    estables = []
-    for f in encontrados:
+    envio = asyncio.create_task(enviar())
+    emitir({"type": "ready", "stream_id": sesion.id, "name": sesion.nombre})
+    print(f"🎙  En vivo {sesion.id}: {sesion.nombre} ({format}, {model})", flush=True)
+    try:
+        while True:
+            msg = await ws.receive()
+            if msg["type"] == "websocket.disconnect":
+                break
+            if msg.get("bytes"):
+                await run_in_threadpool(sesion.feed, msg["bytes"])
+            elif msg.get("text"):
+                try:
+                    control = json.loads(msg["text"])
+                except ValueError:
+                    continue
+                if isinstance(control, dict) and control.get("type") == "stop":
+                    break
+    except Exception as e:
+        metrics.count_error("live", e)
+        print(f"\n❌ ERROR en vivo {sesion.id}:\n{traceback.format_exc()}", flush=True)
+        emitir({"type": "error", "mensaje": str(e)})
+    finally:
+        resumen = await run_in_threadpool(sesion.finish)
+        ruta = transcript_id = None
+        if resumen["text"].strip():
+            try:
+                ruta = await run_in_threadpool(guardar_transcripcion, TRANSCRITAS, sesion.nombre, resumen["text"])
+            except OSError as e:
+                metrics.count_error("live", e)
+                emitir({"type": "error", "mensaje": f"No se pudo guardar la transcripción: {e}"})
+        if ruta is not None:
+            try:
+                transcript_id = await run_in_threadpool(indice.add_file, ruta, resumen["text"],
+                                                        resumen["segments"], "live")
+            except Exception as e:
+                metrics.count_error("index", e)
+                print(f"⚠️ No se pudo indexar {ruta.name}: {e}", flush=True)
+        metrics.TRANSCRIPTIONS.inc(source="live", cached=False)
+        emitir({"type": "done", "text": resumen["text"], "file": ruta.name if ruta else None,
+                "transcript_id": transcript_id,
+                "segments_count": len(resumen["segments"]), "stats": resumen["stats"]})
+        emitir(None)
+        await envio
         try:
-            t1 = f.stat().st_size
-            time.sleep(1)
-            t2 = f.stat().st_size
-            if t1 == t2 and t1 > 0:
-                estables.append(f)
-        except FileNotFoundError:
+            await ws.close()
+        except Exception:
             pass
-    return sorted(estables)
+        print(f"🎙  En vivo {sesion.id} terminado: {resumen['stats']['audio_s']:.0f}s de audio"
+              f"{f' → {ruta.name}' if ruta else ''}", flush=True)
+
+
+@app.get("/api/live")
+def api_streams_en_vivo():
+    """Streams en vivo abiertos: audio recibido, atraso, latencias y RTF de cada uno."""
+    return {"max_streams": config.LIVE_MAX_STREAMS, "streams": [s.stats() for s in streams_en_vivo()]}
 
 
-def _duracion(ruta: Path) -> float | None:
+# ══════════════════════════════════════════════════════════════════
+# COLA DE TRABAJOS (subida → 202 con id → consultar / cancelar)
+# ══════════════════════════════════════════════════════════════════
+
+def _ejecutar_job(job: Job, check_cancel) -> dict:
+    info = {}
     try:
-        r = subprocess.run(
-            ["ffprobe", "-v", "quiet", "-print_format", "json",
-             "-show_streams", str(ruta)],
-            capture_output=True, text=True, timeout=8
+        text, lang, segs = transcribe(
+            audio_path=job.audio_path,
+            language_profile=job.language,
+            model_name=job.model,
+            context_text=job.context,
+            use_cache=job.options.get("cache", True),
+            vad=job.options.get("vad"),
+            info=info,
+            audio_hash=job.options.get("audio_hash"),
+            engine=job.options.get("engine"),
+            check_cancel=check_cancel,
         )
-        for s in json.loads(r.stdout).get("streams", []):
-            if s.get("codec_type") == "audio":
-                return float(s.get("duration", 0))
-    except Exception:
-        pass
-    return None
+    except TrabajoCancelado:
+        raise
+    except Exception as e:
+        metrics.count_error("job", e)
+        raise
+    metrics.TRANSCRIPTIONS.inc(source="job", cached=bool(info.get("cached")))
+    return {"text": text, "language": lang, "model": job.model,
+            "transcript_id": _indexar(job.filename, text, info.get("segments"), "job"),
+            "engine": get_engine(job.options.get("engine")).name,
+            "segments_count": segs, "filename": job.filename,
+            "vad": info.get("vad"), "decode": info.get("decode"),
+            "redecode": info.get("redecode"), "timings": info.get("timings")}
+
+
+cola = JobQueue(config.JOBS_DIR, _ejecutar_job,
+                max_queued=config.JOBS_MAX_QUEUED,
+                workers=config.JOBS_WORKERS,
+                keep_done=config.JOBS_KEEP_DONE)
+
+
+@app.on_event("startup")
+def _precargar_modelos():
+    # uvicorn no acepta conexiones hasta que terminan los hooks de arranque:
+    # la primera petición ya encuentra el modelo residente y caliente
+    if config.PRELOAD_MODELS:
+        preload_models(config.PRELOAD_MODELS)
+
+
+@app.on_event("startup")
+def _arrancar_cola():
+    cola.start(slot=workers.slot())
+
+
+@app.on_event("shutdown")
+def _detener_cola():
+    cola.stop()
+
+
+@app.post("/api/jobs", status_code=202)
+def api_crear_job(
+    file: Optional[UploadFile] = File(None),
+    upload_id: Optional[str] = Form(None),
+    language: str    = Form("es-chile"),
+    model: str       = Form(MODELO_POR_DEFECTO),
+    context: str     = Form(""),
+    cache: bool      = Form(True),
+    vad: Optional[bool] = Form(None),
+    engine: Optional[str] = Form(None),
+):
+    _validar_motor(engine)
+    if cola.depth() >= cola.max_queued:
+        raise HTTPException(503, "Cola llena, inténtalo más tarde")
+
+    job_id = cola.new_id()
+    audio_hash = None
+    if upload_id:
+        ruta, audio_hash, nombre, _ = _audio_recibido(None, upload_id, {})
+        destino = cola.upload_path(job_id, Path(nombre).suffix.lower())
+        # El trabajo borra su audio al terminar: se enlaza, sin copiar, el del almacén
+        try:
+            os.link(ruta, destino)
+        except OSError:
+            shutil.copyfile(ruta, destino)
+    else:
+        if file is None:
+            raise HTTPException(400, "Falta el archivo (file) o el upload_id")
+        nombre = file.filename
+        destino = cola.upload_path(job_id, _extension(file.filename))
+        with open(destino, "wb") as f:
+            shutil.copyfileobj(file.file, f, 1024 * 1024)
+
+    job = Job(id=job_id, filename=nombre or destino.name, audio_path=str(destino),
+              language=language, model=model, context=context,
+              options={"cache": cache, "vad": vad, "engine": engine, "audio_hash": audio_hash})
+    try:
+        cola.submit(job)
+    except ColaLlena as e:
+        destino.unlink(missing_ok=True)
+        raise HTTPException(503, str(e))
+    # La ETA es la de este audio; el tiempo en cola depende de los que tenga delante
+    return dict(cola.describe(job_id),
+                **_sondear(str(destino), audio_hash, model, engine, language if cache else None, context))
+
+
+@app.get("/api/jobs")
+def api_listar_jobs():
+    return {"queued": cola.depth(), "jobs": cola.list()}
+
+
+@app.get("/api/jobs/{job_id}")
+def api_estado_job(job_id: str):
+    info = cola.describe(job_id)
+    if info is None:
+        raise HTTPException(404, "Trabajo no encontrado")
+    return info
+
+
+@app.delete("/api/jobs/{job_id}")
+def api_cancelar_job(job_id: str):
+    if cola.cancel(job_id) is None:
+        raise HTTPException(404, "Trabajo no encontrado")
+    return cola.describe(job_id)
+
+
+@app.get("/api/models")
+def api_modelos():
+    """Motores disponibles y modelos residentes en memoria con su tiempo de carga y tamaño."""
+    return {
+        "engine": get_engine().name,
+        "engines": [e.describe() for e in ENGINES.values()],
+        "budget_mb": config.MODEL_BUDGET_MB,
+        "used_mb": round(model_registry.used_bytes() / (1024 * 1024), 1),
+        "loaded": model_registry.list(),
+    }
+
+
+@app.get("/api/cache")
+def api_cache_stats():
+    """Aciertos/fallos y tamaño de las cachés de transcripciones, audio decodificado y exportaciones."""
+    return {"transcripts": transcript_cache.stats(), "decoded": decode_stats(),
+            "uploads": subidas.stats(), "exports": exportador.stats()}
+
+
+@app.get("/api/batching")
+def api_lotes():
+    """Lotes entre peticiones: tamaño medio, ganancia de throughput estimada y latencia añadida."""
+    return {"enabled": config.BATCH_SIZE > 1, **batch_scheduler.stats()}
+
+
+@app.get("/api/eta")
+def api_eta():
+    """RTF y tiempo de carga aprendidos por motor y modelo en este hardware."""
+    return eta_estimator.stats()
+
+
+# ── Prometheus ─────────────────────────────────────────────────
+# Lo que ya cuentan la cola, las cachés y el registro se lee al hacer el scrape
+
+def _por_cache(campo: str) -> dict:
+    return {("transcripts",): transcript_cache.stats()[campo],
+            ("decoded",): decode_stats()[campo],
+            ("uploads",): subidas.blobs.stats()[campo],
+            ("exports",): exportador.cache.stats()[campo]}
+
+
+metrics.Callback("transcriptotem_queue_depth", "Trabajos esperando en /api/jobs", "gauge", (),
+                 lambda: {(): cola.depth()})
+metrics.Callback("transcriptotem_cache_hits_total", "Aciertos de caché", "counter", ("cache",),
+                 lambda: _por_cache("hits"))
+metrics.Callback("transcriptotem_cache_misses_total", "Fallos de caché", "counter", ("cache",),
+                 lambda: _por_cache("misses"))
+metrics.Callback("transcriptotem_cache_hit_ratio", "Aciertos / consultas desde el arranque", "gauge",
+                 ("cache",), lambda: _por_cache("hit_rate"))
+metrics.Callback("transcriptotem_cache_bytes", "Tamaño en disco de cada caché", "gauge", ("cache",),
+                 lambda: _por_cache("bytes"))
+metrics.Callback("transcriptotem_models_resident_bytes", "Memoria de los modelos residentes", "gauge", (),
+                 lambda: {(): model_registry.used_bytes()})
+metrics.Callback("transcriptotem_batch_pending_windows", "Ventanas esperando lote", "gauge", (),
+                 lambda: {(): batch_scheduler.pending()})
+metrics.Callback("transcriptotem_live_streams", "Streams en vivo abiertos", "gauge", (),
+                 lambda: {(): len(streams_en_vivo())})
+metrics.Callback("transcriptotem_live_backlog_seconds", "Audio en vivo recibido y aún sin transcribir",
+                 "gauge", ("stream",), lambda: {(s.id,): s.backlog_s() for s in streams_en_vivo()})
+metrics.Callback("transcriptotem_folder_pending_files", "Audios en Pendientes por estado", "gauge",
+                 ("state",), lambda: {("ready",): len(watcher.ready()),
+                                      ("syncing",): watcher.pending_count()})
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def api_metricas():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+# ── Salud ──────────────────────────────────────────────────────
+# /healthz: el proceso responde. /readyz: arrancó del todo (modelos
+# precargados, cola en marcha, DATA_DIR escribible) y no se está apagando;
+# el balanceador solo debe mandar tráfico a los workers listos.
+
+_estado = {"listo": False, "inicio": time.time()}
+
+
+@app.get("/healthz")
+def api_salud():
+    return {"status": "ok", "pid": os.getpid(), "worker": workers.slot(),
+            "uptime_s": round(time.time() - _estado["inicio"], 1)}
+
+
+@app.get("/readyz")
+def api_listo():
+    checks = {
+        "startup": _estado["listo"],
+        "jobs": cola.alive(),
+        "data_dir": os.access(config.DATA_DIR, os.W_OK),
+    }
+    cuerpo = {"ready": all(checks.values()), "worker": workers.slot(), "checks": checks,
+              "models": [m["name"] for m in model_registry.list()]}
+    if not cuerpo["ready"]:
+        raise HTTPException(503, cuerpo)
+    return cuerpo
+
+
+# ══════════════════════════════════════════════════════════════════
+# TRANSCRIPCIÓN DE CARPETA (lee Pendientes, escribe en Transcritas)
+# Devuelve JSON Lines para que el frontend muestre progreso en vivo
+# ══════════════════════════════════════════════════════════════════
+
+# Sigue la carpeta Pendientes desde que arranca el servidor: cuando llega
+# una petición, los archivos ya sincronizados están listos sin esperar.
+watcher = FolderWatcher(PENDIENTES, EXTENSIONES,
+                        estable_s=config.WATCH_STABLE_SECONDS,
+                        intervalo=config.WATCH_POLL_SECONDS)
 
 
 def _evento(obj: dict) -> str:
     return json.dumps(obj, ensure_ascii=False) + "\n"
 
 
+# Etapa de cada archivo de Pendientes: permite reanudar un lote interrumpido
+manifest = Manifest(config.FOLDER_MANIFEST)
+
+
+def _pipeline(language: str, model: str, context: str = "",
+              cache: bool = True, vad: Optional[bool] = None,
+              segments: bool = False, engine: Optional[str] = None,
+              priorities: Optional[dict] = None) -> FolderPipeline:
+    return FolderPipeline(watcher, TRANSCRITAS, ARCHIVADOS, manifest,
+                          language=language, model=model, context=context,
+                          cache=cache, vad=vad, prefetch=config.PIPELINE_PREFETCH,
+                          segments=segments, engine=engine, priorities=priorities, index=indice)
+
+
 @app.post("/api/transcribe-folder")
 def transcribe_folder(payload: dict):
     """
     Lee la carpeta Pendientes, transcribe cada audio y lo mueve a Archivados.
     El .txt queda en Transcritas.
     Devuelve JSON Lines (una línea por evento) para progreso en tiempo real.
+    Con "follow": true sigue esperando audios nuevos hasta "idle_timeout"
+    segundos sin actividad. Con "segments": true emite además cada segmento
+    transcrito ({"type": "segment", "archivo", "start", "end", "text"}).
+    "priorities": {"patrón": peso} se suma a prioridades.json de Pendientes
+    (el audio más corto va primero; un peso mayor lo adelanta).
     """
     language = payload.get("language", "es-chile")
     model    = payload.get("model",    "mlx-community/whisper-large-v3-turbo")
     context  = payload.get("context",  "")
+    cache    = bool(payload.get("cache", True))
+    vad      = payload.get("vad")
+    follow   = bool(payload.get("follow", False))
+    idle     = float(payload.get("idle_timeout", 600 if follow else 30))
+    segments = bool(payload.get("segments", False))
+    engine   = payload.get("engine")
+    priorities = payload.get("priorities") or {}
+    _validar_motor(engine)
+    try:
+        priorities = {str(k): float(v) for k, v in priorities.items() if float(v) > 0}
+    except (AttributeError, TypeError, ValueError):
+        raise HTTPException(400, "priorities debe ser {patrón: peso > 0}")
 
     # Crear carpetas si no existen
     for c in [PENDIENTES, TRANSCRITAS, ARCHIVADOS]:
         c.mkdir(parents=True, exist_ok=True)
 
     def generar():
-        audios = _audios_estables(PENDIENTES)
-        total  = len(audios)
-        yield _evento({"type": "start", "total": total})
+        watcher.start()
+        watcher.forget_failures()  # una petición manual reintenta los que fallaron
+        for ev in _pipeline(language, model, context, cache, vad, segments, engine, priorities).run(follow=follow, idle=idle):
+            yield _evento(ev)
 
-        if total == 0:
-            return
+    return StreamingResponse(
+        generar(),
+        media_type="application/x-ndjson",
+        headers={"X-Content-Type-Options": "nosniff"},
+    )
 
-        completados = 0
-        errores     = 0
-        resultados  = []
 
-        for i, ruta in enumerate(audios, 1):
-            t0 = time.time()
-            yield _evento({"type": "progress", "done": i-1, "total": total,
-                           "archivo": ruta.name, "tiempo": None})
-            try:
-                text, lang, segs = transcribe(
-                    audio_path=str(ruta),
-                    language_profile=language,
-                    model_name=model,
-                    context_text=context,
-                )
+def _vigilar_pendientes():
+    """Modo continuo: transcribe cada audio en cuanto OneDrive termina de sincronizarlo."""
+    while True:
+        for ev in _pipeline(config.WATCH_LANGUAGE, config.WATCH_MODEL).run(follow=True, idle=3600):
+            if ev["type"] == "progress" and ev.get("tiempo"):
+                print(f"✓ {ev['archivo']} transcrito en {ev['tiempo']} (modo continuo)", flush=True)
 
-                if text.strip():
-                    txt_path = TRANSCRITAS / f"{ruta.stem}.txt"
-                    txt_path.write_text(text, encoding="utf-8")
 
-                shutil.move(str(ruta), str(ARCHIVADOS / ruta.name))
+@app.on_event("startup")
+def _arrancar_watcher():
+    # Sin crear carpetas: Pendientes puede estar en un OneDrive que aún no se montó
+    if config.WATCH_AUTO and workers.is_leader():  # con varios workers, solo uno vigila
+        watcher.start()  # si la carpeta no existe, la sondea hasta que aparezca
+        threading.Thread(target=_vigilar_pendientes, name="pendientes", daemon=True).start()
+        print(f"👁  Modo continuo: vigilando {PENDIENTES} ({watcher.mode})", flush=True)
+    elif PENDIENTES.is_dir():
+        watcher.start()  # la primera petición de carpeta ya encuentra los estables
 
-                elapsed = round(time.time() - t0)
-                mm, ss  = elapsed // 60, elapsed % 60
-                tiempo  = f"{mm}m {ss}s"
 
-                completados += 1
-                resultados.append({"nombre": ruta.name, "texto": text, "tiempo": tiempo})
-                yield _evento({"type": "progress", "done": i, "total": total,
-                               "archivo": ruta.name, "tiempo": tiempo})
+@app.on_event("shutdown")
+def _detener_watcher():
+    watcher.stop()
 
-            except Exception as e:
-                errores += 1
-                tb = traceback.format_exc()
-                print(f"\n❌ ERROR en {ruta.name}:\n{tb}", flush=True)
-                yield _evento({"type": "error", "archivo": ruta.name, "mensaje": str(e)})
 
-        yield _evento({"type": "done", "total": total,
-                       "completados": completados, "errores": errores,
-                       "resultados": resultados})
+@app.on_event("shutdown")
+def _marcar_apagado():
+    _estado["listo"] = False
 
-    return StreamingResponse(
-        generar(),
-        media_type="application/x-ndjson",
-        headers={"X-Content-Type-Options": "nosniff"},
-    )
+
+# ══════════════════════════════════════════════════════════════════
+# BÚSQUEDA (índice FTS5 de Transcritas y de las subidas)
+# ══════════════════════════════════════════════════════════════════
+
+@app.get("/api/search")
+def api_buscar(q: str, limit: int = 20, offset: int = 0, transcript: Optional[str] = None):
+    """
+    Busca en todas las transcripciones, sin distinguir tildes ni mayúsculas.
+    `q` admite "frases exactas", prefijo* y -exclusiones. Devuelve
+    {query, total, total_exact, took_ms, hits: [{transcript_id, name, source,
+    start, end, snippet, score}]}; `snippet` es HTML con <mark>.
+    """
+    indice.maybe_sync()
+    try:
+        return indice.search(q, limit=limit, offset=offset, transcript=transcript)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+
+@app.post("/api/search/reindex")
+def api_reindexar(payload: Optional[dict] = None):
+    """Revisa Transcritas ahora; con "rebuild": true re-indexa todos los .txt."""
+    return indice.sync(rebuild=bool((payload or {}).get("rebuild", False)))
+
+
+@app.get("/api/transcripts")
+def api_transcripciones():
+    """Transcripciones indexadas, de la más reciente a la más antigua."""
+    return {"transcripts": indice.list(), "index": indice.stats()}
+
+
+@app.on_event("startup")
+def _sincronizar_indice():
+    # En segundo plano: con cientos de .txt nuevos la primera pasada tarda unos segundos
+    threading.Thread(target=indice.maybe_sync, name="indice", daemon=True).start()
 
 
 # ══════════════════════════════════════════════════════════════════
 # EXPORTACIÓN
 # ══════════════════════════════════════════════════════════════════
 
-@app.post("/api/export/pdf")
-def export_pdf(payload: dict):
+def _transcripcion(tid: str) -> dict:
+    """Entrada del índice con su título; 404 si no existe o su .txt ya no está."""
+    t = indice.get(tid)
+    if t is None or (t["path"] is None and not t["text"]):
+        raise HTTPException(404, f"Transcripción no encontrada: {tid}")
+    if t["path"] is not None and not Path(t["path"]).exists():
+        raise HTTPException(404, f"{t['name']} ya no está en Transcritas")
+    t["titulo"] = Path(t["name"]).stem
+    return t
+
+
+def _texto(t: dict) -> str:
+    return t["text"] if t["path"] is None else Path(t["path"]).read_text(encoding="utf-8", errors="replace")
+
+
+def _requiere(formato: str) -> None:
+    if formato not in DEPENDENCIA:
+        raise HTTPException(400, f"Formato no soportado: {formato} (pdf, docx o zip)")
+    if not disponible(formato):
+        raise HTTPException(500, f"pip install {DEPENDENCIA[formato][1]}")
+
+
+def _documento(formato: str, titulo: str, texto: str) -> FileResponse:
+    _requiere(formato)
+    ruta = exportador.render(formato, titulo, texto)
+    return FileResponse(ruta, media_type=MIME[formato], filename=f"{titulo}.{formato}")
+
+
+def _exportar(formato: str, payload: dict) -> FileResponse:
+    if payload.get("transcript_id"):
+        t = _transcripcion(payload["transcript_id"])
+        return _documento(formato, t["titulo"], _texto(t))
+    # Compatibilidad: texto enviado por el cliente (p. ej. uno que no pasó por el servidor)
     texto  = payload.get("text", "").strip()
     nombre = payload.get("filename", "transcripcion")
     if not texto:
         raise HTTPException(400, "Sin texto")
-    try:
-        from reportlab.lib.pagesizes import A4
-        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-        from reportlab.lib.units import cm
-        from reportlab.lib.enums import TA_JUSTIFY
-        from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer
-
-        buf = io.BytesIO()
-        doc = SimpleDocTemplate(buf, pagesize=A4,
-                                leftMargin=2.5*cm, rightMargin=2.5*cm,
-                                topMargin=2.5*cm, bottomMargin=2.5*cm)
-        styles   = getSampleStyleSheet()
-        t_style  = ParagraphStyle("t", parent=styles["Heading1"], fontSize=16, spaceAfter=12)
-        b_style  = ParagraphStyle("b", parent=styles["Normal"],
-                                  fontSize=11, leading=16, alignment=TA_JUSTIFY, spaceAfter=8)
-        story = [Paragraph(nombre, t_style), Spacer(1, 0.5*cm)]
-        for p in texto.split("\n\n"):
-            p = p.strip()
-            if p: story.append(Paragraph(p.replace("\n", " "), b_style))
-        doc.build(story); buf.seek(0)
-        return StreamingResponse(buf, media_type="application/pdf",
-                                 headers={"Content-Disposition": f'attachment; filename="{nombre}.pdf"'})
-    except ImportError:
-        raise HTTPException(500, "pip install reportlab")
+    return _documento(formato, nombre, texto)
+
+
+def _zip(items: list[dict], contenido: str) -> StreamingResponse:
+    """
+    ZIP con un .txt (o .pdf/.docx) por transcripción, enviado a medida que
+    se escribe. Los ids se validan antes de empezar: a mitad del envío ya
+    no se puede responder con un error.
+    """
+    if contenido != "txt":
+        _requiere(contenido)
+    docs = []
+    for item in items:
+        if item.get("transcript_id"):
+            t = _transcripcion(item["transcript_id"])
+            docs.append((t["titulo"], Path(t["path"]) if t["path"] else None, t["text"]))
+        elif (item.get("text") or "").strip():
+            docs.append((Path(item.get("filename", "transcripcion")).stem, None, item["text"].strip()))
+    if not docs:
+        raise HTTPException(400, "Sin items")
+
+    def entradas():
+        usados: set = set()
+        for titulo, ruta, texto in docs:
+            nombre = nombre_unico(usados, titulo, contenido)
+            if contenido == "txt":
+                yield nombre, ruta if ruta is not None else texto.encode("utf-8")
+            else:
+                try:
+                    if ruta is not None:
+                        texto = ruta.read_text(encoding="utf-8", errors="replace")
+                    documento = exportador.submit(contenido, titulo, texto)
+                except Exception as e:  # a mitad del ZIP: zip_stream lo anota como NOMBRE.error.txt
+                    documento = Future()
+                    documento.set_exception(e)
+                yield nombre, documento
+
+    # Con PDF/DOCX, los siguientes renders avanzan en el pool mientras se envía el actual
+    cuerpo = zip_stream(adelantar(entradas(), exportador.workers if contenido != "txt" else 0),
+                        comprimir=contenido == "txt")
+    return StreamingResponse(cuerpo, media_type=MIME["zip"],
+                             headers={"Content-Disposition": 'attachment; filename="transcripciones.zip"'})
+
+
+@app.get("/api/export/{formato}")
+def api_exportar(formato: str, ids: list[str] = Query(..., alias="id"), entries: str = "txt"):
+    """
+    Descarga por transcript_id: /api/export/pdf?id=…, /api/export/docx?id=…
+    o /api/export/zip?id=…&id=…[&entries=pdf|docx]. Con un enlace normal el
+    navegador guarda el archivo a medida que llega.
+    """
+    if formato == "zip":
+        return _zip([{"transcript_id": tid} for tid in ids], entries)
+    if len(ids) != 1:
+        raise HTTPException(400, "Un solo id por documento; para varios, /api/export/zip")
+    return _exportar(formato, {"transcript_id": ids[0]})
+
+
+@app.post("/api/export/pdf")
+def export_pdf(payload: dict):
+    return _exportar("pdf", payload)
 
 
 @app.post("/api/export/docx")
 def export_docx(payload: dict):
-    texto  = payload.get("text", "").strip()
-    nombre = payload.get("filename", "transcripcion")
-    if not texto:
-        raise HTTPException(400, "Sin texto")
-    try:
-        from docx import Document
-        from docx.shared import Pt, Cm
-        from docx.enum.text import WD_ALIGN_PARAGRAPH
-
-        doc = Document()
-        for s in doc.sections:
-            s.top_margin = s.bottom_margin = s.left_margin = s.right_margin = Cm(2.5)
-        h = doc.add_heading(nombre, level=1); h.alignment = WD_ALIGN_PARAGRAPH.LEFT
-        for p in texto.split("\n\n"):
-            p = p.strip()
-            if p:
-                par = doc.add_paragraph(p.replace("\n", " "))
-                par.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
-                for run in par.runs: run.font.size = Pt(11)
-        buf = io.BytesIO(); doc.save(buf); buf.seek(0)
-        return StreamingResponse(
-            buf,
-            media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-            headers={"Content-Disposition": f'attachment; filename="{nombre}.docx"'})
-    except ImportError:
-        raise HTTPException(500, "pip install python-docx")
+    return _exportar("docx", payload)
 
 
 @app.post("/api/export/zip")
 def export_zip(payload: dict):
-    items = payload.get("items", [])
-    if not items: raise HTTPException(400, "Sin items")
-    buf = io.BytesIO()
-    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
-        for item in items:
-            texto = item.get("text", "").strip()
-            if texto:
-                zf.writestr(Path(item.get("filename", "transcripcion")).stem + ".txt", texto)
-    buf.seek(0)
-    return StreamingResponse(buf, media_type="application/zip",
-                             headers={"Content-Disposition": 'attachment; filename="transcripciones.zip"'})
+    """items: [{transcript_id} o {filename, text}]; "ids" como atajo. "entries": txt (defecto), pdf o docx."""
+    items = list(payload.get("items") or []) + [{"transcript_id": tid} for tid in payload.get("ids") or []]
+    return _zip(items, payload.get("entries", "txt"))
+
+
+@app.on_event("shutdown")
+def _detener_exportador():
+    exportador.shutdown()
+
+
+# ══════════════════════════════════════════════════════════════════
+# ARRANQUE COMPLETO
+# Debe seguir siendo lo último del módulo: los hooks de arranque corren en
+# el orden en que se registran, y /readyz solo responde 200 tras todos.
+# ══════════════════════════════════════════════════════════════════
+
+@app.on_event("startup")
+def _marcar_listo():
+    _estado["listo"] = True
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+Decodificación de audio a PCM float32 mono 16 kHz (el formato que espera Whisper).
+Misma llamada a ffmpeg que usan mlx_whisper y openai-whisper internamente,
+pero aquí el array queda en nuestras manos para pre-procesarlo.
+
+ffmpeg se lanza una sola vez por contenido: el resultado se guarda como
+.npy en una caché en disco (clave = hash del archivo) y las siguientes
+lecturas lo abren con mmap. VAD, modo paralelo, streaming y motores
+reciben ese mismo array en lugar de la ruta.
+"""
+import json
+import os
+import subprocess
+import tempfile
+import threading
+import time
+
+from backend import config
+from backend.cache import DiskCache, clave, sha256_archivo
+
+SAMPLE_RATE = 16000
+
+decoded_cache = DiskCache(config.DECODE_CACHE_DIR, config.DECODE_CACHE_MAX_MB * 1024 * 1024,
+                          sufijo=".npy")
+# Metadatos de ffprobe (duración, códec…): JSON pequeños, por contenido o por ruta+tamaño+mtime
+probe_cache = DiskCache(config.PROBE_CACHE_DIR, 16 * 1024 * 1024, sufijo=".json")
+_totales = {"decodes": 0, "decode_s": 0.0}
+_totales_lock = threading.Lock()
+
+
+def load_audio(ruta, sr: int = SAMPLE_RATE):
+    import numpy as np
+    cmd = [
+        "ffmpeg", "-nostdin", "-threads", "0", "-i", str(ruta),
+        "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(sr), "-",
+    ]
+    try:
+        out = subprocess.run(cmd, capture_output=True, check=True).stdout
+    except FileNotFoundError:
+        raise RuntimeError("ffmpeg no está instalado (brew install ffmpeg)")
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError(f"ffmpeg no pudo decodificar el audio: {e.stderr.decode(errors='ignore')[-300:]}")
+    return np.frombuffer(out, np.int16).astype(np.float32) / 32768.0
+
+
+def _anotar(info: dict | None, segundos: float, cacheado: bool) -> None:
+    if info is not None:
+        info["decode"] = {"decode_s": round(segundos, 3), "cached": cacheado}
+    if not cacheado:
+        with _totales_lock:
+            _totales["decodes"] += 1
+            _totales["decode_s"] += segundos
+
+
+def load_audio_cached(ruta, audio_hash: str | None = None, info: dict | None = None):
+    """
+    Como load_audio(), pero pasando por la caché de audio decodificado.
+    Devuelve un array mapeado en memoria (modo copy-on-write: se puede
+    escribir sin tocar el archivo). Si se pasa `info`, se rellena
+    info["decode"] = {"decode_s", "cached"}.
+    """
+    import numpy as np
+    t0 = time.perf_counter()
+    if not config.DECODE_CACHE:
+        audio = load_audio(ruta)
+        _anotar(info, time.perf_counter() - t0, False)
+        return audio
+
+    key = audio_hash or sha256_archivo(ruta)
+    p = decoded_cache.get_path(key)
+    if p is not None:
+        try:
+            audio = np.load(p, mmap_mode="c")
+            _anotar(info, time.perf_counter() - t0, True)
+            return audio
+        except (OSError, ValueError):
+            pass  # entrada truncada o corrupta: se vuelve a decodificar
+
+    audio = load_audio(ruta)
+    _anotar(info, time.perf_counter() - t0, False)
+    try:
+        destino = decoded_cache.path(key)
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=destino.parent, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.save(f, audio)
+        except OSError:
+            os.unlink(tmp)
+            raise
+        p = decoded_cache.put_file(key, tmp)
+        return np.load(p, mmap_mode="c")
+    except (OSError, ValueError) as e:
+        # Disco lleno, o la entrada sola supera el límite y ya fue expulsada
+        print(f"⚠️ No se pudo guardar el audio decodificado en caché: {e}", flush=True)
+        return audio
+
+
+def decode_stats() -> dict:
+    """Decodificaciones reales (fallos de caché) y su tiempo acumulado."""
+    with _totales_lock:
+        totales = dict(_totales, decode_s=round(_totales["decode_s"], 3))
+    return dict(decoded_cache.stats(), **totales)
+
+
+def _ffprobe(ruta) -> dict | None:
+    try:
+        r = subprocess.run(
+            ["ffprobe", "-v", "quiet", "-print_format", "json",
+             "-show_format", "-show_streams", str(ruta)],
+            capture_output=True, text=True, timeout=8
+        )
+        datos = json.loads(r.stdout)
+    except Exception:
+        return None
+    formato = datos.get("format") or {}
+    for s in datos.get("streams", []):
+        if s.get("codec_type") == "audio":
+            duracion_s = s.get("duration") or formato.get("duration")
+            if duracion_s is None:
+                return None
+            return {"duration_s": round(float(duracion_s), 3), "codec": s.get("codec_name"),
+                    "sample_rate": int(s.get("sample_rate") or 0) or None,
+                    "channels": s.get("channels"), "format": formato.get("format_name"),
+                    "bit_rate": int(formato.get("bit_rate") or 0) or None}
+    return None
+
+
+def _probe_wav(ruta) -> dict | None:
+    """Sin ffprobe, un WAV se mide leyendo solo su cabecera."""
+    import wave
+    try:
+        with wave.open(str(ruta), "rb") as w:
+            return {"duration_s": round(w.getnframes() / w.getframerate(), 3), "codec": "pcm",
+                    "sample_rate": w.getframerate(), "channels": w.getnchannels(),
+                    "format": "wav", "bit_rate": None}
+    except (wave.Error, EOFError, OSError):
+        return None
+
+
+def _probe_decodificado(audio_hash: str | None) -> dict | None:
+    """Si el audio ya está en la caché de decodificados, su duración sale de la cabecera del .npy."""
+    if not audio_hash:
+        return None
+    p = decoded_cache.path(audio_hash)
+    if not p.exists():
+        return None
+    import numpy as np
+    try:
+        n = len(np.load(p, mmap_mode="r"))
+    except (OSError, ValueError):
+        return None
+    return {"duration_s": round(n / SAMPLE_RATE, 3), "codec": None, "sample_rate": None,
+            "channels": None, "format": None, "bit_rate": None}
+
+
+def probe(ruta, audio_hash: str | None = None) -> dict | None:
+    """
+    Duración y formato del audio, cacheados: por `audio_hash` si se conoce
+    y, si no, por ruta + tamaño + mtime (así no hay que leer el archivo
+    entero para calcular el hash). None si no se puede leer.
+    """
+    st = os.stat(ruta)
+    key = audio_hash or clave("probe", os.path.abspath(ruta), st.st_size, st.st_mtime_ns)
+    hit = probe_cache.get_json(key)
+    if hit is not None:
+        return dict(hit, cached=True)
+    resultado = _ffprobe(ruta) or _probe_wav(ruta) or _probe_decodificado(audio_hash)
+    if resultado is None:
+        return None
+    probe_cache.put_json(key, resultado)
+    return dict(resultado, cached=False)
+
+
+def duracion(ruta) -> float | None:
+    """Duración en segundos (None si no se puede leer)."""
+    try:
+        p = probe(ruta)
+    except OSError:
+        return None
+    return p["duration_s"] if p else None
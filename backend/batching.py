@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+Planificador de lotes entre peticiones.
+
+Cada transcripción en curso parte su audio en ventanas de ≤30 s, calcula
+el mel de cada una en su propio hilo y las entrega aquí. Un único hilo
+(el dispositivo es uno) junta ventanas de todas las peticiones que
+comparten motor, modelo, idioma, prompt y temperatura, y las pasa por
+encoder y decoder juntas:
+  - en cuanto hay `max_batch` ventanas de una misma clave, o
+  - cuando la más antigua lleva `max_wait` segundos esperando.
+Dentro de una clave se reparte por turnos entre peticiones, así una clase
+de dos horas no deja detrás a un audio de un minuto. Cada petición recibe
+sus resultados en el orden de sus ventanas.
+
+Coste y beneficio se miden aquí mismo: la espera añadida de cada ventana
+(latencia extra) y el tiempo de cómputo por ventana según el tamaño del
+lote; con lotes de 1 como referencia se estima la ganancia de throughput.
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, wait
+from typing import Callable, Hashable, Optional
+
+from backend.metrics import BUCKETS_SEGUNDOS, Histogram
+
+BATCH_SIZE = Histogram("transcriptotem_batch_size", "Ventanas por lote", (),
+                       buckets=(1, 2, 3, 4, 6, 8, 12, 16, 24, 32))
+BATCH_WAIT = Histogram("transcriptotem_batch_wait_seconds",
+                       "Espera de cada ventana hasta entrar en un lote (latencia añadida)", (),
+                       buckets=BUCKETS_SEGUNDOS)
+
+
+class _Ventana:
+    __slots__ = ("item", "peticion", "llegada", "espera", "futuro")
+
+    def __init__(self, item, peticion: int):
+        self.item = item
+        self.peticion = peticion
+        self.llegada = time.monotonic()
+        self.espera = 0.0  # desde que llegó hasta que entró en un lote
+        self.futuro: Future = Future()
+
+
+class _Cola:
+    """Ventanas pendientes de una clave, en una deque por petición."""
+
+    def __init__(self, ejecutar: Callable[[list], list]):
+        self.ejecutar = ejecutar
+        self.por_peticion: dict[int, deque] = {}
+        self.total = 0
+
+    def mas_antigua(self) -> float:
+        return min(d[0].llegada for d in self.por_peticion.values())
+
+    def sacar(self, n: int) -> list[_Ventana]:
+        """Hasta `n` ventanas, por turnos entre peticiones."""
+        lote: list[_Ventana] = []
+        while len(lote) < n and self.por_peticion:
+            for pid in list(self.por_peticion):
+                d = self.por_peticion[pid]
+                lote.append(d.popleft())
+                if not d:
+                    del self.por_peticion[pid]
+                if len(lote) == n:
+                    break
+        self.total -= len(lote)
+        return lote
+
+
+class BatchScheduler:
+    def __init__(self, max_batch: int, max_wait: float, keep: int = 2000):
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait)
+        self._colas: dict[Hashable, _Cola] = {}
+        self._cond = threading.Condition()
+        self._hilo: Optional[threading.Thread] = None
+        self._siguiente_id = 0
+        # estadísticas
+        self._lotes = 0
+        self._ventanas = 0
+        self._por_tamano: dict[int, list[float]] = {}  # tamaño -> [lotes, segundos de cómputo]
+        self._esperas: deque = deque(maxlen=keep)
+
+    # ── API ──────────────────────────────────────────────────
+
+    def run(self, clave: Hashable, ejecutar: Callable[[list], list], items: list,
+            check_cancel: Optional[Callable[[], None]] = None) -> tuple[list, float]:
+        """
+        Encola los `items` de una petición y bloquea hasta tener todos los
+        resultados. `ejecutar(lista de items)` debe devolver un resultado
+        por item, en el mismo orden; las peticiones con la misma `clave`
+        deben poder compartir lote. Devuelve (resultados, espera máxima).
+        `check_cancel` se llama cada segundo mientras se espera; si lanza,
+        las ventanas de esta petición que aún no entraron en un lote se
+        retiran de la cola.
+        """
+        if not items:
+            return [], 0.0
+        with self._cond:
+            self._arrancar()
+            pid = self._siguiente_id
+            self._siguiente_id += 1
+            cola = self._colas.get(clave)
+            if cola is None:
+                cola = self._colas[clave] = _Cola(ejecutar)
+            ventanas = [_Ventana(it, pid) for it in items]
+            cola.por_peticion[pid] = deque(ventanas)
+            cola.total += len(ventanas)
+            self._cond.notify_all()
+        try:
+            pendientes = {v.futuro for v in ventanas}
+            while pendientes:
+                _, pendientes = wait(pendientes, timeout=1.0)
+                if pendientes and check_cancel is not None:
+                    check_cancel()
+        except BaseException:
+            self._retirar(clave, pid)
+            raise
+        resultados = [v.futuro.result() for v in ventanas]
+        return resultados, max(v.espera for v in ventanas)
+
+    def _retirar(self, clave: Hashable, pid: int) -> None:
+        """Quita de la cola las ventanas de una petición que ya no las espera."""
+        with self._cond:
+            cola = self._colas.get(clave)
+            if cola is None:
+                return
+            restantes = cola.por_peticion.pop(pid, ())
+            cola.total -= len(restantes)
+            for v in restantes:
+                v.futuro.cancel()
+            if not cola.total:
+                del self._colas[clave]
+
+    def pending(self) -> int:
+        with self._cond:
+            return sum(c.total for c in self._colas.values())
+
+    def stats(self) -> dict:
+        with self._cond:
+            por_tamano = {n: (lotes, seg) for n, (lotes, seg) in self._por_tamano.items()}
+            esperas = sorted(self._esperas)
+            lotes, ventanas = self._lotes, self._ventanas
+        por_ventana = {n: seg / (lotes * n) for n, (lotes, seg) in por_tamano.items() if lotes}
+        total_seg = sum(seg for _, seg in por_tamano.values())
+        ganancia = None
+        if 1 in por_ventana and ventanas and total_seg:
+            # cómputo que habrían costado las mismas ventanas de una en una
+            ganancia = round(por_ventana[1] * ventanas / total_seg, 2)
+
+        def pct(p):
+            return round(esperas[min(len(esperas) - 1, int(p * (len(esperas) - 1)))], 4) if esperas else None
+
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_s": self.max_wait,
+            "pending": self.pending(),
+            "batches": lotes,
+            "windows": ventanas,
+            "mean_batch": round(ventanas / lotes, 2) if lotes else None,
+            "compute_s_per_window": {str(n): round(s, 4) for n, s in sorted(por_ventana.items())},
+            "throughput_gain": ganancia,
+            "added_latency_s": {"p50": pct(0.5), "p95": pct(0.95), "max": esperas[-1] if esperas else None},
+        }
+
+    # ── hilo del dispositivo ─────────────────────────────────
+
+    def _arrancar(self) -> None:
+        if self._hilo is None:
+            self._hilo = threading.Thread(target=self._bucle, name="batch-scheduler", daemon=True)
+            self._hilo.start()
+
+    def _elegir(self) -> tuple[Optional[tuple[_Cola, list[_Ventana]]], Optional[float]]:
+        """
+        Con el lock tomado: ((cola, lote) de la clave lista más antigua, None)
+        o, si ninguna está lista, (None, cuánto esperar; None = sin límite).
+        """
+        ahora = time.monotonic()
+        lista, espera = None, None
+        for clave, cola in self._colas.items():
+            if not cola.total:
+                continue
+            antigua = cola.mas_antigua()
+            if cola.total >= self.max_batch or ahora - antigua >= self.max_wait:
+                if lista is None or antigua < lista[1]:
+                    lista = (clave, antigua)
+            else:
+                resto = antigua + self.max_wait - ahora
+                espera = resto if espera is None else min(espera, resto)
+        if lista is None:
+            return None, espera
+        cola = self._colas[lista[0]]
+        lote = cola.sacar(self.max_batch)
+        if not cola.total:
+            del self._colas[lista[0]]
+        return (cola, lote), None
+
+    def _bucle(self) -> None:
+        while True:
+            with self._cond:
+                elegido, espera = self._elegir()
+                while elegido is None:
+                    self._cond.wait(espera)
+                    elegido, espera = self._elegir()
+            cola, lote = elegido
+            inicio = time.monotonic()
+            for v in lote:
+                v.espera = inicio - v.llegada
+                BATCH_WAIT.observe(v.espera)
+            BATCH_SIZE.observe(len(lote))
+            try:
+                resultados = cola.ejecutar([v.item for v in lote])
+                if len(resultados) != len(lote):
+                    raise RuntimeError(f"el lote devolvió {len(resultados)} resultados para {len(lote)} ventanas")
+            except Exception as e:
+                for v in lote:
+                    v.futuro.set_exception(e)
+                continue
+            computo = time.monotonic() - inicio
+            with self._cond:
+                self._lotes += 1
+                self._ventanas += len(lote)
+                acumulado = self._por_tamano.setdefault(len(lote), [0, 0.0])
+                acumulado[0] += 1
+                acumulado[1] += computo
+                self._esperas.extend(v.espera for v in lote)
+            for v, r in zip(lote, resultados):
+                v.futuro.set_result(r)
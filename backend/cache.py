@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+Caché en disco direccionada por contenido.
+
+Las claves son hashes SHA-256 (del audio y de los parámetros que influyen
+en el resultado), así que el mismo archivo subido dos veces, o repetido en
+Pendientes, reutiliza la transcripción sin volver a pasar por Whisper.
+El tamaño total está acotado y se expulsa lo menos usado (LRU por mtime).
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Optional
+
+
+def sha256_archivo(ruta, bloque: int = 1024 * 1024) -> str:
+    h = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for trozo in iter(lambda: f.read(bloque), b""):
+            h.update(trozo)
+    return h.hexdigest()
+
+
+def clave(*partes) -> str:
+    """Hash estable de una lista de partes serializables en JSON."""
+    return hashlib.sha256(json.dumps(partes, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class DiskCache:
+    """
+    Un archivo por entrada en `directorio/ab/abcdef…<sufijo>`.
+    Cada acierto actualiza el mtime; al superar `max_bytes` se borran
+    las entradas con mtime más antiguo.
+    """
+
+    def __init__(self, directorio: Path, max_bytes: int, sufijo: str = ""):
+        self.dir = Path(directorio)
+        self.max_bytes = max_bytes
+        self.sufijo = sufijo
+        self.hits = 0
+        self.misses = 0
+        self._bytes: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def path(self, key: str) -> Path:
+        return self.dir / key[:2] / f"{key}{self.sufijo}"
+
+    # ── lectura ──────────────────────────────────────────────
+
+    def get_path(self, key: str) -> Optional[Path]:
+        p = self.path(key)
+        try:
+            os.utime(p)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return p
+
+    def get_bytes(self, key: str) -> Optional[bytes]:
+        p = self.get_path(key)
+        if p is None:
+            return None
+        try:
+            return p.read_bytes()
+        except OSError:
+            return None
+
+    def get_json(self, key: str):
+        data = self.get_bytes(key)
+        if data is None:
+            return None
+        try:
+            return json.loads(data)
+        except ValueError:
+            return None
+
+    # ── escritura ────────────────────────────────────────────
+
+    def put_bytes(self, key: str, data: bytes) -> Path:
+        destino = self.path(key)
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=destino.parent, suffix=".part")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        return self._instalar(tmp, destino)
+
+    def put_json(self, key: str, obj) -> Path:
+        return self.put_bytes(key, json.dumps(obj, ensure_ascii=False).encode("utf-8"))
+
+    def put_file(self, key: str, origen) -> Path:
+        """Mueve `origen` (ya escrito en el mismo disco) a la caché."""
+        destino = self.path(key)
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        return self._instalar(str(origen), destino)
+
+    def _instalar(self, tmp: str, destino: Path) -> Path:
+        previo = destino.stat().st_size if destino.exists() else 0
+        os.replace(tmp, destino)
+        with self._lock:
+            if self._bytes is not None:
+                self._bytes += destino.stat().st_size - previo
+        self._expulsar()
+        return destino
+
+    # ── LRU ──────────────────────────────────────────────────
+
+    def _entradas(self) -> list[tuple[float, int, Path]]:
+        entradas = []
+        if not self.dir.exists():
+            return entradas
+        for sub in self.dir.iterdir():
+            if not sub.is_dir():
+                continue
+            for p in sub.iterdir():
+                if p.name.endswith(".part"):
+                    continue
+                try:
+                    st = p.stat()
+                except OSError:
+                    continue
+                entradas.append((st.st_mtime, st.st_size, p))
+        return entradas
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            if self._bytes is None:
+                self._bytes = sum(s for _, s, _ in self._entradas())
+            return self._bytes
+
+    def _expulsar(self) -> None:
+        if self.total_bytes() <= self.max_bytes:
+            return
+        with self._lock:
+            # Se recalcula desde disco: otros procesos pueden compartir la carpeta
+            entradas = sorted(self._entradas())
+            total = sum(s for _, s, _ in entradas)
+            for _, size, p in entradas:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    p.unlink()
+                    total -= size
+                except OSError:
+                    pass
+            self._bytes = total
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else None,
+            "bytes": self.total_bytes(),
+            "max_bytes": self.max_bytes,
+        }
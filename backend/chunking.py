@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+Modo audio largo: transcripción por trozos en paralelo (motor openai-whisper en CPU).
+
+Una clase de 2 horas decodificada de forma secuencial usa 4 threads mientras
+el resto de cores mira. Aquí el audio se corta en trozos de ~CHUNK_SECONDS,
+buscando el punto de menor energía cerca de cada corte para no partir
+palabras, con un solape de CHUNK_OVERLAP segundos entre trozos vecinos.
+Cada trozo va a un proceso del pool (cada uno con su propio modelo y su
+número fijo de threads) y al final se cosen los segmentos:
+  - en el solape se queda cada trozo con los segmentos de su mitad;
+  - si aun así el final de uno repite el principio del siguiente, se
+    eliminan las palabras duplicadas.
+"""
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait
+from multiprocessing import get_context
+from typing import Callable, Optional
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+_pool = None
+_pool_conf = None
+_pool_lock = threading.Lock()
+
+
+# ══════════════════════════════════════════════════════════════════
+# PLANIFICACIÓN DE CORTES
+# ══════════════════════════════════════════════════════════════════
+
+def plan_chunks(audio: np.ndarray, chunk_s: float, overlap_s: float,
+                search_s: float = 10.0, sr: int = SAMPLE_RATE) -> list[tuple[int, int]]:
+    """
+    Devuelve pares (inicio, fin) en muestras. Cada corte se desplaza al
+    tramo de 100 ms más silencioso dentro de ±search_s del corte ideal;
+    los trozos a partir del segundo empiezan `overlap_s` antes del corte.
+    """
+    n = len(audio)
+    paso = int(chunk_s * sr)
+    if n <= paso * 1.2:
+        return [(0, n)]
+
+    ventana = sr // 10
+    m = n // ventana
+    energia = np.mean(audio[: m * ventana].reshape(m, ventana) ** 2, axis=1)
+
+    cortes = [0]
+    while cortes[-1] + paso * 1.2 < n:
+        ideal = cortes[-1] + paso
+        a = max((ideal - int(search_s * sr)) // ventana, cortes[-1] // ventana + 1)
+        b = min((ideal + int(search_s * sr)) // ventana, m - 1)
+        if b <= a:
+            cortes.append(ideal)
+            continue
+        mejor = a + int(np.argmin(energia[a:b]))
+        cortes.append(mejor * ventana + ventana // 2)
+    cortes.append(n)
+
+    solape = int(overlap_s * sr)
+    return [(max(0, ini - solape) if i else 0, fin)
+            for i, (ini, fin) in enumerate(zip(cortes[:-1], cortes[1:]))]
+
+
+# ══════════════════════════════════════════════════════════════════
+# COSIDO
+# ══════════════════════════════════════════════════════════════════
+
+def _palabras(texto: str) -> list[str]:
+    return texto.split()
+
+
+def _norm(palabra: str) -> str:
+    return "".join(c for c in palabra.lower() if c.isalnum())
+
+
+def _solape_palabras(previo: list[str], siguiente: list[str], max_n: int = 30) -> int:
+    """Longitud del sufijo más largo de `previo` que es prefijo de `siguiente`."""
+    a = [_norm(p) for p in previo[-max_n:]]
+    b = [_norm(p) for p in siguiente[:max_n]]
+    for k in range(min(len(a), len(b)), 1, -1):
+        if a[-k:] == b[:k]:
+            return k
+    return 0
+
+
+def stitch(resultados: list[list[dict]], chunks: list[tuple[int, int]],
+           overlap_s: float, sr: int = SAMPLE_RATE) -> list[dict]:
+    """
+    `resultados[i]` son los segmentos del trozo i con tiempos relativos al
+    trozo. Devuelve la lista única de segmentos en tiempos absolutos.
+    """
+    salida: list[dict] = []
+    for i, (segs, (ini, _)) in enumerate(zip(resultados, chunks)):
+        desplaz = ini / sr
+        # Frontera entre este trozo y el anterior: mitad del solape
+        desde = desplaz + overlap_s / 2 if i else float("-inf")
+        hasta = float("inf")
+        if i + 1 < len(chunks):
+            hasta = chunks[i + 1][0] / sr + overlap_s / 2
+
+        propios = []
+        for seg in segs:
+            seg = dict(seg)
+            seg["start"] = round(seg.get("start", 0.0) + desplaz, 3)
+            seg["end"] = round(seg.get("end", 0.0) + desplaz, 3)
+            centro = (seg["start"] + seg["end"]) / 2
+            if desde <= centro < hasta:
+                propios.append(seg)
+
+        if salida and propios:
+            previas = _palabras(" ".join(s["text"] for s in salida[-3:]))
+            primeras = _palabras(propios[0]["text"])
+            k = _solape_palabras(previas, primeras)
+            if k:
+                resto = primeras[k:]
+                if resto:
+                    propios[0]["text"] = " " + " ".join(resto)
+                else:
+                    propios.pop(0)
+        salida.extend(propios)
+    return salida
+
+
+# ══════════════════════════════════════════════════════════════════
+# POOL DE PROCESOS
+# ══════════════════════════════════════════════════════════════════
+
+def _init_worker(threads: int) -> None:
+    """Fija los threads de cada proceso antes de que torch los lea."""
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+
+def _worker_transcribe(model_name: str, audio: np.ndarray, kwargs: dict) -> list[dict]:
+    from backend.transcriber import _get_whisper_model, _segmentos
+    model = _get_whisper_model(model_name)
+    return _segmentos(model.transcribe(audio, **kwargs))
+
+
+def _get_pool(workers: int, threads: int) -> ProcessPoolExecutor:
+    global _pool, _pool_conf
+    with _pool_lock:
+        if _pool is None or _pool_conf != (workers, threads):
+            if _pool is not None:
+                _pool.shutdown(wait=False, cancel_futures=True)
+            # spawn: torch no se lleva bien con fork después de haber creado threads
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn"),
+                                        initializer=_init_worker, initargs=(threads,))
+            _pool_conf = (workers, threads)
+        return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool, _pool_conf
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = _pool_conf = None
+
+
+def transcribe_parallel(audio: np.ndarray, model_name: str, kwargs: dict,
+                        workers: int, threads: int, chunk_s: float,
+                        overlap_s: float,
+                        check_cancel: Optional[Callable[[], None]] = None) -> tuple[str, list[dict], int]:
+    """
+    Devuelve (texto, segmentos en tiempos de `audio`, nº de trozos).
+    `check_cancel` se llama cada segundo mientras quedan trozos; si lanza,
+    los que no empezaron se cancelan (los que ya corren terminan solos).
+    """
+    chunks = plan_chunks(audio, chunk_s, overlap_s)
+    pool = _get_pool(workers, threads)
+    # np.asarray: los trozos de un memmap se envían como arrays normales
+    futuros = [pool.submit(_worker_transcribe, model_name, np.asarray(audio[a:b]), kwargs)
+               for a, b in chunks]
+    try:
+        pendientes = set(futuros)
+        while pendientes:
+            _, pendientes = wait(pendientes, timeout=1.0)
+            if pendientes and check_cancel is not None:
+                check_cancel()
+    except BaseException:
+        for f in futuros:
+            f.cancel()
+        raise
+    resultados = [f.result() for f in futuros]
+    segmentos = stitch(resultados, chunks, overlap_s)
+    texto = "".join(s.get("text", "") for s in segmentos).strip()
+    return texto, segmentos, len(chunks)
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+Configuración del servidor leída desde variables de entorno.
+Todo lo que debe sobrevivir a un reinicio (cola de trabajos, cachés)
+vive bajo DATA_DIR, que por defecto es `.transcriptotem/` junto al repo.
+"""
+import os
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+DATA_DIR = Path(os.environ.get("TRANSCRIPTOTEM_DATA_DIR", str(BASE_DIR / ".transcriptotem")))
+
+
+def env_int(nombre: str, defecto: int) -> int:
+    try:
+        return int(os.environ.get(nombre, defecto))
+    except (TypeError, ValueError):
+        return defecto
+
+
+def env_float(nombre: str, defecto: float) -> float:
+    try:
+        return float(os.environ.get(nombre, defecto))
+    except (TypeError, ValueError):
+        return defecto
+
+
+def env_bool(nombre: str, defecto: bool) -> bool:
+    valor = os.environ.get(nombre)
+    if valor is None:
+        return defecto
+    return valor.strip().lower() in {"1", "true", "yes", "si", "sí", "on"}
+
+
+# ── Servidor ───────────────────────────────────────────────────
+# Threads de cómputo por proceso; `main.py --prod` lo fija en cores / workers
+THREADS = env_int("TRANSCRIPTOTEM_THREADS", os.cpu_count() or 4)
+
+# ── Cola de trabajos (/api/jobs) ───────────────────────────────
+JOBS_DIR        = DATA_DIR / "jobs"
+JOBS_MAX_QUEUED = env_int("TRANSCRIPTOTEM_JOBS_MAX_QUEUED", 32)
+JOBS_WORKERS    = env_int("TRANSCRIPTOTEM_JOBS_WORKERS", 1)
+# Trabajos terminados que se conservan en el journal para poder consultarlos
+JOBS_KEEP_DONE  = env_int("TRANSCRIPTOTEM_JOBS_KEEP_DONE", 200)
+
+# ── Caché de transcripciones (hash del audio + modelo + prompt) ─
+TRANSCRIPT_CACHE_DIR    = DATA_DIR / "cache" / "transcripts"
+TRANSCRIPT_CACHE_MAX_MB = env_int("TRANSCRIPTOTEM_TRANSCRIPT_CACHE_MAX_MB", 256)
+
+# ── Subidas por trozos (/api/uploads) ──────────────────────────
+# Almacén de audios subidos, direccionado por SHA-256 y acotado por LRU
+UPLOADS_DIR           = DATA_DIR / "uploads"
+UPLOADS_MAX_MB        = env_int("TRANSCRIPTOTEM_UPLOADS_MAX_MB", 8192)
+UPLOAD_CHUNK_MB       = env_int("TRANSCRIPTOTEM_UPLOAD_CHUNK_MB", 8)
+UPLOAD_MAX_FILE_MB    = env_int("TRANSCRIPTOTEM_UPLOAD_MAX_FILE_MB", 4096)
+# Sesiones sin actividad durante más de esto se descartan
+UPLOAD_PARTIAL_HOURS  = env_float("TRANSCRIPTOTEM_UPLOAD_PARTIAL_HOURS", 24.0)
+
+# ── Caché de audio decodificado (PCM float32 16 kHz en .npy) ───
+# Una hora de audio ocupa ~230 MB; se abre con mmap, sin copiarlo a RAM
+DECODE_CACHE        = env_bool("TRANSCRIPTOTEM_DECODE_CACHE", True)
+DECODE_CACHE_DIR    = DATA_DIR / "cache" / "decoded"
+DECODE_CACHE_MAX_MB = env_int("TRANSCRIPTOTEM_DECODE_CACHE_MAX_MB", 2048)
+
+# ── Sondeo de duración y ETA ───────────────────────────────────
+PROBE_CACHE_DIR = DATA_DIR / "cache" / "probe"
+# RTF aprendido por motor, modelo y hardware (compartido por los workers)
+ETA_FILE        = DATA_DIR / "eta.json"
+# Peso de cada trabajo nuevo en la media móvil del RTF
+ETA_ALPHA       = env_float("TRANSCRIPTOTEM_ETA_ALPHA", 0.2)
+
+# ── Motor de inferencia ────────────────────────────────────────
+# auto | mlx | faster-whisper | whisper (se puede cambiar por petición con `engine`)
+ENGINE           = os.environ.get("TRANSCRIPTOTEM_ENGINE", "auto")
+# faster-whisper / CTranslate2: int8, int8_float32, float32…
+CT2_COMPUTE_TYPE = os.environ.get("TRANSCRIPTOTEM_CT2_COMPUTE_TYPE", "int8")
+CT2_THREADS      = env_int("TRANSCRIPTOTEM_CT2_THREADS", THREADS)
+# 1 = búsqueda voraz, como openai-whisper con temperature=0
+CT2_BEAM_SIZE    = env_int("TRANSCRIPTOTEM_CT2_BEAM_SIZE", 1)
+
+# ── Lotes entre peticiones (openai-whisper y faster-whisper) ───
+# Ventanas de ≤30 s de todas las peticiones en curso pasan juntas por el
+# modelo. 1 = desactivado. La espera máxima acota la latencia añadida.
+BATCH_SIZE        = env_int("TRANSCRIPTOTEM_BATCH_SIZE", 1)
+BATCH_MAX_WAIT_MS = env_float("TRANSCRIPTOTEM_BATCH_MAX_WAIT_MS", 50.0)
+
+# ── Registro de modelos residentes ─────────────────────────────
+# Carpeta de descarga de pesos compartida por todos los workers (vacío = la
+# de cada librería, ~/.cache, que ya es común a los procesos del mismo usuario)
+MODEL_CACHE_DIR = os.environ.get("TRANSCRIPTOTEM_MODEL_CACHE_DIR", "")
+MODEL_BUDGET_MB = env_int("TRANSCRIPTOTEM_MODEL_BUDGET_MB", 6144)
+# Lista separada por comas, p. ej. "mlx-community/whisper-large-v3-turbo,small"
+PRELOAD_MODELS  = [m.strip() for m in os.environ.get("TRANSCRIPTOTEM_PRELOAD_MODELS", "").split(",") if m.strip()]
+MODEL_WARMUP    = env_bool("TRANSCRIPTOTEM_MODEL_WARMUP", True)
+
+# ── VAD previo a la inferencia ─────────────────────────────────
+VAD_ENABLED        = env_bool("TRANSCRIPTOTEM_VAD", True)
+# Si el VAD omitiría menos que esto, se envía el audio completo
+VAD_MIN_SKIP_RATIO = env_float("TRANSCRIPTOTEM_VAD_MIN_SKIP", 0.02)
+
+# ── Segunda pasada sobre segmentos dudosos ─────────────────────
+# Re-decodifica solo las ventanas con logprob bajo, texto repetitivo o que
+# parece inventado sobre silencio (ver redecode.py)
+REDECODE             = env_bool("TRANSCRIPTOTEM_REDECODE", True)
+REDECODE_LOGPROB     = env_float("TRANSCRIPTOTEM_REDECODE_LOGPROB", -1.0)
+REDECODE_COMPRESSION = env_float("TRANSCRIPTOTEM_REDECODE_COMPRESSION", 2.4)
+REDECODE_NO_SPEECH   = env_float("TRANSCRIPTOTEM_REDECODE_NO_SPEECH", 0.6)
+REDECODE_TEMPERATURES = tuple(float(t) for t in os.environ.get(
+    "TRANSCRIPTOTEM_REDECODE_TEMPERATURES", "0.2,0.4,0.6,0.8").split(",") if t.strip())
+# Modelo mayor para la segunda pasada (vacío = el mismo, solo con temperatura)
+REDECODE_MODEL       = os.environ.get("TRANSCRIPTOTEM_REDECODE_MODEL", "")
+# Tope de audio re-decodificado, como fracción del total (lo peor primero)
+REDECODE_MAX_RATIO   = env_float("TRANSCRIPTOTEM_REDECODE_MAX_RATIO", 0.3)
+
+# ── Modo audio largo: trozos en paralelo (motor openai-whisper) ─
+# 0/1 = desactivado. Cada proceso carga su propia copia del modelo.
+CHUNK_WORKERS     = env_int("TRANSCRIPTOTEM_CHUNK_WORKERS", 0)
+CHUNK_THREADS     = env_int("TRANSCRIPTOTEM_CHUNK_THREADS",
+                            max(1, THREADS // max(1, CHUNK_WORKERS)))
+CHUNK_SECONDS     = env_float("TRANSCRIPTOTEM_CHUNK_SECONDS", 300.0)
+CHUNK_OVERLAP     = env_float("TRANSCRIPTOTEM_CHUNK_OVERLAP", 4.0)
+# Audios más cortos que esto se transcriben de una vez
+CHUNK_MIN_SECONDS = env_float("TRANSCRIPTOTEM_CHUNK_MIN_SECONDS", 600.0)
+
+# ── Vigilancia de Pendientes ───────────────────────────────────
+WATCH_STABLE_SECONDS = env_float("TRANSCRIPTOTEM_WATCH_STABLE_SECONDS", 1.0)
+WATCH_POLL_SECONDS   = env_float("TRANSCRIPTOTEM_WATCH_POLL_SECONDS", 1.0)
+# Modo continuo: transcribir cada audio nuevo sin esperar a que se pulse el botón
+WATCH_AUTO           = env_bool("TRANSCRIPTOTEM_WATCH_AUTO", False)
+WATCH_LANGUAGE       = os.environ.get("TRANSCRIPTOTEM_WATCH_LANGUAGE", "es-chile")
+WATCH_MODEL          = os.environ.get("TRANSCRIPTOTEM_WATCH_MODEL", "mlx-community/whisper-large-v3-turbo")
+
+# ── Pipeline de la carpeta ─────────────────────────────────────
+FOLDER_MANIFEST   = DATA_DIR / "folder_manifest.json"
+# Decodificar el siguiente audio mientras se transcribe el actual
+PIPELINE_PREFETCH = env_bool("TRANSCRIPTOTEM_PIPELINE_PREFETCH", True)
+# sjf = el audio más corto primero (ponderado por prioridades.json) | name = alfabético
+FOLDER_ORDER       = os.environ.get("TRANSCRIPTOTEM_FOLDER_ORDER", "sjf").strip().lower()
+# Audios transcritos a la vez, acotados por memoria y por threads (ver scheduler.py): sin
+# lotes (BATCH_SIZE=1) ni FOLDER_JOB_THREADS cada audio ocupa todos los threads y va uno a la vez
+FOLDER_MAX_JOBS    = env_int("TRANSCRIPTOTEM_FOLDER_MAX_JOBS", 4)
+FOLDER_MEMORY_MB   = env_int("TRANSCRIPTOTEM_FOLDER_MEMORY_MB", 2048)
+# Threads por audio en curso (0 = auto: 1 con lotes entre peticiones, todos sin ellos)
+FOLDER_JOB_THREADS = env_int("TRANSCRIPTOTEM_FOLDER_JOB_THREADS", 0)
+
+# ── Streaming de segmentos ─────────────────────────────────────
+# Ventana de audio por inferencia (≤ 30 s = una sola ventana de Whisper)
+STREAM_WINDOW_SECONDS = env_float("TRANSCRIPTOTEM_STREAM_WINDOW_SECONDS", 25.0)
+
+# ── Transcripción en vivo (WebSocket /api/live) ────────────────
+# Se vuelve a transcribir la ventana abierta cada tanto audio nuevo
+LIVE_STEP_SECONDS         = env_float("TRANSCRIPTOTEM_LIVE_STEP_SECONDS", 1.0)
+# Un segmento que termina al menos esto antes del borde de la ventana es final
+LIVE_FINAL_MARGIN_SECONDS = env_float("TRANSCRIPTOTEM_LIVE_FINAL_MARGIN_SECONDS", 2.0)
+# Ventana máxima: al llenarse se confirma lo que haya (acota la latencia)
+LIVE_WINDOW_SECONDS       = env_float("TRANSCRIPTOTEM_LIVE_WINDOW_SECONDS", 20.0)
+# Atraso (audio recibido aún sin transcribir) desde el que se avisa que no se da abasto
+LIVE_MAX_BACKLOG_SECONDS  = env_float("TRANSCRIPTOTEM_LIVE_MAX_BACKLOG_SECONDS", 10.0)
+LIVE_MAX_STREAMS          = env_int("TRANSCRIPTOTEM_LIVE_MAX_STREAMS", 4)
+
+# ── Búsqueda en Transcritas (SQLite FTS5, ver search.py) ───────
+SEARCH_DB              = DATA_DIR / "search.db"
+# Segundos de audio por pasaje indexado (cada resultado lleva su inicio y fin)
+SEARCH_PASSAGE_SECONDS = env_float("TRANSCRIPTOTEM_SEARCH_PASSAGE_SECONDS", 15.0)
+# Cada cuánto, como mucho, una búsqueda revisa la carpeta por .txt nuevos o editados
+SEARCH_SYNC_SECONDS    = env_float("TRANSCRIPTOTEM_SEARCH_SYNC_SECONDS", 30.0)
+# Pasajes ordenados por BM25 como mucho; si un término aparece en más, solo los más recientes
+SEARCH_RANK_LIMIT      = env_int("TRANSCRIPTOTEM_SEARCH_RANK_LIMIT", 10000)
+
+# ── Exportación PDF/DOCX/ZIP (ver export.py) ───────────────────
+# Documentos ya renderizados, por hash de formato + título + texto (LRU)
+EXPORT_CACHE_DIR    = DATA_DIR / "cache" / "exports"
+EXPORT_CACHE_MAX_MB = env_int("TRANSCRIPTOTEM_EXPORT_CACHE_MAX_MB", 512)
+# Procesos que renderizan con ReportLab/python-docx, fuera del hilo de la petición
+EXPORT_WORKERS      = env_int("TRANSCRIPTOTEM_EXPORT_WORKERS", 2)
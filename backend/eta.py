@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Estimación de tiempos (ETA) aprendida de los trabajos terminados.
+
+El navegador estimaba "duración / 6" tras decodificar el archivo entero
+con AudioContext. Aquí la duración sale de ffprobe (cacheada, ver
+audio.probe) y el ritmo de cada motor se mide de verdad: por cada
+transcripción no cacheada se anota su RTF (segundos de proceso por
+segundo de audio, sin contar la carga del modelo) bajo la clave
+motor + modelo + hardware, con una media móvil exponencial
+(TRANSCRIPTOTEM_ETA_ALPHA). La carga del modelo se aprende aparte y solo
+se suma si el modelo no está residente. Hasta la primera muestra se usa
+un RTF de partida por motor.
+
+Lo aprendido se guarda en DATA_DIR/eta.json: sobrevive a reinicios y lo
+comparten los workers del modo servidor (leer, mezclar y escribir bajo
+un lock de archivo).
+"""
+import json
+import os
+import platform
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from backend import config
+from backend.workers import file_lock
+
+# RTF de partida mientras no hay muestras (órdenes de magnitud, no promesas)
+RTF_INICIAL = {"mlx": 0.1, "faster-whisper": 0.3, "whisper": 0.8}
+CARGA_INICIAL_S = 10.0
+# Clips más cortos que esto los dominan los costes fijos: no enseñan el RTF
+MIN_AUDIO_S = 5.0
+
+
+def hardware_id() -> str:
+    return f"{platform.system()}-{platform.machine()}-{os.cpu_count()}c-{config.THREADS}t"
+
+
+class EtaEstimator:
+    def __init__(self, ruta: Path, alfa: float = 0.2):
+        self.ruta = Path(ruta)
+        self.alfa = min(1.0, max(0.01, alfa))
+        self._lock = threading.Lock()
+        self._datos: dict = {}
+        self._mtime: Optional[int] = None
+
+    def _clave(self, engine: str, model: str) -> str:
+        return f"{engine}|{model}|{hardware_id()}"
+
+    def _leer(self) -> dict:
+        """Con self._lock tomado: relee el archivo solo si otro proceso lo cambió."""
+        try:
+            mtime = self.ruta.stat().st_mtime_ns
+        except FileNotFoundError:
+            return self._datos
+        if mtime != self._mtime:
+            try:
+                self._datos = json.loads(self.ruta.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                self._datos = {}
+            self._mtime = mtime
+        return self._datos
+
+    def _escribir(self, datos: dict) -> None:
+        self.ruta.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.ruta.parent, suffix=".part")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(datos, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, self.ruta)
+        self._mtime = self.ruta.stat().st_mtime_ns
+
+    def _media(self, previo: Optional[float], valor: float) -> float:
+        return valor if previo is None else (1 - self.alfa) * previo + self.alfa * valor
+
+    def observe(self, engine: str, model: str, audio_s: float, proceso_s: float,
+                carga_s: float = 0.0) -> None:
+        """Anota un trabajo terminado: `proceso_s` sin la carga del modelo."""
+        if audio_s < MIN_AUDIO_S or proceso_s <= 0:
+            return
+        key = self._clave(engine, model)
+        with self._lock, file_lock("eta"):
+            datos = self._leer()  # otros workers también aprenden
+            entrada = datos.setdefault(key, {"n": 0})
+            entrada["rtf"] = round(self._media(entrada.get("rtf"), proceso_s / audio_s), 5)
+            entrada["n"] += 1
+            if carga_s > 0.5:  # por debajo el modelo ya estaba residente
+                entrada["load_s"] = round(self._media(entrada.get("load_s"), carga_s), 2)
+            entrada["updated_at"] = time.time()
+            try:
+                self._escribir(datos)
+            except OSError as e:
+                print(f"⚠️ No se pudo guardar {self.ruta.name}: {e}", flush=True)
+
+    def estimate(self, engine: str, model: str, duration_s: float, resident: bool = True) -> dict:
+        """{eta_s, rtf, source: "learned"|"prior", samples} para un audio de `duration_s`."""
+        with self._lock:
+            entrada = self._leer().get(self._clave(engine, model))
+        if entrada and entrada.get("rtf") is not None:
+            rtf, fuente, n = entrada["rtf"], "learned", entrada["n"]
+        else:
+            rtf, fuente, n = RTF_INICIAL.get(engine, 0.5), "prior", 0
+        eta = duration_s * rtf
+        if not resident:
+            eta += (entrada or {}).get("load_s", CARGA_INICIAL_S)
+        return {"eta_s": round(eta, 1), "rtf": round(rtf, 4), "source": fuente, "samples": n}
+
+    def stats(self) -> dict:
+        """Lo aprendido en este hardware, por motor|modelo."""
+        sufijo = "|" + hardware_id()
+        with self._lock:
+            datos = dict(self._leer())
+        return {"hardware": hardware_id(),
+                "models": {k[:-len(sufijo)]: v for k, v in datos.items() if k.endswith(sufijo)}}
@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+"""
+Exportación a PDF, DOCX y ZIP en el servidor.
+
+Antes el navegador volvía a enviar el texto completo de cada transcripción
+(y todo el `historial` para un ZIP), y el documento se armaba entero en un
+BytesIO con ReportLab/python-docx en el hilo de la petición. Aquí:
+  - se exporta por `transcript_id` del índice de búsqueda: el texto sale
+    del .txt de Transcritas o del propio índice;
+  - PDF y DOCX se renderizan en un pool de procesos (spawn, como en
+    chunking.py) y se guardan en una DiskCache cuya clave es el hash del
+    formato, el título y el texto: repetir una exportación es enviar un
+    archivo, y dos peticiones iguales a la vez comparten un solo render;
+  - el ZIP se escribe entrada a entrada directamente en la respuesta
+    (leyendo cada .txt por bloques), con memoria constante por muchas
+    transcripciones que lleve. Como el 200 ya salió, una entrada que falla
+    (render roto, .txt borrado) se sustituye por NOMBRE.error.txt con el
+    motivo y el ZIP se cierra igual: nunca llega truncado.
+"""
+import importlib.util
+import os
+import tempfile
+import threading
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Union
+from xml.sax.saxutils import escape
+
+from backend import metrics
+from backend.cache import DiskCache, clave
+
+# Subir al cambiar el aspecto de los documentos: invalida lo ya renderizado
+VERSION_RENDER = 1
+BLOQUE = 256 * 1024
+
+MIME = {
+    "pdf": "application/pdf",
+    "docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "txt": "text/plain; charset=utf-8",
+    "zip": "application/zip",
+}
+# formato -> (módulo que se importa, paquete que se instala)
+DEPENDENCIA = {"pdf": ("reportlab", "reportlab"), "docx": ("docx", "python-docx")}
+
+RENDER_SECONDS = metrics.Histogram("transcriptotem_export_render_seconds",
+                                   "Renderizado de PDF/DOCX en el pool de procesos", ("format",))
+
+
+# ══════════════════════════════════════════════════════════════════
+# RENDER (se ejecuta en los procesos del pool)
+# ══════════════════════════════════════════════════════════════════
+
+def disponible(formato: str) -> bool:
+    """Se comprueba antes de responder: dentro del pool, o a mitad de un ZIP, ya es tarde."""
+    return importlib.util.find_spec(DEPENDENCIA[formato][0]) is not None
+
+
+def _parrafos(texto: str) -> list[str]:
+    return [p.strip().replace("\n", " ") for p in texto.split("\n\n") if p.strip()]
+
+
+def _render_pdf(titulo: str, texto: str, destino: str) -> None:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.units import cm
+    from reportlab.lib.enums import TA_JUSTIFY
+    from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer
+
+    doc = SimpleDocTemplate(destino, pagesize=A4,
+                            leftMargin=2.5*cm, rightMargin=2.5*cm,
+                            topMargin=2.5*cm, bottomMargin=2.5*cm)
+    styles   = getSampleStyleSheet()
+    t_style  = ParagraphStyle("t", parent=styles["Heading1"], fontSize=16, spaceAfter=12)
+    b_style  = ParagraphStyle("b", parent=styles["Normal"],
+                              fontSize=11, leading=16, alignment=TA_JUSTIFY, spaceAfter=8)
+    # Paragraph interpreta marcado: un "<" o "&" de la clase no debe romper el PDF
+    story = [Paragraph(escape(titulo), t_style), Spacer(1, 0.5*cm)]
+    story += [Paragraph(escape(p), b_style) for p in _parrafos(texto)]
+    doc.build(story)
+
+
+def _render_docx(titulo: str, texto: str, destino: str) -> None:
+    from docx import Document
+    from docx.shared import Pt, Cm
+    from docx.enum.text import WD_ALIGN_PARAGRAPH
+
+    doc = Document()
+    for s in doc.sections:
+        s.top_margin = s.bottom_margin = s.left_margin = s.right_margin = Cm(2.5)
+    h = doc.add_heading(titulo, level=1); h.alignment = WD_ALIGN_PARAGRAPH.LEFT
+    for p in _parrafos(texto):
+        par = doc.add_paragraph(p)
+        par.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
+        for run in par.runs: run.font.size = Pt(11)
+    doc.save(destino)
+
+
+def _renderizar(formato: str, titulo: str, texto: str, destino: str) -> float:
+    """Escribe el documento en `destino` (un .part junto a la caché) y devuelve los segundos."""
+    t0 = time.perf_counter()
+    (_render_pdf if formato == "pdf" else _render_docx)(titulo, texto, destino)
+    return time.perf_counter() - t0
+
+
+# ══════════════════════════════════════════════════════════════════
+# DOCUMENTOS EN CACHÉ
+# ══════════════════════════════════════════════════════════════════
+
+class Exporter:
+    """PDF/DOCX renderizados en un pool de procesos y guardados por hash del contenido."""
+
+    def __init__(self, cache: DiskCache, workers: int):
+        self.cache = cache
+        self.workers = max(1, workers)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._en_curso: dict[str, Future] = {}
+
+    @staticmethod
+    def key(formato: str, titulo: str, texto: str) -> str:
+        return clave("export", VERSION_RENDER, formato, titulo, texto)
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: el servidor ya tiene threads (torch, uvicorn) y fork no es seguro
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=get_context("spawn"))
+        return self._pool
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def submit(self, formato: str, titulo: str, texto: str) -> Future:
+        """Future con la ruta del documento en caché; solo se renderiza si no estaba."""
+        key = self.key(formato, titulo, texto)
+        ruta = self.cache.get_path(key)
+        if ruta is not None:
+            hecho: Future = Future()
+            hecho.set_result(ruta)
+            return hecho
+        with self._lock:
+            futuro = self._en_curso.get(key)
+            if futuro is not None:
+                return futuro
+            destino = self.cache.path(key)
+            destino.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=destino.parent, suffix=".part")
+            os.close(fd)
+            futuro = self._en_curso[key] = Future()
+            try:
+                render = self._get_pool().submit(_renderizar, formato, titulo, texto, tmp)
+            except BaseException:
+                del self._en_curso[key]
+                os.unlink(tmp)
+                raise
+
+        def terminar(render: Future) -> None:
+            try:
+                RENDER_SECONDS.observe(render.result(), format=formato)
+                futuro.set_result(self.cache.put_file(key, tmp))
+            except BaseException as e:
+                try:
+                    os.unlink(tmp)
+                except OSError:
+                    pass
+                if isinstance(e, BrokenProcessPool):  # un proceso murió: el siguiente render abre otro pool
+                    self.shutdown()
+                futuro.set_exception(e)
+            finally:
+                with self._lock:
+                    self._en_curso.pop(key, None)
+
+        render.add_done_callback(terminar)
+        return futuro
+
+    def render(self, formato: str, titulo: str, texto: str) -> Path:
+        return self.submit(formato, titulo, texto).result()
+
+    def stats(self) -> dict:
+        with self._lock:
+            en_curso = len(self._en_curso)
+        return {**self.cache.stats(), "workers": self.workers, "rendering": en_curso}
+
+
+# ══════════════════════════════════════════════════════════════════
+# ZIP EN STREAMING
+# ══════════════════════════════════════════════════════════════════
+
+Origen = Union[Path, bytes, Future]
+
+
+class _Sumidero:
+    """Archivo de solo escritura: zipfile escribe aquí y la respuesta se lo va llevando."""
+
+    def __init__(self):
+        self._trozos: list[bytes] = []
+
+    def write(self, datos) -> int:
+        self._trozos.append(bytes(datos))
+        return len(datos)
+
+    def flush(self) -> None:
+        pass
+
+    def vaciar(self) -> bytes:
+        datos = b"".join(self._trozos)
+        self._trozos.clear()
+        return datos
+
+
+def nombre_unico(usados: set, base: str, ext: str) -> str:
+    """`base.ext`, o `base (2).ext`… si ya hay una entrada con ese nombre."""
+    nombre, n = f"{base}.{ext}", 2
+    while nombre.lower() in usados:
+        nombre, n = f"{base} ({n}).{ext}", n + 1
+    usados.add(nombre.lower())
+    return nombre
+
+
+def _info(nombre: str, metodo: int) -> zipfile.ZipInfo:
+    info = zipfile.ZipInfo(nombre, time.localtime()[:6])
+    info.compress_type = metodo
+    info.external_attr = 0o644 << 16
+    return info
+
+
+def _entrada(zf: zipfile.ZipFile, sumidero: _Sumidero, nombre: str, origen: Origen,
+             metodo: int) -> Iterator[bytes]:
+    """Escribe una entrada y va soltando lo que zipfile deja en el sumidero."""
+    if isinstance(origen, Future):
+        origen = origen.result()
+    info = _info(nombre, metodo)
+    if isinstance(origen, bytes):
+        info.file_size = len(origen)
+        with zf.open(info, "w") as dst:
+            dst.write(origen)
+        return
+    with open(origen, "rb") as src:
+        info.file_size = os.fstat(src.fileno()).st_size  # solo decide si hace falta ZIP64
+        with zf.open(info, "w") as dst:
+            for bloque in iter(lambda: src.read(BLOQUE), b""):
+                dst.write(bloque)
+                datos = sumidero.vaciar()
+                if datos:
+                    yield datos
+
+
+def zip_stream(entradas: Iterable[tuple[str, Origen]], comprimir: bool = True) -> Iterator[bytes]:
+    """
+    Bytes del ZIP a medida que se escribe. Cada entrada es (nombre, origen):
+    un archivo que se copia por bloques, bytes, o un Future con la ruta de
+    un documento que se está renderizando. Sin seek, zipfile pone los
+    tamaños y el CRC en un descriptor tras cada entrada. Si una entrada
+    falla, en su lugar va NOMBRE.error.txt con el error.
+    """
+    sumidero = _Sumidero()
+    metodo = zipfile.ZIP_DEFLATED if comprimir else zipfile.ZIP_STORED
+    with zipfile.ZipFile(sumidero, "w", metodo) as zf:
+        for nombre, origen in entradas:
+            try:
+                yield from _entrada(zf, sumidero, nombre, origen, metodo)
+            except Exception as e:
+                metrics.count_error("export", e)
+                print(f"⚠️ ZIP: {nombre} no se pudo exportar ({type(e).__name__}: {e})", flush=True)
+                base = nombre.rsplit(".", 1)[0]
+                with zf.open(_info(f"{base}.error.txt", metodo), "w") as dst:
+                    dst.write(f"No se pudo exportar {nombre}: {type(e).__name__}: {e}\n".encode("utf-8"))
+            datos = sumidero.vaciar()
+            if datos:
+                yield datos
+    yield sumidero.vaciar()  # directorio central
+
+
+def adelantar(entradas: Iterable[tuple[str, Origen]], n: int) -> Iterator[tuple[str, Origen]]:
+    """
+    Consume `entradas` con `n` de ventaja: los renders de las siguientes
+    entradas corren en el pool mientras se envía la actual, sin encolarlos
+    todos de golpe (cada uno lleva su texto al proceso).
+    """
+    pendientes: deque = deque()
+    for entrada in entradas:
+        pendientes.append(entrada)
+        if len(pendientes) > n:
+            yield pendientes.popleft()
+    while pendientes:
+        yield pendientes.popleft()
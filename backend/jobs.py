@@ -0,0 +1,430 @@
+# -*- coding: utf-8 -*-
+"""
+Cola de trabajos de transcripción en el mismo proceso.
+
+POST /api/jobs deja el audio en disco, crea un Job y responde al instante.
+Uno o más hilos planificadores sacan trabajos de la cola (acotada) y llaman
+al `runner` (que a su vez llama a transcribe()). El runner recibe también
+una función que lanza TrabajoCancelado si alguien canceló el trabajo, y la
+llama entre etapas y segmentos para soltarlo a medio procesar.
+
+Cada cambio de estado se añade a un journal JSONL. Al arrancar se reproduce
+el journal: los trabajos que estaban en cola o a medio procesar vuelven a
+la cola, así un reinicio del servidor no tira a la basura el trabajo pendiente.
+El journal se reescribe con solo el último estado de cada trabajo al
+arrancar y cada vez que acumula muchas más líneas que trabajos conserva.
+
+Con varios workers (main.py --prod --workers N) cada proceso tiene su cola y
+su journal en JOBS_DIR/w<slot> (el slot 0 usa JOBS_DIR directamente). Una
+consulta puede caer en cualquier worker: los trabajos ajenos se leen de los
+journals de los demás de forma incremental, y una cancelación ajena deja
+una marca en JOBS_DIR/cancel que el dueño recoge.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Callable, Optional
+
+QUEUED    = "queued"
+RUNNING   = "running"
+DONE      = "done"
+ERROR     = "error"
+CANCELLED = "cancelled"
+
+FINALES = {DONE, ERROR, CANCELLED}
+
+# Líneas de más que tolera el journal antes de compactarlo: además de
+# JOURNAL_HOLGURA, unas JOURNAL_FACTOR por trabajo conservado (cada trabajo
+# escribe ~3: en cola, en ejecución y final)
+JOURNAL_FACTOR = 4
+JOURNAL_HOLGURA = 64
+
+
+class ColaLlena(Exception):
+    """La cola alcanzó su máximo de trabajos pendientes."""
+
+
+class TrabajoCancelado(Exception):
+    """El runner la lanza cuando detecta que el trabajo fue cancelado."""
+
+
+@dataclass
+class Job:
+    id: str
+    filename: str
+    audio_path: str
+    language: str = "es-chile"
+    model: str = "mlx-community/whisper-large-v3-turbo"
+    context: str = ""
+    options: dict = field(default_factory=dict)
+    state: str = QUEUED
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    cancel_requested: bool = False
+
+    def timings(self) -> dict:
+        ahora = time.time()
+        fin_espera = self.started_at or (self.finished_at if self.state in FINALES else ahora)
+        espera = round(fin_espera - self.created_at, 3)
+        proceso = None
+        if self.started_at:
+            proceso = round((self.finished_at or ahora) - self.started_at, 3)
+        return {"queued_s": espera, "running_s": proceso}
+
+    def to_dict(self, position: Optional[int] = None) -> dict:
+        return {
+            "id": self.id,
+            "filename": self.filename,
+            "state": self.state,
+            "language": self.language,
+            "model": self.model,
+            "position": position,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "timings": self.timings(),
+            "result": self.result,
+            "error": self.error,
+        }
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "Job":
+        return cls(**{k: v for k, v in d.items() if k in cls.__dataclass_fields__})
+
+
+class _JournalAjeno:
+    """Journal de otro worker, leído de forma incremental (solo lo añadido desde la última vez)."""
+
+    def __init__(self, ruta: Path):
+        self.ruta = ruta
+        self.offset = 0
+        self.inodo = None
+        self.jobs: dict[str, dict] = {}
+
+    def leer(self) -> dict[str, dict]:
+        try:
+            st = os.stat(self.ruta)
+        except OSError:
+            self.jobs = {}
+            return self.jobs
+        if st.st_ino != self.inodo or st.st_size < self.offset:  # su dueño lo compactó
+            self.inodo, self.offset, self.jobs = st.st_ino, 0, {}
+        if st.st_size > self.offset:
+            with open(self.ruta, "rb") as f:
+                f.seek(self.offset)
+                datos = f.read(st.st_size - self.offset)
+            fin = datos.rfind(b"\n") + 1  # una línea a medio escribir se lee la próxima vez
+            for linea in datos[:fin].splitlines():
+                try:
+                    d = json.loads(linea)
+                    self.jobs[d["id"]] = d
+                except (ValueError, KeyError):
+                    continue
+            self.offset += fin
+        return self.jobs
+
+
+class JobQueue:
+    """
+    Cola FIFO acotada + planificador en hilos + journal en disco.
+    `runner(job, check_cancel)` debe devolver el dict de resultado o lanzar
+    una excepción; `check_cancel()` lanza TrabajoCancelado si hay que parar.
+    """
+
+    def __init__(self, directorio: Path, runner: Callable[[Job, Callable[[], None]], dict],
+                 max_queued: int = 32, workers: int = 1, keep_done: int = 200):
+        self.base = Path(directorio)
+        self._usar_slot(0)
+        self.cancelaciones = self.base / "cancel"
+        self.runner = runner
+        self.max_queued = max(1, max_queued)
+        self.workers = max(1, workers)
+        self.keep_done = keep_done
+        self._jobs: dict[str, Job] = {}
+        self._pendientes: deque[str] = deque()
+        self._cond = threading.Condition()
+        self._journal_lock = threading.Lock()
+        self._lineas = 0  # líneas escritas en el journal desde la última compactación
+        self._hilos: list[threading.Thread] = []
+        self._parar = False
+        self._ajenos: dict[Path, _JournalAjeno] = {}
+        self._ajenos_lock = threading.Lock()
+
+    def _usar_slot(self, slot: int) -> None:
+        self.dir = self.base / f"w{slot}" if slot else self.base
+        self.uploads = self.dir / "uploads"
+        self.journal = self.dir / "journal.jsonl"
+
+    # ── ciclo de vida ──────────────────────────────────────────
+
+    def start(self, slot: int = 0) -> None:
+        """`slot` = índice del worker (ver backend/workers.py): elige journal y carpeta de subidas."""
+        if self._hilos:
+            return
+        self._usar_slot(slot)
+        self.uploads.mkdir(parents=True, exist_ok=True)
+        self._cargar_journal()
+        self._parar = False
+        for n in range(self.workers):
+            t = threading.Thread(target=self._bucle, name=f"jobs-{n}", daemon=True)
+            t.start()
+            self._hilos.append(t)
+
+    def alive(self) -> bool:
+        return bool(self._hilos) and all(t.is_alive() for t in self._hilos)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        with self._cond:
+            self._parar = True
+            self._cond.notify_all()
+        for t in self._hilos:
+            t.join(timeout)
+        self._hilos = []
+
+    # ── API pública ───────────────────────────────────────────
+
+    def upload_path(self, job_id: str, ext: str) -> Path:
+        return self.uploads / f"{job_id}{ext}"
+
+    @staticmethod
+    def new_id() -> str:
+        return uuid.uuid4().hex
+
+    def submit(self, job: Job) -> Job:
+        with self._cond:
+            if len(self._pendientes) >= self.max_queued:
+                raise ColaLlena(f"Cola llena ({self.max_queued} trabajos en espera)")
+            job.state = QUEUED
+            self._jobs[job.id] = job
+            self._pendientes.append(job.id)
+            self._escribir(job)
+            self._cond.notify()
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def position(self, job_id: str) -> Optional[int]:
+        """Posición en la cola (0 = el próximo en ejecutarse); None si no está en espera."""
+        with self._cond:
+            try:
+                return self._pendientes.index(job_id)
+            except ValueError:
+                return None
+
+    def describe(self, job_id: str) -> Optional[dict]:
+        self._recoger_cancelaciones()  # los hilos pueden estar todos ocupados
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return job.to_dict(self.position(job_id))
+        ajeno = self._trabajos_ajenos().get(job_id)
+        return Job.from_dict(ajeno).to_dict() if ajeno else None
+
+    def list(self) -> list[dict]:
+        self._recoger_cancelaciones()
+        ajenos = self._trabajos_ajenos()
+        with self._cond:
+            propios = [(j.created_at, j.to_dict(self.position(j.id))) for j in self._jobs.values()]
+        otros = [(d.get("created_at", 0), Job.from_dict(d).to_dict())
+                 for i, d in ajenos.items() if i not in self._jobs]
+        return [d for _, d in sorted(propios + otros, key=lambda t: t[0])]
+
+    def depth(self) -> int:
+        with self._cond:
+            return len(self._pendientes)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """
+        Un trabajo en cola se cancela al momento. Uno en ejecución queda marcado
+        y se detiene en el siguiente punto en que el runner llame a
+        check_cancel(); si ya no pasa por ninguno (p. ej. una sola inferencia
+        larga con MLX), su resultado se descarta cuando devuelve el control.
+        """
+        with self._cond:
+            job = self._jobs.get(job_id)
+        if job is None:
+            return self._cancelar_ajeno(job_id)
+        with self._cond:
+            if job.state in FINALES:
+                return job
+            job.cancel_requested = True
+            if job.state == QUEUED:
+                try:
+                    self._pendientes.remove(job_id)
+                except ValueError:
+                    pass
+                self._finalizar(job, CANCELLED)
+            else:
+                self._escribir(job)
+            return job
+
+    def is_cancelled(self, job_id: str) -> bool:
+        job = self._jobs.get(job_id)
+        if job and not job.cancel_requested and (self.cancelaciones / job_id).exists():
+            self.cancel(job_id)
+        return bool(job and job.cancel_requested)
+
+    def check_cancel(self, job_id: str) -> None:
+        if self.is_cancelled(job_id):
+            raise TrabajoCancelado(job_id)
+
+    # ── otros workers ─────────────────────────────────────────
+
+    def _trabajos_ajenos(self) -> dict[str, dict]:
+        """Último estado de los trabajos de los demás workers, según sus journals."""
+        rutas = [self.base / "journal.jsonl"] + sorted(self.base.glob("w*/journal.jsonl"))
+        vistos: dict[str, dict] = {}
+        with self._ajenos_lock:
+            for ruta in rutas:
+                if ruta != self.journal:
+                    lector = self._ajenos.setdefault(ruta, _JournalAjeno(ruta))
+                    vistos.update(lector.leer())
+        return vistos
+
+    def _cancelar_ajeno(self, job_id: str) -> Optional[Job]:
+        d = self._trabajos_ajenos().get(job_id)
+        if d is None:
+            return None
+        job = Job.from_dict(d)
+        if job.state not in FINALES:
+            self.cancelaciones.mkdir(parents=True, exist_ok=True)
+            (self.cancelaciones / job_id).touch()
+            job.cancel_requested = True
+        return job
+
+    def _recoger_cancelaciones(self) -> None:
+        """Aplica las marcas que otros workers dejaron para trabajos de este."""
+        try:
+            marcas = os.listdir(self.cancelaciones)
+        except OSError:
+            return
+        for job_id in marcas:
+            if job_id in self._jobs:
+                self.cancel(job_id)
+                try:
+                    os.unlink(self.cancelaciones / job_id)
+                except OSError:
+                    pass
+
+    # ── planificador ──────────────────────────────────────────
+
+    def _bucle(self) -> None:
+        while True:
+            self._recoger_cancelaciones()
+            with self._cond:
+                while not self._pendientes and not self._parar:
+                    if not self._cond.wait(1.0):
+                        break  # cada segundo se miran las cancelaciones de otros workers
+                if self._parar:
+                    return
+                if not self._pendientes:
+                    continue
+                job = self._jobs[self._pendientes.popleft()]
+                job.state = RUNNING
+                job.started_at = time.time()
+                self._escribir(job)
+            try:
+                resultado = self.runner(job, lambda: self.check_cancel(job.id))
+            except TrabajoCancelado:
+                with self._cond:
+                    self._finalizar(job, CANCELLED)
+                continue
+            except Exception as e:
+                print(f"\n❌ ERROR en trabajo {job.id} ({job.filename}): {e}", flush=True)
+                with self._cond:
+                    job.error = str(e)
+                    self._finalizar(job, ERROR)
+                continue
+            with self._cond:
+                if job.cancel_requested:
+                    self._finalizar(job, CANCELLED)
+                else:
+                    job.result = resultado
+                    self._finalizar(job, DONE)
+
+    def _finalizar(self, job: Job, estado: str) -> None:
+        job.state = estado
+        job.finished_at = time.time()
+        self._escribir(job)
+        try:
+            os.unlink(job.audio_path)
+        except OSError:
+            pass
+        terminados = [j for j in self._jobs.values() if j.state in FINALES]
+        if len(terminados) > self.keep_done:
+            terminados.sort(key=lambda j: j.finished_at or 0)
+            for viejo in terminados[:len(terminados) - self.keep_done]:
+                del self._jobs[viejo.id]
+
+    # ── journal ───────────────────────────────────────────────
+
+    def _escribir(self, job: Job) -> None:
+        """Se llama con self._cond tomado (la compactación recorre self._jobs)."""
+        linea = json.dumps(asdict(job), ensure_ascii=False) + "\n"
+        with self._journal_lock:
+            with open(self.journal, "a", encoding="utf-8") as f:
+                f.write(linea)
+                f.flush()
+                os.fsync(f.fileno())
+            self._lineas += 1
+            if self._lineas > JOURNAL_FACTOR * len(self._jobs) + JOURNAL_HOLGURA:
+                self._compactar()
+
+    def _compactar(self) -> None:
+        """Reescribe el journal con el último estado de los trabajos que se conservan."""
+        tmp = self.journal.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            for j in sorted(self._jobs.values(), key=lambda j: j.created_at):
+                f.write(json.dumps(asdict(j), ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        # Inodo nuevo: los lectores de otros workers (_JournalAjeno) lo detectan y releen
+        os.replace(tmp, self.journal)
+        self._lineas = len(self._jobs)
+
+    def _cargar_journal(self) -> None:
+        """Reproduce el journal, reencola lo inacabado y compacta el archivo."""
+        if not self.journal.exists():
+            return
+        ultimos: dict[str, dict] = {}
+        with open(self.journal, encoding="utf-8") as f:
+            for linea in f:
+                try:
+                    d = json.loads(linea)
+                    ultimos[d["id"]] = d
+                except (ValueError, KeyError):
+                    continue  # línea truncada por un corte: se ignora
+
+        jobs = [Job.from_dict(d) for d in ultimos.values()]
+        jobs.sort(key=lambda j: j.created_at)
+        terminados = [j for j in jobs if j.state in FINALES][-self.keep_done:] if self.keep_done else []
+        for j in jobs:
+            if j.state in FINALES:
+                continue
+            if j.cancel_requested or not os.path.exists(j.audio_path):
+                j.state = CANCELLED if j.cancel_requested else ERROR
+                j.error = j.error or (None if j.cancel_requested else "Audio perdido tras reinicio")
+                j.finished_at = time.time()
+                terminados.append(j)
+                continue
+            j.state = QUEUED
+            j.started_at = None
+            self._jobs[j.id] = j
+            self._pendientes.append(j.id)
+        for j in terminados:
+            self._jobs[j.id] = j
+
+        with self._journal_lock:
+            self._compactar()
+        if self._pendientes:
+            print(f"↻ {len(self._pendientes)} trabajo(s) reanudados desde el journal", flush=True)
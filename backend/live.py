@@ -0,0 +1,379 @@
+# -*- coding: utf-8 -*-
+"""
+Transcripción en vivo: la grabadora envía audio por WebSocket mientras
+dura la clase y el texto vuelve con unos segundos de retraso.
+
+El audio llega en trozos (PCM 16 bits o float32 a cualquier frecuencia,
+o Opus/WebM/Ogg tal como los entrega MediaRecorder, que un ffmpeg
+abierto durante todo el stream convierte a PCM 16 kHz). Un hilo por
+stream mantiene una ventana deslizante desde el último punto confirmado:
+  1. cada LIVE_STEP_SECONDS de audio nuevo vuelve a transcribir la
+     ventana con el modelo ya residente (transcribe_window), con el texto
+     confirmado como prompt;
+  2. los segmentos que terminan al menos LIVE_FINAL_MARGIN_SECONDS antes
+     del borde (y no son el último, que puede seguir creciendo) pasan a
+     finales y el punto confirmado avanza hasta su fin; el resto se envía
+     como provisional y se reemplaza en la pasada siguiente;
+  3. si la ventana llega a LIVE_WINDOW_SECONDS sin nada final, se confirma
+     todo menos el último segmento: la latencia queda acotada aunque el
+     profesor no haga pausas. Los tramos sin voz (VAD) no pasan por el
+     modelo.
+Por stream se mide la latencia (desde que llega el audio del final de un
+segmento hasta que se envía) y el atraso (audio recibido que ninguna
+pasada cubrió todavía). Si el atraso pasa de LIVE_MAX_BACKLOG_SECONDS la
+máquina no da abasto con ese modelo: se avisa en el log, en los eventos
+"stats" y en /metrics.
+"""
+import os
+import re
+import subprocess
+import threading
+import time
+import uuid
+from collections import deque
+from pathlib import Path
+from typing import Callable, Optional
+
+import numpy as np
+
+from backend import config
+from backend.metrics import Counter, Histogram
+
+SAMPLE_RATE = 16000
+FORMATOS_PCM = {"pcm16": np.int16, "f32": np.float32}
+FORMATOS_FFMPEG = {"opus", "webm", "ogg"}
+
+LIVE_LATENCY = Histogram("transcriptotem_live_latency_seconds",
+                         "Desde que llega el audio de un segmento hasta que se envía", ("kind",))
+LIVE_AUDIO = Counter("transcriptotem_live_audio_seconds_total", "Audio recibido por /api/live")
+
+_sesiones: dict[str, "LiveSession"] = {}
+_sesiones_lock = threading.Lock()
+
+
+def activas() -> list["LiveSession"]:
+    with _sesiones_lock:
+        return list(_sesiones.values())
+
+
+def nombre_archivo(nombre: str) -> str:
+    """Nombre de archivo seguro para Transcritas; sin nombre, uno con la fecha."""
+    limpio = re.sub(r"[^\w\- .]", "_", Path(nombre or "").stem).strip(" .")
+    return limpio or time.strftime("en-vivo-%Y%m%d-%H%M%S")
+
+
+def guardar(destino: Path, nombre: str, texto: str) -> Path:
+    """Escribe <nombre>.txt en `destino` sin pisar uno existente (.part + os.replace)."""
+    destino.mkdir(parents=True, exist_ok=True)
+    ruta, n = destino / f"{nombre}.txt", 1
+    while ruta.exists():
+        n += 1
+        ruta = destino / f"{nombre}-{n}.txt"
+    tmp = ruta.with_suffix(".txt.part")
+    tmp.write_text(texto, encoding="utf-8")
+    os.replace(tmp, ruta)
+    return ruta
+
+
+class _DecodificadorFfmpeg:
+    """ffmpeg abierto durante todo el stream: trozos Opus/WebM por stdin, PCM 16 kHz por stdout."""
+
+    def __init__(self, entregar: Callable[[np.ndarray], None]):
+        try:
+            self._proc = subprocess.Popen(
+                ["ffmpeg", "-nostdin", "-loglevel", "error", "-i", "pipe:0",
+                 "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1"],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            )
+        except FileNotFoundError:
+            raise RuntimeError("ffmpeg no está instalado (brew install ffmpeg)")
+        self._entregar = entregar
+        self._lector = threading.Thread(target=self._leer, name="live-ffmpeg", daemon=True)
+        self._lector.start()
+
+    def _leer(self) -> None:
+        resto = b""
+        while True:
+            datos = self._proc.stdout.read1(8192)
+            if not datos:
+                break
+            datos, resto = resto + datos, b""
+            if len(datos) % 2:
+                datos, resto = datos[:-1], datos[-1:]
+            self._entregar(np.frombuffer(datos, dtype=np.int16).astype(np.float32) / 32768.0)
+
+    def write(self, datos: bytes) -> None:
+        try:
+            self._proc.stdin.write(datos)
+            self._proc.stdin.flush()
+        except BrokenPipeError:
+            raise RuntimeError(f"ffmpeg no pudo decodificar el audio: {self._error()}")
+
+    def _error(self) -> str:
+        try:
+            return self._proc.stderr.read().decode(errors="ignore")[-300:]
+        except (OSError, ValueError):
+            return ""
+
+    def close(self) -> None:
+        try:
+            self._proc.stdin.close()
+        except OSError:
+            pass
+        self._lector.join()
+        self._proc.wait()
+
+
+class LiveSession:
+    """
+    Un stream en vivo. `transcribir(audio, texto_previo)` devuelve los
+    segmentos de la ventana; `emitir(evento)` los envía al cliente (se
+    llama desde el hilo de inferencia).
+    """
+
+    def __init__(self, transcribir: Callable[[np.ndarray, str], list[dict]],
+                 emitir: Callable[[dict], None], formato: str = "pcm16",
+                 sample_rate: int = SAMPLE_RATE, nombre: str = "", model: str = "",
+                 vad: Optional[bool] = None):
+        if formato not in FORMATOS_PCM and formato not in FORMATOS_FFMPEG:
+            raise ValueError(f"Formato no soportado: {formato} "
+                             f"(usa {', '.join(sorted(FORMATOS_PCM) + sorted(FORMATOS_FFMPEG))})")
+        if not 4000 <= sample_rate <= 192000:
+            raise ValueError(f"sample_rate fuera de rango: {sample_rate}")
+        self.id = uuid.uuid4().hex[:12]
+        self.nombre = nombre_archivo(nombre)
+        self.model = model
+        self.formato, self.sample_rate = formato, sample_rate
+        self.usar_vad = config.VAD_ENABLED if vad is None else vad
+        self._transcribir, self._emitir = transcribir, emitir
+        self._paso = int(config.LIVE_STEP_SECONDS * SAMPLE_RATE)
+        self._margen_s = config.LIVE_FINAL_MARGIN_SECONDS
+        self._ventana = int(max(config.LIVE_WINDOW_SECONDS, 2 * self._margen_s + 1) * SAMPLE_RATE)
+        self._cond = threading.Condition()
+        self._resto = b""                  # bytes de una muestra partida entre dos trozos
+        self._buf = np.zeros(0, dtype=np.float32)
+        self._pendientes: list[np.ndarray] = []
+        self._base = 0                     # muestra absoluta de self._buf[0]
+        self._recibidas = 0
+        self._procesadas = 0               # hasta dónde llegó la última pasada
+        self._confirmadas = 0              # punto confirmado: inicio de la ventana
+        self._llegadas: deque = deque()    # (muestra final del trozo, instante de llegada)
+        self._cerrado = False
+        self._finales: list[dict] = []
+        self._latencias: deque = deque(maxlen=1000)
+        self._pasadas = 0
+        self._proceso_s = 0.0
+        self._rtf = 0.0
+        self._atrasado = False
+        self._provisional = ""             # último texto provisional enviado
+        self.error: Optional[str] = None
+        self.inicio = time.time()
+        self._decodificador = _DecodificadorFfmpeg(self._agregar) if formato in FORMATOS_FFMPEG else None
+        self._hilo = threading.Thread(target=self._bucle, name=f"live-{self.id}", daemon=True)
+
+    # ── entrada ───────────────────────────────────────────────
+
+    def start(self) -> "LiveSession":
+        with _sesiones_lock:
+            _sesiones[self.id] = self
+        self._hilo.start()
+        return self
+
+    def feed(self, datos: bytes) -> None:
+        """Un trozo tal como lo envía la grabadora."""
+        if self._decodificador is not None:
+            self._decodificador.write(datos)
+            return
+        datos, self._resto = self._resto + datos, b""
+        tipo = FORMATOS_PCM[self.formato]
+        ancho = np.dtype(tipo).itemsize
+        corte = len(datos) - len(datos) % ancho
+        datos, self._resto = datos[:corte], datos[corte:]
+        muestras = np.frombuffer(datos, dtype=tipo).astype(np.float32)
+        if tipo is np.int16:
+            muestras /= 32768.0
+        if self.sample_rate != SAMPLE_RATE and len(muestras):
+            n = int(round(len(muestras) * SAMPLE_RATE / self.sample_rate))
+            muestras = np.interp(np.linspace(0, len(muestras) - 1, n), np.arange(len(muestras)),
+                                 muestras).astype(np.float32)
+        self._agregar(muestras)
+
+    def _agregar(self, muestras: np.ndarray) -> None:
+        if not len(muestras):
+            return
+        with self._cond:
+            self._pendientes.append(muestras)
+            self._recibidas += len(muestras)
+            self._llegadas.append((self._recibidas, time.monotonic()))
+            self._cond.notify()
+        LIVE_AUDIO.inc(len(muestras) / SAMPLE_RATE)
+
+    def finish(self) -> dict:
+        """Cierra el stream: última pasada con todo confirmado. {text, segments, stats}."""
+        if self._decodificador is not None:
+            self._decodificador.close()
+        with self._cond:
+            self._cerrado = True
+            self._cond.notify()
+        if self._hilo.is_alive():
+            self._hilo.join()
+        with _sesiones_lock:
+            _sesiones.pop(self.id, None)
+        from backend.transcriber import _clean_transcript
+        texto = _clean_transcript("".join(s["raw"] for s in self._finales))
+        return {"text": texto,
+                "segments": [{k: s[k] for k in ("start", "end", "text")} for s in self._finales],
+                "stats": self.stats()}
+
+    # ── ventana deslizante ────────────────────────────────────
+
+    def _tramo(self, desde: int, hasta: int) -> np.ndarray:
+        """Con self._cond tomado: audio [desde, hasta) en muestras absolutas."""
+        if self._pendientes:
+            self._buf = np.concatenate([self._buf] + self._pendientes)
+            self._pendientes = []
+        return self._buf[desde - self._base:hasta - self._base]
+
+    def _confirmar(self, hasta: int) -> None:
+        """Con self._cond tomado: descarta el audio anterior al nuevo punto confirmado."""
+        hasta = max(self._confirmadas, min(hasta, self._recibidas))
+        self._confirmadas = hasta
+        if hasta > self._base:
+            self._tramo(hasta, hasta)  # junta los pendientes antes de recortar
+            self._buf = self._buf[hasta - self._base:].copy()
+            self._base = hasta
+        while len(self._llegadas) > 1 and self._llegadas[0][0] < hasta:
+            self._llegadas.popleft()
+
+    def _llegada(self, muestra: int) -> float:
+        """Instante en que llegó el audio de `muestra`."""
+        with self._cond:
+            for fin, t in self._llegadas:
+                if fin >= muestra:
+                    return t
+            return self._llegadas[-1][1] if self._llegadas else time.monotonic()
+
+    def _bucle(self) -> None:
+        while True:
+            with self._cond:
+                while not self._cerrado and self._recibidas - self._procesadas < self._paso:
+                    self._cond.wait()
+                cerrado = self._cerrado
+                desde = self._confirmadas
+                hasta = self._recibidas if cerrado else min(self._recibidas, desde + self._ventana)
+                audio = self._tramo(desde, hasta)
+            if len(audio) and self.error is None:
+                try:
+                    self._pasada(audio, desde, hasta, cerrado)
+                except Exception as e:
+                    self.error = f"{type(e).__name__}: {e}"
+                    print(f"❌ En vivo {self.id}: {self.error}", flush=True)
+                    self._emitir({"type": "error", "mensaje": str(e)})
+            with self._cond:
+                self._procesadas = max(self._procesadas, hasta)
+            if cerrado:
+                return
+
+    def _previo(self) -> str:
+        return "".join(s["raw"] for s in self._finales[-10:])
+
+    def _pasada(self, audio: np.ndarray, desde: int, hasta: int, cerrado: bool) -> None:
+        from backend.transcriber import _clean_transcript
+        from backend.vad import detect_speech
+        dur = len(audio) / SAMPLE_RATE
+        t0 = time.perf_counter()
+        if self.usar_vad and not len(detect_speech(audio).regions):
+            segs = []
+        else:
+            segs = [s for s in self._transcribir(audio, self._previo()) if (s.get("text") or "").strip()]
+        proceso = time.perf_counter() - t0
+        self._pasadas += 1
+        self._proceso_s += proceso
+        self._rtf = proceso / dur if dur else 0.0
+
+        # Cuántos segmentos pasan a finales
+        if cerrado:
+            n = len(segs)
+        else:
+            limite = dur - self._margen_s
+            n = 0
+            for k, s in enumerate(segs[:-1]):  # el último puede seguir creciendo
+                if s["end"] <= limite:
+                    n = k + 1
+            if not n and len(audio) >= self._ventana and segs:
+                n = max(1, len(segs) - 1)  # ventana llena: se confirma lo que haya
+
+        ahora = time.monotonic()
+        origen = desde / SAMPLE_RATE
+        ultimo_fin = self._finales[-1]["end"] if self._finales else 0.0
+        for s in segs[:n]:
+            fin_rel = min(s.get("end", dur), dur)
+            inicio = round(max(ultimo_fin, origen + s.get("start", 0.0)), 3)
+            fin = round(max(inicio, origen + fin_rel), 3)
+            latencia = ahora - self._llegada(desde + int(fin_rel * SAMPLE_RATE))
+            LIVE_LATENCY.observe(latencia, kind="final")
+            self._latencias.append(latencia)
+            self._finales.append({"start": inicio, "end": fin, "raw": s["text"],
+                                  "text": _clean_transcript(s["text"])})
+            ultimo_fin = fin
+            if self._finales[-1]["text"]:
+                self._emitir({"type": "final", "start": inicio, "end": fin,
+                              "text": self._finales[-1]["text"], "latency_s": round(latencia, 3)})
+
+        provisionales = segs[n:]
+        texto = _clean_transcript("".join(s["text"] for s in provisionales)) if provisionales else ""
+        if texto != self._provisional and not cerrado:
+            self._provisional = texto
+            latencia = ahora - self._llegada(hasta)
+            LIVE_LATENCY.observe(latencia, kind="partial")
+            self._emitir({"type": "partial", "text": texto,
+                          "start": round(origen + provisionales[0].get("start", 0.0), 3) if provisionales else None,
+                          "end": round(origen + min(provisionales[-1].get("end", dur), dur), 3) if provisionales else None,
+                          "latency_s": round(latencia, 3)})
+
+        with self._cond:
+            self._procesadas = max(self._procesadas, hasta)
+            if cerrado:
+                self._confirmar(hasta)
+            elif n:
+                self._confirmar(desde + int(min(segs[n - 1].get("end", dur), dur) * SAMPLE_RATE))
+            elif not segs and dur > 2 * self._margen_s:
+                # sin voz: se descarta salvo el final, donde puede estar empezando una palabra
+                self._confirmar(hasta - int(self._margen_s * SAMPLE_RATE))
+
+        stats = self.stats()
+        if stats["behind"] and not self._atrasado:
+            print(f"⚠️ En vivo {self.id}: {stats['backlog_s']:.1f}s de atraso con {self.model} "
+                  f"(RTF {self._rtf:.2f}); esta máquina no da abasto", flush=True)
+        self._atrasado = stats["behind"]
+        self._emitir({"type": "stats", **stats})
+
+    # ── estado ────────────────────────────────────────────────
+
+    def backlog_s(self) -> float:
+        with self._cond:
+            return (self._recibidas - self._procesadas) / SAMPLE_RATE
+
+    def stats(self) -> dict:
+        with self._cond:
+            recibidas, confirmadas = self._recibidas, self._confirmadas
+        latencias = sorted(self._latencias)
+        backlog = self.backlog_s()
+
+        def pct(p: float) -> Optional[float]:
+            return round(latencias[min(len(latencias) - 1, int(p * len(latencias)))], 3) if latencias else None
+
+        return {
+            "stream_id": self.id, "name": self.nombre, "model": self.model, "format": self.formato,
+            "audio_s": round(recibidas / SAMPLE_RATE, 2),
+            "confirmed_s": round(confirmadas / SAMPLE_RATE, 2),
+            "backlog_s": round(backlog, 2),
+            "behind": backlog > config.LIVE_MAX_BACKLOG_SECONDS,
+            "passes": self._pasadas,
+            "rtf": round(self._rtf, 3),
+            "process_s": round(self._proceso_s, 2),
+            "segments": len(self._finales),
+            "latency_s": {"p50": pct(0.5), "p95": pct(0.95),
+                          "max": round(latencias[-1], 3) if latencias else None},
+            "error": self.error,
+        }
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Métricas en formato de texto de Prometheus (GET /metrics) y tiempos por etapa.
+
+Implementación mínima sin dependencias: contadores e histogramas con
+etiquetas, protegidos por un lock y con búsqueda binaria del bucket, de
+modo que observar cuesta del orden de un microsegundo y puede quedar
+activo siempre. Lo que ya se cuenta en otra parte (profundidad de la cola,
+aciertos de las cachés, modelos residentes) se lee en el momento del
+scrape mediante callbacks, sin duplicar estado.
+
+Las etapas de una petición se acumulan además en un dict `timings`
+({etapa: segundos}) que viaja con el `info` de transcribe() y termina en
+la respuesta de /api/transcribe y en los eventos NDJSON de la carpeta.
+"""
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+                    30, 60, 120, 300, 600, 1800, 3600)
+BUCKETS_RTF = (0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.35, 0.5, 0.75, 1, 1.5, 2, 5)
+
+_metricas: list = []
+
+
+def _etiquetas(nombres: tuple, valores: tuple, extra: str = "") -> str:
+    partes = [f'{n}="{_escapar(v)}"' for n, v in zip(nombres, valores)]
+    if extra:
+        partes.append(extra)
+    return "{" + ",".join(partes) + "}" if partes else ""
+
+
+def _valor(v) -> str:
+    return ("true" if v else "false") if isinstance(v, bool) else str(v)
+
+
+def _escapar(v) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _numero(v: float) -> str:
+    if v == math.inf:
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class Counter:
+    tipo = "counter"
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: tuple = ()):
+        self.nombre, self.ayuda, self.etiquetas = nombre, ayuda, tuple(etiquetas)
+        self._valores: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+        _metricas.append(self)
+
+    def inc(self, cantidad: float = 1.0, **etiquetas) -> None:
+        clave = tuple(_valor(etiquetas.get(n, "")) for n in self.etiquetas)
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0.0) + cantidad
+
+    def muestras(self) -> list[str]:
+        with self._lock:
+            valores = dict(self._valores)
+        return [f"{self.nombre}{_etiquetas(self.etiquetas, k)} {_numero(v)}"
+                for k, v in sorted(valores.items())]
+
+
+class Histogram:
+    tipo = "histogram"
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: tuple = (),
+                 buckets: tuple = BUCKETS_SEGUNDOS):
+        self.nombre, self.ayuda, self.etiquetas = nombre, ayuda, tuple(etiquetas)
+        self.buckets = tuple(sorted(buckets))
+        # etiquetas -> [conteos por bucket (no acumulados)…, +Inf], suma
+        self._series: dict[tuple, tuple[list[int], list[float]]] = {}
+        self._lock = threading.Lock()
+        _metricas.append(self)
+
+    def observe(self, valor: float, **etiquetas) -> None:
+        clave = tuple(_valor(etiquetas.get(n, "")) for n in self.etiquetas)
+        i = bisect.bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._series.get(clave)
+            if serie is None:
+                serie = self._series[clave] = ([0] * (len(self.buckets) + 1), [0.0])
+            serie[0][i] += 1
+            serie[1][0] += valor
+
+    def muestras(self) -> list[str]:
+        with self._lock:
+            series = {k: (list(c), s[0]) for k, (c, s) in self._series.items()}
+        lineas = []
+        for clave, (conteos, suma) in sorted(series.items()):
+            acumulado = 0
+            for limite, n in zip(self.buckets + (math.inf,), conteos):
+                acumulado += n
+                le = 'le="%s"' % _numero(limite)
+                lineas.append(f"{self.nombre}_bucket{_etiquetas(self.etiquetas, clave, le)} {acumulado}")
+            lineas.append(f"{self.nombre}_sum{_etiquetas(self.etiquetas, clave)} {_numero(suma)}")
+            lineas.append(f"{self.nombre}_count{_etiquetas(self.etiquetas, clave)} {acumulado}")
+        return lineas
+
+
+class Callback:
+    """Métrica cuyo valor se calcula al hacer el scrape: fn() -> {(valores de etiquetas): número}."""
+
+    def __init__(self, nombre: str, ayuda: str, tipo: str, etiquetas: tuple,
+                 fn: Callable[[], dict]):
+        self.nombre, self.ayuda, self.tipo = nombre, ayuda, tipo
+        self.etiquetas, self.fn = tuple(etiquetas), fn
+        _metricas.append(self)
+
+    def muestras(self) -> list[str]:
+        try:
+            valores = self.fn()
+        except Exception:
+            return []
+        return [f"{self.nombre}{_etiquetas(self.etiquetas, k)} {_numero(v)}"
+                for k, v in sorted(valores.items()) if v is not None]
+
+
+def render() -> str:
+    bloques = []
+    for m in list(_metricas):
+        muestras = m.muestras()
+        if not muestras:
+            continue
+        bloques.append(f"# HELP {m.nombre} {m.ayuda}\n# TYPE {m.nombre} {m.tipo}\n" + "\n".join(muestras))
+    return "\n".join(bloques) + "\n"
+
+
+# ══════════════════════════════════════════════════════════════════
+# MÉTRICAS DEL SERVIDOR
+# ══════════════════════════════════════════════════════════════════
+
+STAGE_SECONDS = Histogram("transcriptotem_stage_seconds",
+                          "Duración de cada etapa (upload, temp_write, hash, probe, decode, vad, "
+                          "model_load, batch_wait, inference, redecode, clean, write, index, archive)", ("stage",))
+RTF = Histogram("transcriptotem_rtf", "Segundos de inferencia por segundo de audio",
+                ("engine", "model"), buckets=BUCKETS_RTF)
+AUDIO_SECONDS = Counter("transcriptotem_audio_seconds_total",
+                        "Segundos de audio enviados al motor", ("engine", "model"))
+TRANSCRIPTIONS = Counter("transcriptotem_transcriptions_total",
+                         "Transcripciones terminadas por origen", ("source", "cached"))
+ERRORS = Counter("transcriptotem_errors_total", "Errores por origen y tipo de excepción",
+                 ("source", "type"))
+
+
+def observe_stage(timings: Optional[dict], etapa: str, segundos: float) -> None:
+    STAGE_SECONDS.observe(segundos, stage=etapa)
+    if timings is not None:
+        timings[etapa] = round(timings.get(etapa, 0.0) + segundos, 4)
+
+
+@contextmanager
+def stage(timings: Optional[dict], etapa: str):
+    """with stage(timings, "decode"): … — mide el bloque aunque lance una excepción."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(timings, etapa, time.perf_counter() - t0)
+
+
+def count_error(origen: str, exc: BaseException) -> None:
+    ERRORS.inc(source=origen, type=type(exc).__name__)
@@ -0,0 +1,442 @@
+# -*- coding: utf-8 -*-
+"""
+Procesamiento de la carpeta Pendientes por etapas solapadas.
+
+Antes: sondear, decodificar, transcribir, escribir el .txt y mover a
+Archivados, todo en serie; la GPU/CPU esperaba a OneDrive en cada paso.
+Ahora hay tres etapas:
+
+  prefetch  (hilo)  duración (ffprobe, cacheada) + hash + decodificación del SIGUIENTE audio
+                    (por la caché de audio decodificado)
+  inferencia (pool) Whisper sobre los audios admitidos, ya decodificados
+  E/S       (hilo)  escritura del .txt, índice de búsqueda y movimiento a Archivados
+
+Qué audio es el siguiente y cuántos se transcriben a la vez lo decide
+scheduler.FolderScheduler: el más corto primero (ponderado por
+prioridades) y tantos en paralelo como quepan en el presupuesto de
+memoria y threads.
+
+Un manifiesto en disco guarda la etapa de cada archivo. Si el lote se
+interrumpe, al reanudarlo los audios cuyo .txt ya se escribió solo se
+archivan, sin volver a transcribirlos.
+
+Cada evento progress lleva la ETA del archivo (`eta_s`) y la de todo lo
+que queda por transcribir (`eta_restante_s`), con el RTF aprendido de los
+trabajos anteriores (ver eta.py).
+"""
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+import traceback
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Iterator, Optional
+
+from backend import config
+from backend.audio import load_audio_cached, probe
+from backend.cache import sha256_archivo
+from backend.metrics import TRANSCRIPTIONS, count_error, stage
+from backend.scheduler import FolderScheduler, leer_prioridades, threads_por_trabajo
+from backend.transcriber import (cache_key, estimate_eta, get_engine, transcribe, transcribe_stream,
+                                 transcript_cache)
+from backend.watcher import FolderWatcher
+
+# Etapas en orden; un archivo solo avanza
+CLAIMED     = "claimed"
+DECODED     = "decoded"
+TRANSCRIBED = "transcribed"
+WRITTEN     = "written"
+ARCHIVED    = "archived"
+FAILED      = "failed"
+
+
+class Manifest:
+    """JSON {clave de archivo: {stage, ...}} reescrito de forma atómica en cada cambio."""
+
+    def __init__(self, ruta: Path, keep: int = 1000):
+        self.ruta = Path(ruta)
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._datos: dict[str, dict] = {}
+        try:
+            self._datos = json.loads(self.ruta.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            pass
+
+    @staticmethod
+    def key(ruta: Path) -> str:
+        st = ruta.stat()
+        return f"{ruta.name}|{st.st_size}|{int(st.st_mtime)}"
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            d = self._datos.get(key)
+            return dict(d) if d else None
+
+    def update(self, key: str, **campos) -> None:
+        with self._lock:
+            d = self._datos.setdefault(key, {})
+            d.update(campos, updated_at=time.time())
+            if len(self._datos) > self.keep:
+                viejos = sorted(self._datos, key=lambda k: self._datos[k].get("updated_at", 0))
+                for k in viejos[: len(self._datos) - self.keep]:
+                    del self._datos[k]
+            self.ruta.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.ruta.with_suffix(".tmp")
+            tmp.write_text(json.dumps(self._datos, ensure_ascii=False, indent=1), encoding="utf-8")
+            os.replace(tmp, self.ruta)
+
+
+def _formatear(segundos: float) -> str:
+    elapsed = round(segundos)
+    return f"{elapsed // 60}m {elapsed % 60}s"
+
+
+_concurrencia_avisada = False
+
+
+def _avisar_concurrencia(planificador: FolderScheduler) -> None:
+    """Una vez por proceso: si los threads dejan un solo audio a la vez, decir por qué."""
+    global _concurrencia_avisada
+    if _concurrencia_avisada or planificador.max_jobs <= 1 or planificador.max_efectivo > 1:
+        return
+    _concurrencia_avisada = True
+    print(f"ℹ️ Modo carpeta: un audio a la vez ({planificador.threads_por_trabajo} de "
+          f"{planificador.threads} threads por audio); "
+          "para varios a la vez, TRANSCRIPTOTEM_BATCH_SIZE > 1 o TRANSCRIPTOTEM_FOLDER_JOB_THREADS", flush=True)
+
+
+class FolderPipeline:
+    def __init__(self, watcher: FolderWatcher, transcritas: Path, archivados: Path,
+                 manifest: Manifest, language: str, model: str, context: str = "",
+                 cache: bool = True, vad: Optional[bool] = None,
+                 prefetch: bool = True, segments: bool = False,
+                 engine: Optional[str] = None, priorities: Optional[dict] = None,
+                 index=None):
+        self.watcher = watcher
+        self.transcritas = transcritas
+        self.archivados = archivados
+        self.manifest = manifest
+        self.opts = dict(language_profile=language, model_name=model, context_text=context,
+                         use_cache=cache, vad=vad, engine=engine)
+        self.prefetch = prefetch
+        self.segments = segments  # emitir también eventos "segment" durante la inferencia
+        self.index = index        # search.SearchIndex: cada .txt escrito se indexa con sus tiempos
+        prioridades = {**leer_prioridades(watcher.carpeta / "prioridades.json"), **(priorities or {})}
+        self.planificador = FolderScheduler(
+            config.FOLDER_MAX_JOBS, config.FOLDER_MEMORY_MB * 1024 * 1024, config.THREADS,
+            threads_por_trabajo(get_engine(engine)), config.FOLDER_ORDER, prioridades)
+        self._duraciones: dict[Path, Optional[float]] = {}
+        self._sondeo: Optional[threading.Thread] = None
+        self._sondeo_lock = threading.Lock()
+        _avisar_concurrencia(self.planificador)
+
+    # ── etapas ────────────────────────────────────────────────
+
+    def _preparar(self, ruta: Path) -> dict:
+        """Etapa prefetch: corre en un hilo mientras se transcribe el audio anterior."""
+        key = Manifest.key(ruta)
+        previo = self.manifest.get(key) or {}
+        txt = self.transcritas / f"{ruta.stem}.txt"
+        if previo.get("stage") in (WRITTEN, ARCHIVED) and txt.exists():
+            return {"key": key, "reanudado": True, "txt": txt}
+
+        self.manifest.update(key, stage=CLAIMED, archivo=ruta.name)
+        timings: dict = {}
+        prep = {"key": key, "reanudado": False, "audio": None, "timings": timings}
+        with stage(timings, "probe"):
+            prep["duracion"] = self._duracion_de(ruta)
+        with stage(timings, "hash"):
+            prep["hash"] = sha256_archivo(ruta)
+        cacheado = self.opts["use_cache"] and transcript_cache.path(cache_key(
+            prep["hash"], self.opts["language_profile"], self.opts["model_name"],
+            self.opts["context_text"], self.opts["vad"], self.opts["engine"], stream=self.segments)).exists()
+        prep["cacheado"] = cacheado
+        if self.prefetch and not cacheado:
+            try:
+                with stage(timings, "decode"):
+                    prep["audio"] = load_audio_cached(ruta, prep["hash"], prep)
+                self.manifest.update(key, stage=DECODED)
+            except Exception as e:
+                print(f"⚠️ Prefetch de {ruta.name} falló, se decodificará al transcribir: {e}", flush=True)
+        return prep
+
+    @staticmethod
+    def _duracion(ruta: Path) -> Optional[float]:
+        try:
+            info = probe(ruta)
+        except OSError:
+            return None
+        return info["duration_s"] if info else None
+
+    def _duracion_de(self, ruta: Path) -> Optional[float]:
+        if ruta not in self._duraciones:
+            self._duraciones[ruta] = self._duracion(ruta)
+        return self._duraciones[ruta]
+
+    def _eta(self, duracion_s: Optional[float]) -> Optional[float]:
+        eta = estimate_eta(duracion_s, self.opts["model_name"], self.opts["engine"])
+        return eta["eta_s"] if eta else None
+
+    def _duracion_conocida(self, ruta: Path) -> float:
+        """Sin sondear: la ya sondeada o, mientras tanto, la estimada por tamaño."""
+        return self.planificador.duracion_estimada(ruta, self._duraciones.get(ruta))
+
+    def _eta_cola(self, rutas: list) -> float:
+        """ETA sumada de los audios que esperan turno (con las duraciones que ya se conocen)."""
+        return round(sum((self._eta(self._duracion_conocida(r)) or 0.0 for r in rutas if r is not None), 0.0), 1)
+
+    def _sondear_listos(self) -> None:
+        """
+        Sondea en un hilo aparte los audios listos que aún no tienen duración:
+        el primer trabajo no espera a un ffprobe por archivo, y el orden SJF
+        y la ETA se afinan a medida que llegan las duraciones.
+        """
+        with self._sondeo_lock:
+            if self._sondeo is not None and self._sondeo.is_alive():
+                return
+            faltan = [r for r in self.watcher.ready() if r not in self._duraciones]
+            if not faltan:
+                return
+            self._sondeo = threading.Thread(target=lambda: [self._duracion_de(r) for r in faltan],
+                                            name="folder-probe", daemon=True)
+            self._sondeo.start()
+
+    def _escribir(self, ruta: Path, key: str, text: Optional[str],
+                  segmentos: Optional[list] = None) -> dict:
+        """
+        Etapa E/S: .txt (+ índice de búsqueda) + mover a Archivados; libera
+        el archivo en el watcher. Devuelve los tiempos de escritura, indexado
+        y archivado.
+        """
+        timings: dict = {}
+        try:
+            if text is not None and text.strip():
+                txt_path = self.transcritas / f"{ruta.stem}.txt"
+                tmp = txt_path.with_suffix(".txt.part")
+                with stage(timings, "write"):
+                    self.transcritas.mkdir(parents=True, exist_ok=True)
+                    tmp.write_text(text, encoding="utf-8")
+                    os.replace(tmp, txt_path)
+                if self.index is not None:
+                    with stage(timings, "index"):
+                        try:
+                            self.index.add_file(txt_path, text, segmentos, origen="folder")
+                        except Exception as e:  # sin índice se puede vivir; sin .txt no
+                            print(f"⚠️ No se pudo indexar {txt_path.name}: {e}", flush=True)
+            self.manifest.update(key, stage=WRITTEN)
+            with stage(timings, "archive"):
+                self.archivados.mkdir(parents=True, exist_ok=True)
+                shutil.move(str(ruta), str(self.archivados / ruta.name))
+            self.manifest.update(key, stage=ARCHIVED)
+        except Exception as e:
+            self.manifest.update(key, stage=FAILED, error=str(e))
+            self.watcher.release(ruta, failed=True)
+            raise
+        self.watcher.release(ruta)
+        return timings
+
+    def _transcribir(self, ruta: Path, fut_prep: Future, emitir: Callable[[dict], None]) -> dict:
+        """
+        Etapa inferencia, en un hilo del pool: emite el progress inicial y
+        los segmentos; devuelve lo necesario para escribir el .txt.
+        """
+        t0 = time.time()
+        prep = fut_prep.result()
+        atajo = prep["reanudado"] or prep.get("cacheado")
+        emitir({"type": "progress", "archivo": ruta.name, "tiempo": None,
+                "duracion": prep.get("duracion"),
+                "eta_s": 0.0 if atajo else self._eta(prep.get("duracion"))})
+        info: dict = {}
+        segmentos: list = []
+        if prep["reanudado"]:
+            text = prep["txt"].read_text(encoding="utf-8")
+        else:
+            info = {"timings": prep["timings"]}
+            if self.segments:
+                for ev in transcribe_stream(audio_path=str(ruta), audio=prep["audio"],
+                                            audio_hash=prep["hash"], **self.opts):
+                    if ev["type"] == "segment":
+                        segmentos.append(ev)
+                        emitir(dict(ev, archivo=ruta.name))
+                    else:
+                        text = ev["text"]
+                        info.update(vad=ev["vad"], decode=ev["decode"], cached=ev["cached"],
+                                    redecode=ev.get("redecode"))
+                        info["timings"].update(ev["timings"])
+            else:
+                text, _, _ = transcribe(audio_path=str(ruta), info=info,
+                                        audio=prep["audio"], audio_hash=prep["hash"], **self.opts)
+                segmentos = info.get("segments") or []
+            prep["audio"] = None
+            TRANSCRIPTIONS.inc(source="folder", cached=bool(info.get("cached")))
+            self.manifest.update(prep["key"], stage=TRANSCRIBED)
+        return {"prep": prep, "text": text, "info": info, "segmentos": segmentos,
+                "tiempo": _formatear(time.time() - t0)}
+
+    def _reclamar(self, timeout: float, follow: bool = False) -> Optional[Path]:
+        """
+        El siguiente audio según el planificador, con las duraciones que ya
+        se conocen (el resto se estima por tamaño y se sondea en segundo plano).
+        """
+        self._sondear_listos()
+        return self.watcher.claim_next(
+            timeout, follow, orden=lambda r: self.planificador.puntaje(r, self._duraciones.get(r)))
+
+    # ── orquestación ──────────────────────────────────────────
+
+    def run(self, follow: bool = False, idle: float = 30.0) -> Iterator[dict]:
+        """
+        Genera eventos {"type": start|progress|error|done, ...}, los mismos
+        que ya consume el frontend (más "segment" si se pidió). Los progress
+        de cada archivo terminado llevan `timings` por etapa; la escritura y
+        el archivado, que ocurren después en el hilo de E/S, se añaden a los
+        `timings` de ese archivo en "resultados" del evento done. Con varios
+        audios en curso a la vez sus eventos se intercalan (cada uno lleva
+        `archivo`) y `done` cuenta los que ya salieron de la inferencia.
+        """
+        self.watcher.start()
+        self.watcher.refresh()
+        total = len(self.watcher.ready()) + self.watcher.pending_count()
+        yield {"type": "start", "total": total}
+
+        completados = 0
+        errores     = 0
+        hechos      = 0  # archivos que ya salieron de la inferencia, bien o con error
+        resultados  = []
+        i = 0
+        escrituras: list[tuple[Path, Future]] = []
+        reservados: set[Path] = set()  # reclamados al watcher y aún sin entregar a E/S
+        en_curso: dict[Future, Path] = {}
+        etas: dict[Path, tuple[float, float]] = {}  # en inferencia: (inicio, eta)
+        # (ruta, evento) que emiten los hilos de inferencia, o (ruta, Future) al terminar
+        eventos: queue.Queue = queue.Queue()
+
+        prefetcher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+        io = ThreadPoolExecutor(max_workers=1, thread_name_prefix="io")
+        inferencia = ThreadPoolExecutor(max_workers=self.planificador.max_jobs, thread_name_prefix="folder")
+
+        def drenar(esperar: bool):
+            nonlocal completados, errores
+            for ruta, fut in list(escrituras):
+                if not esperar and not fut.done():
+                    continue
+                escrituras.remove((ruta, fut))
+                try:
+                    tiempos_io = fut.result()
+                    completados += 1
+                    for r in resultados:
+                        if r["nombre"] == ruta.name:
+                            r["timings"].update(tiempos_io)
+                except Exception as e:
+                    count_error("folder_io", e)
+                    errores += 1
+                    resultados[:] = [r for r in resultados if r["nombre"] != ruta.name]
+                    yield {"type": "error", "archivo": ruta.name, "mensaje": f"E/S: {e}"}
+
+        def restante() -> float:
+            """ETA de lo que queda; los audios en curso comparten el dispositivo, así que se reparte."""
+            ahora = time.monotonic()
+            en_marcha = sum(max(0.0, eta - (ahora - t)) for t, eta in etas.values())
+            cola = self._eta_cola([siguiente, *self.watcher.ready()])
+            return round((en_marcha + cola) / max(1, len(etas)), 1)
+
+        siguiente: Optional[Path] = None
+        fut_siguiente: Optional[Future] = None
+
+        def reclamar(timeout: float) -> None:
+            nonlocal siguiente, fut_siguiente
+            siguiente = self._reclamar(timeout, follow)
+            fut_siguiente = prefetcher.submit(self._preparar, siguiente) if siguiente else None
+            if siguiente:
+                reservados.add(siguiente)
+
+        try:
+            reclamar(idle)
+            while siguiente is not None or en_curso:
+                # Se admite todo lo que quepa en el presupuesto; el siguiente se prepara mientras tanto
+                while siguiente is not None and self.planificador.reservar(siguiente, self._duraciones.get(siguiente)):
+                    i += 1
+                    ruta = siguiente
+                    fut = inferencia.submit(self._transcribir, ruta, fut_siguiente,
+                                            lambda ev, r=ruta: eventos.put((r, ev)))
+                    en_curso[fut] = ruta
+                    fut.add_done_callback(lambda f, r=ruta: eventos.put((r, f)))
+                    reclamar(0)
+                total = max(total, i + (1 if siguiente else 0)
+                            + len(self.watcher.ready()) + self.watcher.pending_count())
+
+                try:
+                    ruta, item = eventos.get(timeout=0.5)
+                except queue.Empty:
+                    ruta, item = None, None
+
+                if isinstance(item, Future):
+                    del en_curso[item]
+                    etas.pop(ruta, None)
+                    self.planificador.liberar(ruta)
+                    hechos += 1
+                    try:
+                        r = item.result()
+                        prep = r["prep"]
+                        texto = None if prep["reanudado"] else r["text"]
+                        escrituras.append((ruta, io.submit(self._escribir, ruta, prep["key"], texto, r["segmentos"])))
+                        reservados.discard(ruta)
+                        timings = prep.get("timings", {})
+                        tid = (self.index.id_archivo(f"{ruta.stem}.txt")
+                               if self.index is not None and r["text"].strip() else None)
+                        resultados.append({"nombre": ruta.name, "texto": r["text"], "tiempo": r["tiempo"],
+                                           "timings": timings, "transcript_id": tid})
+                        evento = {"type": "progress", "done": hechos, "total": total,
+                                  "archivo": ruta.name, "tiempo": r["tiempo"], "timings": dict(timings),
+                                  "eta_s": 0.0, "eta_restante_s": restante()}
+                        if prep["reanudado"]:
+                            evento["reanudado"] = True
+                        else:
+                            evento["vad"] = r["info"].get("vad")
+                            evento["decode"] = prep.get("decode") or r["info"].get("decode")
+                            evento["redecode"] = r["info"].get("redecode")
+                        yield evento
+                    except Exception as e:
+                        count_error("folder", e)
+                        errores += 1
+                        reservados.discard(ruta)
+                        self.watcher.release(ruta, failed=True)
+                        try:
+                            self.manifest.update(Manifest.key(ruta), stage=FAILED, error=str(e))
+                        except OSError:
+                            pass
+                        detalle = "".join(traceback.format_exception(type(e), e, e.__traceback__))
+                        print(f"\n❌ ERROR en {ruta.name}:\n{detalle}", flush=True)
+                        yield {"type": "error", "archivo": ruta.name, "mensaje": str(e)}
+                elif item is not None:
+                    if item["type"] == "progress":
+                        etas[ruta] = (time.monotonic(), item.get("eta_s") or 0.0)
+                        item = dict(item, done=hechos, total=total, eta_restante_s=restante())
+                    yield item
+
+                yield from drenar(esperar=False)
+
+                if siguiente is None:
+                    # Sin nada en curso se espera a que llegue algo (o a que termine de sincronizarse)
+                    reclamar(0 if en_curso else idle)
+
+            yield from drenar(esperar=True)
+        finally:
+            # Si el cliente se desconecta, los audios reservados vuelven a estar disponibles
+            inferencia.shutdown(wait=True, cancel_futures=True)
+            prefetcher.shutdown(wait=True, cancel_futures=True)
+            io.shutdown(wait=True)
+            for ruta in en_curso.values():
+                self.planificador.liberar(ruta)
+            for ruta in reservados:
+                self.watcher.release(ruta)
+
+        if total == 0 and i == 0:
+            return
+        yield {"type": "done", "total": max(total, i),
+               "completados": completados, "errores": errores,
+               "resultados": resultados, "scheduler": self.planificador.stats()}
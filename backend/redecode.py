@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+Segunda pasada selectiva sobre los segmentos de baja confianza.
+
+Los motores devuelven por segmento `avg_logprob`, `compression_ratio` y
+`no_speech_prob`. Un segmento es dudoso con los mismos criterios con que
+Whisper decide repetir una ventana: logprob medio < -1 o compresión > 2.4
+(texto repetido). En vez de
+borrar líneas después (_clean_transcript) o repetir el archivo entero con
+otros ajustes, se re-decodifican solo las ventanas de esos segmentos
+(juntando los contiguos, con un margen y ≤30 s):
+  - con temperaturas crecientes (TRANSCRIPTOTEM_REDECODE_TEMPERATURES),
+    como el fallback de Whisper, o
+  - con un modelo mayor (TRANSCRIPTOTEM_REDECODE_MODEL) y luego esas
+    temperaturas,
+hasta que el resultado pase los umbrales. Si ningún intento mejora el
+logprob medio, se conserva el original; si el tramo era silencio
+(no_speech_prob alto) y la nueva pasada no encuentra voz, se quita. Lo re-procesado se acota a
+TRANSCRIPTOTEM_REDECODE_MAX_RATIO del audio (primero lo peor) y se
+registra: segmentos, segundos de audio y fracción del total.
+"""
+import time
+from typing import Callable, Optional
+
+from backend import config
+from backend.metrics import Counter, observe_stage
+
+SAMPLE_RATE = 16000
+MARGEN_S = 0.5
+VENTANA_MAX_S = 30.0
+
+REDECODE_AUDIO = Counter("transcriptotem_redecode_audio_seconds_total",
+                         "Segundos de audio re-decodificados por baja confianza", ("engine",))
+REDECODE_SEGMENTS = Counter("transcriptotem_redecode_segments_total",
+                            "Segmentos dudosos por resultado de la segunda pasada", ("outcome",))
+
+
+def es_dudoso(seg: dict) -> bool:
+    if not (seg.get("text") or "").strip():
+        return False
+    cr = seg.get("compression_ratio")
+    lp = seg.get("avg_logprob")
+    return ((cr is not None and cr > config.REDECODE_COMPRESSION)
+            or (lp is not None and lp < config.REDECODE_LOGPROB))
+
+
+def _aceptable(segs: list[dict]) -> bool:
+    return all(not es_dudoso(s) for s in segs)
+
+
+def _logprob(segs: list[dict]) -> float:
+    """Logprob medio ponderado por duración; -inf si no hay con qué medir."""
+    pares = [(s["end"] - s["start"], s["avg_logprob"]) for s in segs
+             if s.get("avg_logprob") is not None and s["end"] > s["start"]]
+    total = sum(d for d, _ in pares)
+    return sum(d * lp for d, lp in pares) / total if total else float("-inf")
+
+
+def ventanas_dudosas(segments: list[dict], duracion_s: float) -> list[tuple[float, float, list[int]]]:
+    """(inicio, fin, índices de segmentos) a re-decodificar: dudosos contiguos juntos, ≤30 s."""
+    ventanas: list[tuple[float, float, list[int]]] = []
+    for i, seg in enumerate(segments):
+        if not es_dudoso(seg):
+            continue
+        ini = max(0.0, seg["start"] - MARGEN_S)
+        fin = min(duracion_s, seg["end"] + MARGEN_S)
+        if ventanas:
+            a, b, idx = ventanas[-1]
+            if idx[-1] == i - 1 and fin - a <= VENTANA_MAX_S:
+                ventanas[-1] = (a, fin, idx + [i])
+                continue
+        if fin - ini > VENTANA_MAX_S:  # un segmento larguísimo: se mira solo su comienzo
+            fin = ini + VENTANA_MAX_S
+        ventanas.append((ini, fin, [i]))
+    return ventanas
+
+
+def _intentos(model_name: str) -> list[tuple[str, float]]:
+    temperaturas = config.REDECODE_TEMPERATURES
+    if config.REDECODE_MODEL:
+        return [(config.REDECODE_MODEL, 0.0)] + [(config.REDECODE_MODEL, t) for t in temperaturas]
+    return [(model_name, t) for t in temperaturas]
+
+
+def redecodificar(engine, audio, segments: list[dict], lang_code: str, initial_prompt: str,
+                  model_name: str, language_profile: str, timings: Optional[dict] = None,
+                  presupuesto_s: Optional[float] = None,
+                  registrar: bool = True,
+                  check_cancel: Optional[Callable[[], None]] = None) -> tuple[list[dict], Optional[dict]]:
+    """
+    Devuelve (segmentos, estadísticas). `segments` deben estar en tiempos
+    de `audio` (antes de recolocar el VAD). Estadísticas None si no había
+    nada dudoso; si no, {segments, windows, replaced, audio_s, total_s,
+    ratio, seconds, attempts, strategy}. `presupuesto_s` sustituye al tope
+    de REDECODE_MAX_RATIO (el streaming lo reparte entre sus ventanas).
+    `check_cancel` se llama antes de cada intento.
+    """
+    if not config.REDECODE or isinstance(audio, str) or not len(audio) or not segments:
+        return segments, None
+    duracion = len(audio) / SAMPLE_RATE
+    ventanas = ventanas_dudosas(segments, duracion)
+    if not ventanas:
+        return segments, None
+
+    # Lo peor primero, hasta el tope de audio re-procesado
+    ventanas.sort(key=lambda v: _logprob([segments[i] for i in v[2]]))
+    tope = config.REDECODE_MAX_RATIO * duracion if presupuesto_s is None else presupuesto_s
+    elegidas, acumulado = [], 0.0
+    for v in ventanas:
+        if acumulado + (v[1] - v[0]) > tope:
+            continue
+        elegidas.append(v)
+        acumulado += v[1] - v[0]
+
+    t0 = time.perf_counter()
+    reemplazos: dict[int, list[dict]] = {}  # índice del primer segmento -> segmentos nuevos
+    quitar: set[int] = set()
+    intentos = 0
+    for ini, fin, idx in elegidas:
+        originales = [segments[i] for i in idx]
+        mejor, mejor_lp = None, _logprob(originales)
+        a, b = int(ini * SAMPLE_RATE), int(fin * SAMPLE_RATE)
+        for modelo, temperatura in _intentos(model_name):
+            if check_cancel is not None:
+                check_cancel()
+            intentos += 1
+            try:
+                _, _, nuevos = engine.transcribe(audio[a:b], lang_code, initial_prompt, modelo,
+                                                 language_profile, temperature=temperatura)
+            except Exception as e:
+                print(f"⚠️ Re-decodificación con {modelo} falló: {e}", flush=True)
+                break
+            # Solo cuenta lo que cae en el tramo de los originales (sin los márgenes)
+            desde, hasta = originales[0]["start"], originales[-1]["end"]
+            nuevos = [s for s in nuevos if ini + s.get("start", 0.0) < hasta and ini + s.get("end", 0.0) > desde]
+            for s in nuevos:
+                s["start"] = round(max(desde, ini + s.get("start", 0.0)), 3)
+                s["end"] = round(min(hasta, ini + s.get("end", 0.0)), 3)
+            if not nuevos:
+                if all((s.get("no_speech_prob") or 0) > config.REDECODE_NO_SPEECH for s in originales):
+                    mejor = []  # era texto inventado sobre silencio
+                    break
+                continue
+            lp = _logprob(nuevos)
+            if _aceptable(nuevos):
+                mejor = nuevos
+                break
+            if lp > mejor_lp:
+                mejor, mejor_lp = nuevos, lp
+        if mejor is None:
+            REDECODE_SEGMENTS.inc(len(idx), outcome="kept")
+            continue
+        REDECODE_SEGMENTS.inc(len(idx), outcome="replaced")
+        quitar.update(idx)
+        reemplazos[idx[0]] = mejor
+
+    resultado: list[dict] = []
+    for i, seg in enumerate(segments):
+        if i in reemplazos:
+            resultado.extend(reemplazos[i])
+        if i not in quitar:
+            resultado.append(seg)
+    segundos = time.perf_counter() - t0
+    observe_stage(timings, "redecode", segundos)
+    REDECODE_AUDIO.inc(acumulado, engine=engine.name)
+    n_dudosos = sum(len(v[2]) for v in ventanas)
+    stats = {
+        "strategy": "model" if config.REDECODE_MODEL else "temperature",
+        "segments": n_dudosos,
+        "windows": len(elegidas),
+        "replaced": len(reemplazos),
+        "audio_s": round(acumulado, 2),
+        "total_s": round(duracion, 2),
+        "ratio": round(acumulado / duracion, 4) if duracion else 0.0,
+        "seconds": round(segundos, 3),
+        "attempts": intentos,
+    }
+    if registrar:
+        registrar_stats(stats)
+    return resultado, stats
+
+
+def registrar_stats(stats: dict) -> None:
+    """Una línea en el log con lo re-procesado y su fracción del audio."""
+    print(f"Re-decodificación: {stats['segments']} segmentos dudosos, {stats['audio_s']:.1f}s de "
+          f"{stats['total_s']:.0f}s ({stats['ratio']:.1%}) en {stats['windows']} ventanas, "
+          f"{stats['replaced']} reemplazadas, {stats['seconds']:.1f}s", flush=True)
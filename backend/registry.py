@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+Registro de modelos Whisper residentes en memoria.
+
+En vez de un único modelo global que se descarta al cambiar de tamaño en
+la UI, se mantienen varios cargados mientras quepan en un presupuesto de
+RAM (TRANSCRIPTOTEM_MODEL_BUDGET_MB). Al superarlo se expulsa el menos
+usado recientemente. Cada entrada guarda su tiempo de carga, el de la
+inferencia de calentamiento y la memoria que ocupa.
+"""
+import gc
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Optional
+
+# Tamaño aproximado de los pesos (MB) para decidir expulsiones ANTES de
+# cargar; tras la carga se usa el tamaño medido.
+TAMANO_ESTIMADO_MB = {
+    "tiny": 75,
+    "base": 145,
+    "small": 485,
+    "medium": 1530,
+    "large-v3-turbo": 1620,
+    "turbo": 1620,
+    "large": 3090,
+}
+
+
+def estimar_mb(nombre: str) -> int:
+    n = nombre.lower()
+    for clave in sorted(TAMANO_ESTIMADO_MB, key=len, reverse=True):
+        if clave in n:
+            return TAMANO_ESTIMADO_MB[clave]
+    return 1500
+
+
+def medir_bytes(model) -> Optional[int]:
+    """Bytes de los parámetros de un modelo torch o MLX (None si no se sabe)."""
+    try:
+        params = getattr(model, "parameters", None)
+        if params is None:
+            return None
+        valores = params()
+        if isinstance(valores, dict):  # MLX: árbol de mx.array
+            from mlx.utils import tree_flatten
+            return int(sum(v.nbytes for _, v in tree_flatten(valores)))
+        return int(sum(p.numel() * p.element_size() for p in valores))  # torch
+    except Exception:
+        return None
+
+
+@dataclass
+class ModeloCargado:
+    engine: str
+    name: str
+    model: Any
+    bytes: int
+    load_s: float
+    warmup_s: Optional[float] = None
+    loaded_at: float = field(default_factory=time.time)
+    last_used: float = field(default_factory=time.time)
+    uses: int = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "engine": self.engine,
+            "name": self.name,
+            "memory_mb": round(self.bytes / (1024 * 1024), 1),
+            "load_s": round(self.load_s, 2),
+            "warmup_s": round(self.warmup_s, 2) if self.warmup_s is not None else None,
+            "loaded_at": self.loaded_at,
+            "last_used": self.last_used,
+            "uses": self.uses,
+        }
+
+
+@dataclass
+class _Carga:
+    """Lock de carga de un modelo y cuántos hilos lo usan (para soltarlo al terminar)."""
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    hilos: int = 0
+
+
+class ModelRegistry:
+    """
+    `on_evict(engine, name)` se llama tras expulsar un modelo, fuera del
+    lock: para soltar referencias que el motor guarde por su cuenta
+    (ModelHolder de mlx_whisper) y vaciar cachés del dispositivo.
+    """
+
+    def __init__(self, budget_bytes: int, on_evict: Optional[Callable[[str, str], None]] = None):
+        self.budget_bytes = budget_bytes
+        self.on_evict = on_evict
+        self._modelos: dict[tuple[str, str], ModeloCargado] = {}
+        self._lock = threading.Lock()
+        # Un lock por modelo: dos peticiones del mismo modelo no lo cargan dos veces
+        self._cargando: dict[tuple[str, str], _Carga] = {}
+
+    def get(self, engine: str, name: str, loader: Callable[[], Any],
+            warmup: Optional[Callable[[Any], None]] = None) -> Any:
+        key = (engine, name)
+        with self._lock:
+            entrada = self._modelos.get(key)
+            if entrada is not None:
+                entrada.last_used = time.time()
+                entrada.uses += 1
+                return entrada.model
+            carga = self._cargando.setdefault(key, _Carga())
+            carga.hilos += 1
+        try:
+            return self._cargar(key, carga.lock, loader, warmup)
+        finally:
+            with self._lock:
+                carga.hilos -= 1
+                if not carga.hilos:
+                    del self._cargando[key]
+
+    def _cargar(self, key: tuple[str, str], lock_carga: threading.Lock, loader: Callable[[], Any],
+                warmup: Optional[Callable[[Any], None]]) -> Any:
+        engine, name = key
+        with lock_carga:
+            with self._lock:
+                entrada = self._modelos.get(key)
+                if entrada is not None:
+                    entrada.last_used = time.time()
+                    entrada.uses += 1
+                    return entrada.model
+                expulsados = self._liberar(estimar_mb(name) * 1024 * 1024, excepto=key)
+            self._tras_expulsar(expulsados)
+
+            t0 = time.perf_counter()
+            model = loader()
+            load_s = time.perf_counter() - t0
+            entrada = ModeloCargado(engine=engine, name=name, model=model,
+                                    bytes=medir_bytes(model) or estimar_mb(name) * 1024 * 1024,
+                                    load_s=load_s, uses=1)
+            if warmup is not None:
+                t0 = time.perf_counter()
+                try:
+                    warmup(model)
+                    entrada.warmup_s = time.perf_counter() - t0
+                except Exception as e:
+                    print(f"⚠️ Calentamiento de {name} falló: {e}", flush=True)
+
+            with self._lock:
+                self._modelos[key] = entrada
+                expulsados = self._liberar(0, excepto=key)
+            self._tras_expulsar(expulsados)
+            print(f"✓ Modelo {engine}:{name} cargado en {load_s:.1f}s "
+                  f"({entrada.bytes / 1e6:.0f} MB)", flush=True)
+            return model
+
+    def _liberar(self, necesarios: int, excepto: tuple[str, str]) -> list[tuple[str, str]]:
+        """
+        Expulsa modelos LRU hasta que `necesarios` bytes quepan en el
+        presupuesto. Se llama con self._lock tomado; devuelve lo expulsado
+        para pasárselo a _tras_expulsar() ya fuera del lock.
+        """
+        expulsados = []
+        while self._modelos:
+            usados = sum(m.bytes for m in self._modelos.values())
+            if usados + necesarios <= self.budget_bytes:
+                break
+            candidatos = [m for k, m in self._modelos.items() if k != excepto]
+            if not candidatos:
+                break
+            viejo = min(candidatos, key=lambda m: m.last_used)
+            del self._modelos[(viejo.engine, viejo.name)]
+            print(f"↓ Modelo {viejo.engine}:{viejo.name} expulsado (presupuesto de memoria)", flush=True)
+            expulsados.append((viejo.engine, viejo.name))
+        return expulsados
+
+    def _tras_expulsar(self, expulsados: list[tuple[str, str]]) -> None:
+        if not expulsados:
+            return
+        gc.collect()
+        if self.on_evict is not None:
+            for engine, name in expulsados:
+                try:
+                    self.on_evict(engine, name)
+                except Exception as e:
+                    print(f"⚠️ Liberación de {engine}:{name} falló: {e}", flush=True)
+
+    def evict(self, engine: str, name: str) -> bool:
+        with self._lock:
+            eliminado = self._modelos.pop((engine, name), None) is not None
+        if eliminado:
+            self._tras_expulsar([(engine, name)])
+        return eliminado
+
+    def list(self) -> list[dict]:
+        with self._lock:
+            return [m.to_dict() for m in sorted(self._modelos.values(),
+                                                key=lambda m: m.last_used, reverse=True)]
+
+    def used_bytes(self) -> int:
+        with self._lock:
+            return sum(m.bytes for m in self._modelos.values())
@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+Planificador del modo carpeta: qué audio va primero y cuántos a la vez.
+
+Orden: el trabajo más corto primero (SJF) según la duración sondeada
+(ffprobe, cacheada), dividida por la prioridad del archivo. Una clase de
+tres horas que llega primera ya no retiene veinte de diez minutos: el
+tiempo medio hasta tener cada .txt baja mucho y el total no cambia. Con
+TRANSCRIPTOTEM_FOLDER_ORDER=name se vuelve al orden alfabético.
+
+Prioridades: {patrón: peso} con comodines sobre el nombre del archivo
+("Microeconomía*", "*prueba*"), del archivo prioridades.json de la
+carpeta Pendientes y/o de la petición. Peso 2 = pasa por delante de un
+audio de la mitad de duración; sin patrón que coincida, 1.
+
+Concurrencia: cada trabajo reserva memoria (audio decodificado y copia
+comprimida por el VAD, más activaciones) y threads de cómputo; se admiten
+trabajos mientras quepan en el presupuesto (TRANSCRIPTOTEM_FOLDER_MEMORY_MB,
+TRANSCRIPTOTEM_THREADS), hasta TRANSCRIPTOTEM_FOLDER_MAX_JOBS, como hace
+MLX_GPU_MEMORY_LIMIT con la memoria de la GPU. Un trabajo que no cabe solo
+entra igualmente si no hay otro en curso. Sin lotes entre peticiones
+(TRANSCRIPTOTEM_BATCH_SIZE=1) cada inferencia ocupa todos los threads y la
+concurrencia efectiva es 1, salvo que TRANSCRIPTOTEM_FOLDER_JOB_THREADS
+reparta los threads a mano.
+"""
+import fnmatch
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Optional
+
+from backend import config
+
+# Por segundo de audio: PCM float32 16 kHz (64 KB) + la copia sin silencios del VAD
+BYTES_POR_SEGUNDO = 2 * 16000 * 4
+# Activaciones, mel y buffers del motor por trabajo en curso
+BYTES_FIJOS = 256 * 1024 * 1024
+# Sin duración (ffprobe falló), se estima por tamaño como un audio de ~128 kbps
+BYTES_ARCHIVO_POR_SEGUNDO = 16000
+
+
+def leer_prioridades(ruta: Path) -> dict[str, float]:
+    """prioridades.json de la carpeta ({patrón: peso}); vacío si no hay o no se puede leer."""
+    try:
+        datos = json.loads(Path(ruta).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(datos, dict):
+        return {}
+    return {str(k): float(v) for k, v in datos.items() if isinstance(v, (int, float)) and v > 0}
+
+
+class FolderScheduler:
+    def __init__(self, max_jobs: int, memoria_bytes: int, threads: int, threads_por_trabajo: int,
+                 orden: str = "sjf", prioridades: Optional[dict[str, float]] = None):
+        self.max_jobs = max(1, max_jobs)
+        self.memoria_bytes = memoria_bytes
+        self.threads = max(1, threads)
+        self.threads_por_trabajo = min(self.threads, max(1, threads_por_trabajo))
+        self.orden = orden if orden in ("sjf", "name") else "sjf"
+        self.prioridades = prioridades or {}
+        self._lock = threading.Lock()
+        self._reservas: dict[Path, int] = {}
+        self.max_simultaneos = 0
+
+    # ── orden ─────────────────────────────────────────────────
+
+    def prioridad(self, ruta: Path) -> float:
+        """El peso más alto entre los patrones que coinciden con el nombre (1 si ninguno)."""
+        nombre = Path(ruta).name.lower()
+        pesos = [p for patron, p in self.prioridades.items() if fnmatch.fnmatch(nombre, patron.lower())]
+        return max(pesos) if pesos else 1.0
+
+    @staticmethod
+    def duracion_estimada(ruta: Path, duracion_s: Optional[float]) -> float:
+        if duracion_s:
+            return duracion_s
+        try:
+            return os.path.getsize(ruta) / BYTES_ARCHIVO_POR_SEGUNDO
+        except OSError:
+            return 0.0
+
+    def puntaje(self, ruta: Path, duracion_s: Optional[float]) -> tuple:
+        """Clave de orden: menor = antes."""
+        if self.orden == "name":
+            return (Path(ruta).name,)
+        return (self.duracion_estimada(ruta, duracion_s) / self.prioridad(ruta), Path(ruta).name)
+
+    # ── presupuesto ───────────────────────────────────────────
+
+    def coste(self, ruta: Path, duracion_s: Optional[float]) -> int:
+        return BYTES_FIJOS + int(self.duracion_estimada(ruta, duracion_s) * BYTES_POR_SEGUNDO)
+
+    def reservar(self, ruta: Path, duracion_s: Optional[float]) -> bool:
+        """Admite el trabajo si cabe en memoria, threads y número máximo (o si no hay ninguno en curso)."""
+        coste = self.coste(ruta, duracion_s)
+        with self._lock:
+            n = len(self._reservas)
+            if n:
+                if n >= self.max_jobs:
+                    return False
+                if (n + 1) * self.threads_por_trabajo > self.threads:
+                    return False
+                if sum(self._reservas.values()) + coste > self.memoria_bytes:
+                    return False
+            self._reservas[ruta] = coste
+            self.max_simultaneos = max(self.max_simultaneos, len(self._reservas))
+            return True
+
+    def liberar(self, ruta: Path) -> None:
+        with self._lock:
+            self._reservas.pop(ruta, None)
+
+    @property
+    def max_efectivo(self) -> int:
+        """Trabajos a la vez que permiten los threads (la memoria depende de cada audio)."""
+        return max(1, min(self.max_jobs, self.threads // self.threads_por_trabajo))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"order": self.orden, "max_jobs": self.max_jobs,
+                    "effective_max_jobs": self.max_efectivo,
+                    "memory_mb": self.memoria_bytes // (1024 * 1024),
+                    "threads": self.threads, "threads_per_job": self.threads_por_trabajo,
+                    "running": len(self._reservas),
+                    "reserved_mb": sum(self._reservas.values()) // (1024 * 1024),
+                    "max_concurrent": self.max_simultaneos}
+
+
+def threads_por_trabajo(engine) -> int:
+    """
+    Threads que ocupa cada transcripción. Con lotes entre peticiones el
+    dispositivo lo comparten todas (cada una solo calcula mels y VAD); sin
+    lotes cada inferencia ya usa todos los threads y dos a la vez solo se
+    estorban. TRANSCRIPTOTEM_FOLDER_JOB_THREADS > 0 lo fija a mano.
+    """
+    if config.FOLDER_JOB_THREADS > 0:
+        return config.FOLDER_JOB_THREADS
+    if config.BATCH_SIZE > 1 and engine.supports_batch:
+        return 1
+    return config.THREADS
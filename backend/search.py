@@ -0,0 +1,396 @@
+# -*- coding: utf-8 -*-
+"""
+Índice de búsqueda sobre las transcripciones (SQLite FTS5).
+
+Encontrar en qué clase se habló de un concepto era abrir y recorrer cada
+.txt de Transcritas. Aquí cada transcripción se parte en pasajes de unos
+TRANSCRIPTOTEM_SEARCH_PASSAGE_SECONDS (segmentos consecutivos de Whisper,
+con su inicio y fin) y se guarda en un índice invertido FTS5 persistente
+en DATA_DIR/search.db:
+  - tokenizador unicode61 con remove_diacritics: "economia" encuentra
+    "economía" y al revés, sin distinguir mayúsculas;
+  - consultas con frases entre comillas, prefijos (margin*) y exclusiones
+    (-oferta); el resto de la puntuación se ignora, así que nada de lo que
+    escriba el usuario es un error de sintaxis de FTS5;
+  - resultados ordenados por BM25, con un fragmento resaltado y los
+    tiempos del pasaje.
+El índice se actualiza al escribir cada transcripción (modo carpeta, en
+vivo, /api/transcribe y la cola de trabajos) y sync() lo pone al día con
+la carpeta comparando tamaño y mtime: los .txt nuevos o editados a mano se
+indexan sin tiempos (solo se conocen los segmentos al transcribir) y los
+borrados salen del índice. Las transcripciones subidas desde el navegador
+no tienen archivo: su texto se guarda en el propio índice.
+"""
+import html
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from pathlib import Path
+from typing import Optional
+
+from backend.cache import clave
+
+PALABRAS_POR_PASAJE = 60  # sin segmentos (.txt sueltos), pasajes por número de palabras
+
+_RE_TERMINO = re.compile(r'(-?)"([^"]*)"?|(-?)(\S+)')
+_RE_PALABRA = re.compile(r"\w+")
+_RE_ORACION = re.compile(r"(?<=[.!?…])\s+|\n+")
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS transcripts (
+    id         TEXT PRIMARY KEY,
+    name       TEXT NOT NULL,
+    source     TEXT NOT NULL,
+    path       TEXT,              -- NULL: sin archivo, el texto va en `text`
+    size       INTEGER,
+    mtime_ns   INTEGER,
+    text       TEXT,
+    n_passages INTEGER NOT NULL,
+    duration_s REAL,
+    indexed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transcripts_path ON transcripts(path);
+CREATE TABLE IF NOT EXISTS passage_meta (
+    id            INTEGER PRIMARY KEY,  -- = rowid en passages
+    transcript_id TEXT NOT NULL,
+    start         REAL,
+    end           REAL
+);
+CREATE INDEX IF NOT EXISTS passage_meta_transcript ON passage_meta(transcript_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS passages USING fts5(
+    text, tokenize = "unicode61 remove_diacritics 2", prefix = '2 3'
+);
+"""
+
+
+def _terminos(q: str) -> tuple[list[tuple[list[str], bool]], list[tuple[list[str], bool]]]:
+    """(positivos, negativos) de la consulta: cada término es (palabras, es_prefijo)."""
+    positivos, negativos = [], []
+    for m in _RE_TERMINO.finditer(q or ""):
+        if m.group(2) is not None:
+            negar, texto, frase = m.group(1), m.group(2), True
+        else:
+            negar, texto, frase = m.group(3), m.group(4), False
+        palabras = _RE_PALABRA.findall(texto)
+        if palabras:
+            (negativos if negar else positivos).append((palabras, not frase and texto.endswith("*")))
+    return positivos, negativos
+
+
+def consulta_fts(q: str) -> str:
+    """
+    Texto del usuario a una expresión FTS5 segura: palabras sueltas (todas
+    deben aparecer), "frases exactas", prefijo* y -exclusiones. ValueError
+    si no queda ningún término que buscar.
+    """
+    positivos, negativos = _terminos(q)
+    if not positivos:
+        raise ValueError("La búsqueda necesita al menos una palabra (no solo exclusiones)")
+
+    def expr(termino: tuple[list[str], bool]) -> str:
+        palabras, prefijo = termino
+        return '"' + " ".join(palabras) + '"' + ("*" if prefijo else "")
+
+    return " AND ".join(map(expr, positivos)) + "".join(f" NOT {expr(n)}" for n in negativos)
+
+
+def _plegar(palabra: str) -> str:
+    """Como el tokenizador: minúsculas y sin tildes."""
+    return "".join(c for c in unicodedata.normalize("NFD", palabra.lower()) if not unicodedata.combining(c))
+
+
+def fragmento(texto: str, q: str, palabras: int = 32) -> str:
+    """
+    Unas `palabras` alrededor de la primera coincidencia, en HTML: texto
+    escapado y las palabras buscadas en <mark>. Se arma aquí y no con
+    snippet() de FTS5, que con prefijos vuelve a recorrer la lista entera
+    de documentos por cada resultado.
+    """
+    positivos, _ = _terminos(q)
+    exactas = {_plegar(p) for ps, prefijo in positivos for p in (ps if not prefijo else ps[:-1])}
+    prefijos = tuple(_plegar(ps[-1]) for ps, prefijo in positivos if prefijo)
+    tokens = list(_RE_PALABRA.finditer(texto))
+    coincide = [(_plegar(t.group()) in exactas or _plegar(t.group()).startswith(prefijos))
+                for t in tokens]
+    primera = coincide.index(True) if True in coincide else 0
+    desde = max(0, min(primera - palabras // 4, len(tokens) - palabras))
+    hasta = min(len(tokens), desde + palabras)
+    if not tokens:
+        return html.escape(texto)
+    partes, cursor = [], tokens[desde].start() if desde else 0
+    for t, si in zip(tokens[desde:hasta], coincide[desde:hasta]):
+        partes.append(html.escape(texto[cursor:t.start()]))
+        partes.append(f"<mark>{html.escape(t.group())}</mark>" if si else html.escape(t.group()))
+        cursor = t.end()
+    fin = len(texto) if hasta == len(tokens) else cursor
+    partes.append(html.escape(texto[cursor:fin]))
+    return ("…" if desde else "") + "".join(partes).strip() + ("…" if hasta < len(tokens) else "")
+
+
+def pasajes(texto: str, segmentos: Optional[list[dict]], max_s: float) -> list[tuple[str, Optional[float], Optional[float]]]:
+    """(texto, inicio, fin) de cada pasaje: segmentos consecutivos hasta `max_s`, o grupos de oraciones."""
+    from backend.transcriber import _clean_transcript
+    salida: list[tuple[str, Optional[float], Optional[float]]] = []
+    if segmentos:
+        actual: list[str] = []
+        inicio = fin = None
+        for seg in segmentos:
+            t = _clean_transcript(seg.get("text", ""))
+            if not t:
+                continue
+            if actual and seg.get("end", 0.0) - inicio > max_s:
+                salida.append((" ".join(actual), inicio, fin))
+                actual = []
+            if not actual:
+                inicio = seg.get("start", 0.0)
+            actual.append(t)
+            fin = seg.get("end", inicio)
+        if actual:
+            salida.append((" ".join(actual), inicio, fin))
+        return salida
+    actual, n = [], 0
+    for oracion in _RE_ORACION.split(texto):
+        oracion = oracion.strip()
+        if not oracion:
+            continue
+        actual.append(oracion)
+        n += len(oracion.split())
+        if n >= PALABRAS_POR_PASAJE:
+            salida.append((" ".join(actual), None, None))
+            actual, n = [], 0
+    if actual:
+        salida.append((" ".join(actual), None, None))
+    return salida
+
+
+class SearchIndex:
+    def __init__(self, ruta: Path, carpeta: Path, pasaje_s: float = 15.0, sync_s: float = 30.0,
+                 max_ranqueo: int = 10000):
+        self.ruta = Path(ruta)
+        self.carpeta = Path(carpeta)
+        self.pasaje_s = pasaje_s
+        self.sync_s = sync_s
+        self.max_ranqueo = max(1, max_ranqueo)
+        self._local = threading.local()
+        self._sync_lock = threading.Lock()
+        self._ultimo_sync: Optional[float] = None
+        self._ultimo_resultado: Optional[dict] = None
+
+    def _conexion(self) -> sqlite3.Connection:
+        """Una conexión por hilo; WAL deja leer mientras otro worker escribe."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.ruta.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.ruta, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_ESQUEMA)
+            self._local.conn = conn
+        return conn
+
+    # ── escritura ─────────────────────────────────────────────
+
+    @staticmethod
+    def id_archivo(nombre: str) -> str:
+        return clave("transcript", "file", nombre)[:16]
+
+    def add_file(self, ruta: Path, texto: Optional[str] = None, segmentos: Optional[list[dict]] = None,
+                 origen: str = "folder") -> str:
+        """Indexa (o re-indexa) un .txt de la carpeta; `texto` evita volver a leerlo."""
+        ruta = Path(ruta)
+        st = ruta.stat()
+        if texto is None:
+            texto = ruta.read_text(encoding="utf-8", errors="replace")
+        tid = self.id_archivo(ruta.name)
+        self._guardar(tid, ruta.name, origen, texto, segmentos, ruta=str(ruta),
+                      size=st.st_size, mtime_ns=st.st_mtime_ns)
+        return tid
+
+    def add_text(self, nombre: str, texto: str, segmentos: Optional[list[dict]] = None,
+                 origen: str = "upload") -> Optional[str]:
+        """Indexa una transcripción sin archivo (subida desde el navegador). None si está vacía."""
+        if not texto.strip():
+            return None
+        tid = clave("transcript", origen, nombre, texto)[:16]
+        self._guardar(tid, nombre, origen, texto, segmentos, guardar_texto=True)
+        return tid
+
+    def _guardar(self, tid: str, nombre: str, origen: str, texto: str, segmentos: Optional[list[dict]],
+                 ruta: Optional[str] = None, size: Optional[int] = None, mtime_ns: Optional[int] = None,
+                 guardar_texto: bool = False) -> None:
+        filas = pasajes(texto, segmentos, self.pasaje_s)
+        duracion = max((s.get("end") or 0.0 for s in segmentos), default=None) if segmentos else None
+        conn = self._conexion()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._borrar(conn, tid)
+            base = conn.execute("SELECT coalesce(max(id), 0) FROM passage_meta").fetchone()[0] + 1
+            conn.executemany("INSERT INTO passage_meta (id, transcript_id, start, end) VALUES (?, ?, ?, ?)",
+                             [(base + i, tid, a, b) for i, (_, a, b) in enumerate(filas)])
+            conn.executemany("INSERT INTO passages (rowid, text) VALUES (?, ?)",
+                             [(base + i, t) for i, (t, _, _) in enumerate(filas)])
+            conn.execute("INSERT INTO transcripts (id, name, source, path, size, mtime_ns, text, n_passages, "
+                         "duration_s, indexed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                         (tid, nombre, origen, ruta, size, mtime_ns, texto if guardar_texto else None,
+                          len(filas), duracion, time.time()))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _borrar(conn: sqlite3.Connection, tid: str) -> None:
+        conn.execute("DELETE FROM passages WHERE rowid IN "
+                     "(SELECT id FROM passage_meta WHERE transcript_id = ?)", (tid,))
+        conn.execute("DELETE FROM passage_meta WHERE transcript_id = ?", (tid,))
+        conn.execute("DELETE FROM transcripts WHERE id = ?", (tid,))
+
+    def remove(self, tid: str) -> None:
+        conn = self._conexion()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._borrar(conn, tid)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def sync(self, rebuild: bool = False) -> dict:
+        """
+        Pone el índice al día con los .txt de la carpeta: indexa los nuevos y
+        los cambiados (tamaño o mtime distinto) y quita los que ya no están.
+        `rebuild` vuelve a indexar todos los archivos (pierden los tiempos).
+        """
+        with self._sync_lock:
+            t0 = time.perf_counter()
+            conn = self._conexion()
+            indexados = {r[0]: (r[1], r[2], r[3]) for r in conn.execute(
+                "SELECT path, id, size, mtime_ns FROM transcripts WHERE path IS NOT NULL")}
+            nuevos = actualizados = sin_cambios = 0
+            vistos = set()
+            try:
+                archivos = sorted(self.carpeta.glob("*.txt"))
+            except OSError:
+                archivos = []
+            for ruta in archivos:
+                vistos.add(str(ruta))
+                try:
+                    st = ruta.stat()
+                except OSError:
+                    continue
+                previo = indexados.get(str(ruta))
+                if previo and not rebuild and previo[1] == st.st_size and previo[2] == st.st_mtime_ns:
+                    sin_cambios += 1
+                    continue
+                try:
+                    self.add_file(ruta, origen="folder")
+                except (OSError, sqlite3.Error) as e:
+                    print(f"⚠️ No se pudo indexar {ruta.name}: {e}", flush=True)
+                    continue
+                if previo:
+                    actualizados += 1
+                else:
+                    nuevos += 1
+            borrados = [tid for ruta, (tid, _, _) in indexados.items() if ruta not in vistos]
+            for tid in borrados:
+                self.remove(tid)
+            self._ultimo_sync = time.monotonic()
+            self._ultimo_resultado = {"added": nuevos, "updated": actualizados, "removed": len(borrados),
+                                      "unchanged": sin_cambios,
+                                      "seconds": round(time.perf_counter() - t0, 3)}
+            if nuevos or actualizados or borrados:
+                print(f"🔎 Índice de búsqueda: {nuevos} nuevas, {actualizados} actualizadas, "
+                      f"{len(borrados)} quitadas", flush=True)
+            return self._ultimo_resultado
+
+    def maybe_sync(self) -> None:
+        """sync() si pasaron más de `sync_s` segundos desde el último (y nadie lo está haciendo ya)."""
+        if self._ultimo_sync is not None and time.monotonic() - self._ultimo_sync < self.sync_s:
+            return
+        if self._sync_lock.locked():
+            return
+        self.sync()
+
+    # ── lectura ───────────────────────────────────────────────
+
+    def search(self, q: str, limit: int = 20, offset: int = 0, transcript: Optional[str] = None) -> dict:
+        """
+        {query, total, total_exact, took_ms, hits: [{transcript_id, name,
+        source, start, end, snippet, score}]}, de más a menos relevante.
+        `snippet` es HTML (texto escapado, coincidencias en <mark>). BM25
+        cuesta por coincidencia: si un término aparece en más de
+        `max_ranqueo` pasajes se ordenan solo los más recientes y `total`
+        queda en ese tope (total_exact = false).
+        """
+        expr = consulta_fts(q)
+        limit = max(1, min(int(limit), 100))
+        offset = max(0, int(offset))
+        t0 = time.perf_counter()
+        conn = self._conexion()
+        filtro, params = "", [expr]
+        if transcript:
+            filtro = " AND rowid IN (SELECT id FROM passage_meta WHERE transcript_id = ?)"
+            params.append(transcript)
+        try:
+            # Cuántas coinciden, contando como mucho hasta max_ranqueo (las más recientes)
+            corte = conn.execute(f"SELECT rowid FROM passages WHERE passages MATCH ?{filtro} "
+                                 "ORDER BY rowid DESC LIMIT 1 OFFSET ?",
+                                 params + [self.max_ranqueo]).fetchone()
+            if corte is None:
+                total = conn.execute(f"SELECT count(*) FROM passages WHERE passages MATCH ?{filtro}",
+                                     params).fetchone()[0]
+            else:
+                total = self.max_ranqueo
+                filtro, params = filtro + " AND rowid > ?", params + [corte[0]]
+            # Primero los mejores rowid; fragmentos y tiempos solo para la página pedida.
+            # bm25() explícito y no `rank`: así FTS5 respeta el corte por rowid
+            mejores = conn.execute(f"SELECT rowid, bm25(passages) AS b FROM passages "
+                                   f"WHERE passages MATCH ?{filtro} ORDER BY b LIMIT ? OFFSET ?",
+                                   params + [limit, offset]).fetchall()
+            marcas = ",".join("?" * len(mejores))
+            ids = [r for r, _ in mejores]
+            textos = dict(conn.execute(f"SELECT rowid, text FROM passages WHERE rowid IN ({marcas})",
+                                       ids)) if ids else {}
+            meta = {fila[0]: fila[1:] for fila in conn.execute(
+                f"SELECT m.id, m.transcript_id, t.name, t.source, m.start, m.end FROM passage_meta m "
+                f"JOIN transcripts t ON t.id = m.transcript_id WHERE m.id IN ({marcas})", ids)} if ids else {}
+        except sqlite3.OperationalError as e:
+            raise ValueError(f"Búsqueda no válida: {e}")
+        hits = []
+        for rowid, rank in mejores:
+            if rowid not in meta:  # borrado entre una consulta y otra
+                continue
+            tid, nombre, origen, inicio, fin = meta[rowid]
+            hits.append({"transcript_id": tid, "name": nombre, "source": origen, "start": inicio, "end": fin,
+                         "snippet": fragmento(textos.get(rowid, ""), q), "score": round(-rank, 4)})
+        return {"query": q, "total": total, "total_exact": corte is None,
+                "took_ms": round((time.perf_counter() - t0) * 1000, 2), "hits": hits}
+
+    def get(self, tid: str) -> Optional[dict]:
+        """Datos de una transcripción: `path` si vive en un .txt, si no `text`. None si no existe."""
+        fila = self._conexion().execute(
+            "SELECT id, name, source, path, text, duration_s FROM transcripts WHERE id = ?", (tid,)).fetchone()
+        if fila is None:
+            return None
+        return dict(zip(("id", "name", "source", "path", "text", "duration_s"), fila))
+
+    def list(self) -> list[dict]:
+        conn = self._conexion()
+        return [{"id": tid, "name": nombre, "source": origen, "passages": n, "duration_s": dur,
+                 "indexed_at": t}
+                for tid, nombre, origen, n, dur, t in conn.execute(
+                    "SELECT id, name, source, n_passages, duration_s, indexed_at FROM transcripts "
+                    "ORDER BY indexed_at DESC")]
+
+    def stats(self) -> dict:
+        conn = self._conexion()
+        transcripciones, pasajes_n = conn.execute(
+            "SELECT count(*), coalesce(sum(n_passages), 0) FROM transcripts").fetchone()
+        try:
+            tam = sum(p.stat().st_size for p in self.ruta.parent.glob(self.ruta.name + "*"))
+        except OSError:
+            tam = 0
+        return {"transcripts": transcripciones, "passages": pasajes_n, "bytes": tam,
+                "last_sync": self._ultimo_resultado}
@@ -2,17 +2,75 @@
 """
 Módulo de transcripción con Whisper.
 Prioriza mlx-whisper en Apple Silicon (M3) para mejor rendimiento.
-Si no está disponible, usa openai-whisper (CPU).
+Si no está disponible, usa faster-whisper (CTranslate2, int8 en CPU) y,
+en último caso, openai-whisper (CPU, fp32). El motor también se puede
+fijar con TRANSCRIPTOTEM_ENGINE o elegir por petición (ver ENGINES).
 """
+import dataclasses
+import gc
+import importlib.util
+import inspect
+import operator
 import os
 import re
-from typing import Optional, Tuple
+import sys
+import threading
+import time
+import zlib
+from typing import Callable, Iterator, Optional, Tuple
 
+from backend import config
+from backend.batching import BatchScheduler
+from backend.cache import DiskCache, clave, sha256_archivo
+from backend.eta import EtaEstimator
+from backend.metrics import AUDIO_SECONDS, RTF, observe_stage, stage
 from backend.models import PROMPTS_POR_IDIOMA, LANGUAGE_CODE
+from backend.redecode import redecodificar, registrar_stats
+from backend.registry import ModelRegistry
+from backend.workers import file_lock
 
 _engine: Optional[str] = None
-_model_loaded: Optional[str] = None
-_whisper_model = None
+
+
+def _al_expulsar(engine: str, name: str) -> None:
+    """
+    mlx_whisper guarda el último modelo usado en ModelHolder: mientras lo
+    apunte, el modelo expulsado del registro sigue vivo en memoria unificada.
+    Se suelta (sin _mlx_lock: una inferencia en curso ya tiene su referencia)
+    y se devuelve a Metal la caché de buffers que ocupaba.
+    """
+    if engine != "mlx":
+        return
+    try:
+        from mlx_whisper.transcribe import ModelHolder
+        import mlx.core as mx
+    except ImportError:
+        return
+    if ModelHolder.model_path != name:
+        return
+    ModelHolder.model = None
+    ModelHolder.model_path = None
+    gc.collect()
+    limpiar = getattr(mx, "clear_cache", None) or getattr(getattr(mx, "metal", None), "clear_cache", None)
+    if limpiar is not None:
+        limpiar()
+
+
+# Varios modelos residentes a la vez, acotados por presupuesto de RAM
+model_registry = ModelRegistry(config.MODEL_BUDGET_MB * 1024 * 1024, on_evict=_al_expulsar)
+# mlx_whisper guarda el modelo activo en una variable de clase: una inferencia MLX a la vez
+_mlx_lock = threading.RLock()
+
+# Caché de resultados crudos de Whisper, compartida por todos los endpoints
+transcript_cache = DiskCache(config.TRANSCRIPT_CACHE_DIR,
+                             config.TRANSCRIPT_CACHE_MAX_MB * 1024 * 1024,
+                             sufijo=".json")
+
+# Ventanas de todas las peticiones en curso, decodificadas en lotes (BATCH_SIZE > 1)
+batch_scheduler = BatchScheduler(config.BATCH_SIZE, config.BATCH_MAX_WAIT_MS / 1000)
+
+# RTF aprendido de los trabajos terminados, para las ETA de subidas, trabajos y carpeta
+eta_estimator = EtaEstimator(config.ETA_FILE, config.ETA_ALPHA)
 
 MLX_MODELS_LEGACY = {
     "base":     "mlx-community/whisper-base-mlx",
@@ -30,6 +88,12 @@ OPENAI_FALLBACK_MODELS = {
     "mlx-community/whisper-large-v3-mlx":   "large-v3",
 }
 
+# faster-whisper descarga las conversiones CTranslate2 de Systran por nombre corto
+FASTER_WHISPER_MODELS = {
+    "mlx-community/whisper-large-v3-turbo": "large-v3-turbo",
+    "turbo":                                "large-v3-turbo",
+}
+
 DEFAULT_CONTEXT_FALLBACK = (
     "Transcripción de clase universitaria en Chile. "
     "Transcribir únicamente al expositor principal, "
@@ -48,111 +112,1046 @@ def _build_initial_prompt(language_profile: str, context_text: str) -> str:
     return f"{base_ctx}\n{profile_prompt}"
 
 
+# ── Filtro de alucinaciones: patrones compilados una sola vez ──
+_LETRAS = "a-z\u00e1\u00e9\u00ed\u00f3\u00fa\u00f1"
+_RE_PALABRA       = re.compile(r"\w+")
+_RE_SOLO_PUNTOS   = re.compile(r"[.\s\u2026]+")
+_RE_SIN_LETRAS    = re.compile(r"[^\w\u00e1\u00e9\u00ed\u00f3\u00fa\u00f1\u00c1\u00c9\u00cd\u00d3\u00da\u00d1]+")
+_RE_TOKENS        = re.compile(f"[{_LETRAS}]+")
+_RE_CHAR_REPETIDO = re.compile(r"(.)\1{4,}")
+_RE_ESPACIOS      = re.compile(r"\s+")
+_RE_CORTA_REPE    = re.compile(r"\b(\w{1,3})(?:\s+\1){4,}\b", re.IGNORECASE)
+_RE_SALTOS        = re.compile(r"\n{4,}")
+
+
+def _colapsar_repeticiones(text: str, tamanos: tuple[int, ...], min_reps: int = 5) -> str:
+    r"""
+    Sustituye cada frase de `k` palabras repetida `min_reps` o más veces
+    seguidas (separadas solo por espacios) por su primera aparición.
+    Para cada palabra se prueban los tamaños en el orden dado y gana el
+    primero que se repite. Equivale a las sustituciones con regex
+
+        \b(\w+)(?:\s+\1){4,}\b                      tamanos=(1,)
+        \b((?:\w+\s+){1,4}\w+)(?:\s+\1){4,}\b        tamanos=(5, 4, 3, 2)
+
+    (sin distinguir mayúsculas), pero trabaja sobre la lista de palabras:
+    solo se examinan las posiciones que pasan el filtro previo y cada una
+    se compara como mucho min_reps·k veces, así que el coste es lineal y
+    desaparece el retroceso del motor de regex en textos largos y repetitivos.
+    """
+    palabras = list(map(str.lower, _RE_PALABRA.findall(text)))
+    n = len(palabras)
+
+    # Filtro previo: k palabras repetidas r veces exige palabras[t] == palabras[t+k]
+    # en (r-1)·k posiciones seguidas. Las comparaciones y la búsqueda de tramos
+    # corren en C (map + regex sobre bytes); en texto normal no queda candidato.
+    candidatos: dict[int, list[int]] = {}
+    for k in tamanos:
+        necesarias = (min_reps - 1) * k
+        if n - k < necesarias:
+            continue
+        iguales = bytes(map(operator.eq, palabras, palabras[k:]))
+        for m in re.finditer(b"\x01{%d,}" % necesarias, iguales):
+            for i in range(m.start(), m.end() - necesarias + 1):
+                candidatos.setdefault(i, []).append(k)
+    if not candidatos:
+        return text
+
+    spans = [m.span() for m in _RE_PALABRA.finditer(text)]
+
+    def sep(i: int) -> Optional[str]:
+        """Separador entre la palabra i y la i+1 (None si no es solo espacio)."""
+        s = text[spans[i][1]:spans[i + 1][0]]
+        return s if s.isspace() else None
+
+    def frase(i: int, k: int):
+        return tuple(palabras[i:i + k]), tuple(sep(t) for t in range(i, i + k - 1))
+
+    salida = []
+    copiado = 0
+    siguiente = 0
+    for i in sorted(candidatos):
+        if i < siguiente:
+            continue
+        for k in candidatos[i]:
+            clave_frase = frase(i, k)
+            if None in clave_frase[1]:
+                continue
+            j = i + k
+            reps = 1
+            while j + k <= n and sep(j - 1) is not None and frase(j, k) == clave_frase:
+                reps += 1
+                j += k
+            if reps >= min_reps:
+                salida.append(text[copiado:spans[i + k - 1][1]])
+                copiado = spans[j - 1][1]
+                siguiente = j
+                break
+    if not salida:
+        return text
+    salida.append(text[copiado:])
+    return "".join(salida)
+
+
 def _clean_transcript(text: str) -> str:
     """Filtro de alucinaciones post-procesamiento."""
     if not text:
         return ""
     text = text.replace("\r\n", "\n").replace("\r", "\n")
-    text = re.sub(r"\b(\w+)(?:\s+\1){4,}\b", r"\1", text, flags=re.IGNORECASE)
-    text = re.sub(r"\b((?:\w+\s+){1,4}\w+)(?:\s+\1){4,}\b", r"\1", text, flags=re.IGNORECASE)
+    text = _colapsar_repeticiones(text, (1,))
+    text = _colapsar_repeticiones(text, (5, 4, 3, 2))
     cleaned_lines = []
     for line in text.split("\n"):
         raw = line.strip()
         if not raw:
             cleaned_lines.append("")
             continue
-        if re.fullmatch(r"[.\s\u2026]+", raw):
+        if _RE_SOLO_PUNTOS.fullmatch(raw) or _RE_SIN_LETRAS.fullmatch(raw):
             continue
-        if re.fullmatch(r"[^\w\u00e1\u00e9\u00ed\u00f3\u00fa\u00f1\u00c1\u00c9\u00cd\u00d3\u00da\u00d1]+", raw):
-            continue
-        tokens = re.findall(r"[a-z\u00e1\u00e9\u00ed\u00f3\u00fa\u00f1]+", raw.lower())
+        low = raw.lower()
+        tokens = _RE_TOKENS.findall(low)
         if len(tokens) >= 2 and len(set(tokens)) == 1:
             continue
-        if re.search(r"(.)\1{4,}", raw):
+        if _RE_CHAR_REPETIDO.search(raw):
             continue
-        raw_stripped = re.sub(r"\s+", " ", raw.strip())
-        if re.search(r"\b(\w{1,3})(?:\s+\1){4,}\b", raw_stripped, re.IGNORECASE):
+        if _RE_CORTA_REPE.search(_RE_ESPACIOS.sub(" ", raw)):
             continue
-        letters = re.findall(r"[a-z\u00e1\u00e9\u00ed\u00f3\u00fa\u00f1]", raw.lower())
-        if letters and (len(letters) / max(len(raw), 1)) < 0.25:
+        letters = sum(map(len, tokens))  # los tokens son tramos de letras
+        if letters and (letters / max(len(raw), 1)) < 0.25:
             continue
         cleaned_lines.append(line)
     out = "\n".join(cleaned_lines)
-    out = re.sub(r"\n{4,}", "\n\n\n", out)
+    out = _RE_SALTOS.sub("\n\n\n", out)
     return out.strip()
 
 
+def _silencio(segundos: float = 1.0):
+    """Clip mudo a 16 kHz para la inferencia de calentamiento."""
+    import numpy as np
+    return np.zeros(int(16000 * segundos), dtype=np.float32)
+
+
+def _descarga(**kwargs) -> dict:
+    """download_root compartido por todos los workers, si se configuró uno."""
+    if config.MODEL_CACHE_DIR:
+        kwargs["download_root"] = config.MODEL_CACHE_DIR
+    return kwargs
+
+
+# Con varios workers, solo la descarga va bajo el lock entre procesos (uno
+# descarga y los demás esperan a que el archivo esté completo); la carga en
+# memoria, que es lo lento, ocurre fuera y en paralelo en cada worker.
+
 def _get_whisper_model(model_name: str):
-    global _whisper_model, _model_loaded
-    if _whisper_model is None or _model_loaded != model_name:
+    def cargar():
         try:
             import whisper
-            _whisper_model = whisper.load_model(model_name, device="cpu")
-            _model_loaded = model_name
+            url = getattr(whisper, "_MODELS", {}).get(model_name)
+            if url is None or not hasattr(whisper, "_download"):
+                # Ruta local, o una versión sin la API de descarga: carga entera bajo el lock
+                with file_lock(f"model-whisper-{model_name}"):
+                    return whisper.load_model(model_name, **_descarga(device="cpu"))
+            raiz = config.MODEL_CACHE_DIR or os.path.join(
+                os.getenv("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")), "whisper")
+            with file_lock(f"model-whisper-{model_name}"):
+                whisper._download(url, raiz, False)  # descarga o verifica el checksum
+            return whisper.load_model(model_name, device="cpu", download_root=raiz)
         except Exception as e:
             raise RuntimeError(f"No se pudo cargar Whisper: {e}")
-    return _whisper_model
 
+    def calentar(model):
+        model.transcribe(_silencio(), language="es", temperature=0.0, fp16=False)
 
-def _detect_engine() -> str:
-    global _engine
-    if _engine is not None:
-        return _engine
+    return model_registry.get("whisper", model_name, cargar,
+                              calentar if config.MODEL_WARMUP else None)
+
+
+def _get_ct2_model(model_name: str):
+    def cargar():
+        try:
+            from faster_whisper import WhisperModel
+            opciones = dict(device="cpu", compute_type=config.CT2_COMPUTE_TYPE, cpu_threads=config.CT2_THREADS)
+            try:
+                from faster_whisper.utils import download_model
+            except ImportError:
+                with file_lock(f"model-faster-whisper-{model_name}"):
+                    return WhisperModel(model_name, **_descarga(**opciones))
+            ruta = model_name
+            if not os.path.isdir(model_name):
+                with file_lock(f"model-faster-whisper-{model_name}"):
+                    ruta = download_model(model_name, cache_dir=config.MODEL_CACHE_DIR or None)
+            return WhisperModel(ruta, **opciones)
+        except Exception as e:
+            raise RuntimeError(f"No se pudo cargar faster-whisper: {e}")
+
+    def calentar(model):
+        segmentos, _ = model.transcribe(_silencio(), language="es", beam_size=1)
+        list(segmentos)  # es un generador: la inferencia ocurre al recorrerlo
+
+    return model_registry.get("faster-whisper", model_name, cargar,
+                              calentar if config.MODEL_WARMUP else None)
+
+
+def _mlx_hf_name(model_name: str) -> str:
+    return model_name if "/" in model_name else MLX_MODELS_LEGACY.get(model_name, "mlx-community/whisper-large-v3-turbo")
+
+
+def _activar_mlx(hf_name: str, model) -> None:
+    """
+    mlx_whisper.transcribe() reutiliza el modelo de ModelHolder si la ruta
+    coincide; le inyectamos el del registro para no recargarlo desde disco.
+    """
     try:
-        import mlx_whisper  # noqa: F401
-        _engine = "mlx"
+        from mlx_whisper.transcribe import ModelHolder
     except ImportError:
-        _engine = "whisper"
+        return
+    ModelHolder.model = model
+    ModelHolder.model_path = hf_name
+
+
+def _get_mlx_model(hf_name: str):
+    def cargar():
+        import mlx.core as mx
+        from mlx_whisper import load_models
+        descargar = getattr(load_models, "snapshot_download", None)
+        if descargar is None:
+            with file_lock(f"model-mlx-{hf_name}"):
+                return load_models.load_model(hf_name, dtype=mx.float16)
+        ruta = hf_name
+        if not os.path.exists(hf_name):
+            with file_lock(f"model-mlx-{hf_name}"):
+                ruta = descargar(repo_id=hf_name)
+        return load_models.load_model(ruta, dtype=mx.float16)
+
+    def calentar(model):
+        import mlx_whisper
+        with _mlx_lock:
+            _activar_mlx(hf_name, model)
+            mlx_whisper.transcribe(_silencio(), path_or_hf_repo=hf_name, language="es")
+
+    return model_registry.get("mlx", hf_name, cargar,
+                              calentar if config.MODEL_WARMUP else None)
+
+
+def preload_models(model_names, engine: Optional[str] = None) -> list[dict]:
+    """Carga (y calienta) los modelos indicados con el motor indicado o el por defecto."""
+    motor = get_engine(engine)
+    for name in model_names:
+        try:
+            motor.load(name)
+        except Exception as e:
+            print(f"⚠️ No se pudo precargar {name}: {e}", flush=True)
+    return model_registry.list()
+
+
+def _auto_engine() -> str:
+    """Primer motor instalado, en orden de preferencia (ver ENGINES)."""
+    global _engine
+    if _engine is None:
+        _engine = next((e.name for e in ENGINES.values() if e.available()), "whisper")
     return _engine
 
 
+def get_engine(nombre: Optional[str] = None) -> "Engine":
+    """
+    Motor pedido por la petición, o el de TRANSCRIPTOTEM_ENGINE, o "auto"
+    (el primero instalado). ValueError si no existe o no está instalado.
+    """
+    nombre = (nombre or config.ENGINE or "auto").strip().lower()
+    nombre = ENGINE_ALIASES.get(nombre, nombre)
+    if nombre == "auto":
+        return ENGINES[_auto_engine()]
+    motor = ENGINES.get(nombre)
+    if motor is None:
+        raise ValueError(f"Motor desconocido: {nombre} (opciones: auto, {', '.join(ENGINES)})")
+    if not motor.available():
+        raise ValueError(f"El motor {nombre} no está instalado en este servidor")
+    return motor
+
+
+def _detect_engine() -> str:
+    return get_engine().name
+
+
+def _segmentos(result: dict) -> list[dict]:
+    """Se conservan tiempos, texto y las métricas de confianza de cada segmento."""
+    campos = ("start", "end", "text", "avg_logprob", "compression_ratio", "no_speech_prob")
+    return [{k: seg[k] for k in campos if k in seg} for seg in result.get("segments") or []]
+
+
+def _preparar_audio(audio_path: str, usar_vad: bool, audio=None,
+                    audio_hash: Optional[str] = None, info: Optional[dict] = None):
+    """
+    Decodifica el audio por la caché de audio decodificado (salvo que ya
+    venga decodificado) y, con VAD activo, detecta la voz y devuelve solo
+    esas regiones (más el mapa para recolocar los tiempos). Si el VAD falla,
+    no hay casi nada que omitir o no encuentra voz en absoluto (stats con
+    `no_speech`: más probable un audio bajo o raro que una clase muda),
+    Whisper recibe el audio completo; si ni siquiera se puede decodificar,
+    recibe la ruta y lo intenta él.
+    """
+    timings = info.get("timings") if info is not None else None
+    if audio is None:
+        try:
+            from backend.audio import load_audio_cached
+            with stage(timings, "decode"):
+                audio = load_audio_cached(audio_path, audio_hash, info)
+        except Exception as e:
+            print(f"⚠️ No se pudo decodificar de antemano ({e}); el motor leerá el archivo", flush=True)
+            return audio_path, None, None
+    if not usar_vad:
+        return audio, None, None
+    try:
+        from backend.vad import detect_speech
+        with stage(timings, "vad"):
+            mapa = detect_speech(audio)
+    except Exception as e:
+        print(f"⚠️ VAD desactivado para este audio: {e}", flush=True)
+        return audio, None, None
+    stats = mapa.stats()
+    print(f"VAD: {stats['skipped_s']:.0f}s sin voz omitidos de {stats['audio_s']:.0f}s "
+          f"({stats['skipped_ratio']:.0%}, {stats['regions']} regiones)", flush=True)
+    if not stats["regions"]:
+        print("⚠️ VAD no encontró voz; se transcribe el audio completo", flush=True)
+        stats["no_speech"] = True
+        return audio, None, stats
+    if stats["skipped_ratio"] < config.VAD_MIN_SKIP_RATIO:
+        return audio, None, stats
+    return mapa.compress(audio), mapa, stats
+
+
+def _modo_decodificacion(motor: "Engine", stream: bool = False,
+                         lotes: Optional[bool] = None) -> Optional[tuple]:
+    """
+    Camino de decodificación que no es el secuencial: sus resultados difieren
+    (cortes y costuras de los trozos, ventanas en lote sin el texto previo
+    como prompt) y no deben compartir entrada de caché. None = secuencial;
+    también el streaming, que va por sus propias ventanas sin lotes.
+    `lotes` = si se decodificó en lote (None = el que elegiría _run_engine).
+    """
+    if stream:
+        return None
+    if motor.name == "whisper" and config.CHUNK_WORKERS > 1:
+        return ("chunks", config.CHUNK_SECONDS, config.CHUNK_OVERLAP, config.CHUNK_MIN_SECONDS)
+    if lotes is None:
+        lotes = config.BATCH_SIZE > 1 and motor.supports_batch  # misma condición que _run_engine
+    if lotes:
+        return ("batch", config.STREAM_WINDOW_SECONDS)
+    return None
+
+
+def cache_key(audio_hash: str, language_profile: str, model_name: str,
+              context_text: str = "", vad: Optional[bool] = None,
+              engine: Optional[str] = None, stream: bool = False,
+              lotes: Optional[bool] = None) -> str:
+    usar_vad = config.VAD_ENABLED if vad is None else vad
+    initial_prompt = _build_initial_prompt(language_profile, context_text)
+    motor = get_engine(engine)
+    partes = [audio_hash, motor.name, model_name, language_profile, initial_prompt, usar_vad]
+    modo = _modo_decodificacion(motor, stream, lotes)
+    if modo is not None:  # el secuencial conserva las claves de siempre
+        partes.append(modo)
+    if config.REDECODE:  # la segunda pasada cambia el resultado; sin ella las claves de siempre
+        partes.append(("redecode", config.REDECODE_MODEL, config.REDECODE_TEMPERATURES,
+                       config.REDECODE_LOGPROB, config.REDECODE_COMPRESSION, config.REDECODE_NO_SPEECH,
+                       config.REDECODE_MAX_RATIO))
+    return clave(*partes)
+
+
+def estimate_eta(duration_s: Optional[float], model_name: str, engine: Optional[str] = None,
+                 key: Optional[str] = None) -> Optional[dict]:
+    """
+    ETA de transcribir `duration_s` segundos con ese modelo y motor. Con
+    `key` (ver cache_key) y el resultado ya en caché, la ETA es 0.
+    """
+    if not duration_s:
+        return None
+    if key is not None and transcript_cache.get_path(key) is not None:
+        return {"eta_s": 0.0, "rtf": 0.0, "source": "cache", "samples": 0}
+    motor = get_engine(engine)
+    residente = not motor.loads_in_process or any(
+        m["engine"] == motor.name and m["name"] == motor.resolve(model_name)
+        for m in model_registry.list()
+    )
+    return eta_estimator.estimate(motor.name, model_name, duration_s, residente)
+
+
+def _aprender_rtf(motor: "Engine", model_name: str, audio, vad_stats, inicio: float,
+                  timings: dict, carga_previa: float) -> None:
+    """Anota en eta_estimator lo que costó este audio (sin la carga del modelo)."""
+    if vad_stats:
+        audio_s = vad_stats["audio_s"]
+    elif not isinstance(audio, str):
+        audio_s = len(audio) / 16000
+    else:
+        return
+    carga = timings.get("model_load", 0.0) - carga_previa
+    eta_estimator.observe(motor.name, model_name, audio_s,
+                          time.perf_counter() - inicio - carga, carga)
+
+
 def transcribe(
     audio_path: str,
     language_profile: str = "es-chile",
     model_name: str = "mlx-community/whisper-large-v3-turbo",
     context_text: str = "",
+    use_cache: bool = True,
+    vad: Optional[bool] = None,
+    info: Optional[dict] = None,
+    audio=None,
+    audio_hash: Optional[str] = None,
+    engine: Optional[str] = None,
+    check_cancel: Optional[Callable[[], None]] = None,
 ) -> Tuple[str, str, int]:
+    """
+    Devuelve (texto limpio, idioma, nº de segmentos). Si se pasa `info`,
+    se rellena con los segmentos (en tiempos del audio original), las
+    estadísticas del VAD, el tiempo de decodificación y `timings`
+    ({etapa: segundos}; se suma a lo que ya traiga). `audio` (PCM 16 kHz ya decodificado) y
+    `audio_hash` permiten saltarse la decodificación y el hash cuando
+    quien llama ya los tiene. `engine` elige motor (None = el por defecto).
+    `check_cancel` (cola de trabajos) se llama entre etapas y, si el motor
+    lo permite, entre segmentos o trozos; lanza una excepción para parar.
+    """
     if not os.path.isfile(audio_path):
         raise FileNotFoundError(f"Archivo no encontrado: {audio_path}")
     lang_code = LANGUAGE_CODE.get(language_profile, "es")
     initial_prompt = _build_initial_prompt(language_profile, context_text)
-    engine = _detect_engine()
-    if engine == "mlx":
-        text, lang_used, segs = _transcribe_mlx(audio_path, lang_code, initial_prompt, model_name)
-    else:
-        fallback = OPENAI_FALLBACK_MODELS.get(model_name, model_name)
-        text, lang_used, segs = _transcribe_openai(audio_path, lang_code, initial_prompt, fallback, language_profile)
-    return _clean_transcript(text), lang_used, segs
+    motor = get_engine(engine)
+    usar_vad = config.VAD_ENABLED if vad is None else vad
+    info = info if info is not None else {}
+    timings = info.setdefault("timings", {})
+
+    key = None
+    if use_cache:
+        if audio_hash is None:
+            with stage(timings, "hash"):
+                audio_hash = sha256_archivo(audio_path)
+        key = cache_key(audio_hash, language_profile, model_name, context_text, usar_vad, motor.name)
+        hit = transcript_cache.get_json(key)
+        if hit is not None:
+            info.update(segments=hit["segments"], vad=hit.get("vad"), cached=True)
+            with stage(timings, "clean"):
+                limpio = _clean_transcript(hit["text"])
+            return limpio, hit["language"], len(hit["segments"])
+
+    comprobar = check_cancel or (lambda: None)
+    comprobar()
+    inicio, carga_previa = time.perf_counter(), timings.get("model_load", 0.0)
+    audio, mapa, vad_stats = _preparar_audio(audio_path, usar_vad, audio, audio_hash, info)
+    comprobar()
+    ejecucion: dict = {}
+    text, lang_used, segments = _run_engine(motor, audio, lang_code, initial_prompt,
+                                            model_name, language_profile, timings,
+                                            check_cancel=check_cancel, ejecucion=ejecucion)
+    comprobar()
+    segments, redecode = redecodificar(motor, audio, segments, lang_code, initial_prompt,
+                                       model_name, language_profile, timings,
+                                       check_cancel=check_cancel)
+    if redecode and redecode["replaced"]:
+        text = "".join(s.get("text", "") for s in segments).strip()
+    info["redecode"] = redecode
+    _aprender_rtf(motor, model_name, audio, vad_stats, inicio, timings, carga_previa)
+    if mapa is not None:
+        mapa.remap_segments(segments)
+
+    if key is not None:
+        # Bajo la clave del camino que corrió de verdad: un lote fallido cae al secuencial
+        key = cache_key(audio_hash, language_profile, model_name, context_text, usar_vad, motor.name,
+                        lotes=ejecucion["lotes"])
+        transcript_cache.put_json(key, {"text": text, "language": lang_used,
+                                        "segments": segments, "vad": vad_stats})
+    info.update(segments=segments, vad=vad_stats, cached=False)
+    with stage(timings, "clean"):
+        limpio = _clean_transcript(text)
+    return limpio, lang_used, len(segments)
 
 
-def _transcribe_mlx(audio_path, lang_code, initial_prompt, model_name):
-    import mlx_whisper
-    hf_name = model_name if "/" in model_name else MLX_MODELS_LEGACY.get(model_name, "mlx-community/whisper-large-v3-turbo")
-    kwargs = {"path_or_hf_repo": hf_name, "language": lang_code, "no_speech_threshold": 0.6, "compression_ratio_threshold": 2.4}
-    if initial_prompt:
-        kwargs["initial_prompt"] = initial_prompt
+def transcribe_stream(
+    audio_path: str,
+    language_profile: str = "es-chile",
+    model_name: str = "mlx-community/whisper-large-v3-turbo",
+    context_text: str = "",
+    use_cache: bool = True,
+    vad: Optional[bool] = None,
+    audio=None,
+    audio_hash: Optional[str] = None,
+    engine: Optional[str] = None,
+) -> Iterator[dict]:
+    """
+    Igual que transcribe(), pero emite cada segmento en cuanto se decodifica:
+      {"type": "segment", "start", "end", "text"}   (tiempos del audio original)
+      {"type": "result", "text", "language", "segments_count", "vad", "cached", "decode", "timings"}
+    El audio se recorre en ventanas de ~STREAM_WINDOW_SECONDS cortadas en
+    silencios; cada ventana recibe como prompt el final del texto anterior,
+    igual que hace Whisper internamente con condition_on_previous_text.
+    """
+    if not os.path.isfile(audio_path):
+        raise FileNotFoundError(f"Archivo no encontrado: {audio_path}")
+    lang_code = LANGUAGE_CODE.get(language_profile, "es")
+    initial_prompt = _build_initial_prompt(language_profile, context_text)
+    motor = get_engine(engine)
+    usar_vad = config.VAD_ENABLED if vad is None else vad
+    timings: dict = {}
+
+    key = None
+    if use_cache:
+        if audio_hash is None:
+            with stage(timings, "hash"):
+                audio_hash = sha256_archivo(audio_path)
+        key = cache_key(audio_hash, language_profile, model_name, context_text, usar_vad, motor.name,
+                        stream=True)
+        hit = transcript_cache.get_json(key)
+        if hit is not None:
+            for seg in hit["segments"]:
+                limpio = _clean_transcript(seg.get("text", ""))
+                if limpio:
+                    yield {"type": "segment", "start": seg["start"], "end": seg["end"], "text": limpio}
+            with stage(timings, "clean"):
+                limpio = _clean_transcript(hit["text"])
+            yield {"type": "result", "text": limpio, "language": hit["language"],
+                   "segments_count": len(hit["segments"]), "vad": hit.get("vad"), "cached": True,
+                   "decode": None, "timings": timings}
+            return
+
+    from backend.audio import SAMPLE_RATE, load_audio
+    from backend.chunking import plan_chunks
+    dec = {"timings": timings}
+    inicio = time.perf_counter()
+    audio, mapa, vad_stats = _preparar_audio(audio_path, usar_vad, audio, audio_hash, dec)
+    if isinstance(audio, str):  # las ventanas necesitan el array: que falle con el error de ffmpeg
+        audio = load_audio(audio_path)
+
+    ventanas = plan_chunks(audio, config.STREAM_WINDOW_SECONDS, 0.0, search_s=5.0) if len(audio) else []
+    textos: list[str] = []
+    segments: list[dict] = []
+    redecode: Optional[dict] = None
+    limpieza = 0.0  # se acumula y se observa una vez, no por segmento
+    for a, b in ventanas:
+        previo = "".join(textos)[-200:].strip()
+        prompt = f"{initial_prompt}\n{previo}" if previo else initial_prompt
+        # cada ventana depende del texto de la anterior: no se puede agrupar
+        _, _, segs = _run_engine(motor, audio[a:b], lang_code, prompt, model_name,
+                                 language_profile, timings, lotes=False)
+        usado = redecode["audio_s"] if redecode else 0.0
+        segs, stats = redecodificar(motor, audio[a:b], segs, lang_code, prompt, model_name,
+                                    language_profile, timings, registrar=False,
+                                    presupuesto_s=config.REDECODE_MAX_RATIO * len(audio) / SAMPLE_RATE - usado)
+        if stats:
+            redecode = _sumar_redecode(redecode, stats)
+        for seg in segs:
+            seg["start"] = seg.get("start", 0.0) + a / SAMPLE_RATE
+            seg["end"] = seg.get("end", 0.0) + a / SAMPLE_RATE
+        if mapa is not None:
+            mapa.remap_segments(segs)
+        for seg in segs:
+            seg["start"], seg["end"] = round(seg["start"], 3), round(seg["end"], 3)
+            segments.append(seg)
+            textos.append(seg.get("text", ""))
+            t0 = time.perf_counter()
+            limpio = _clean_transcript(seg.get("text", ""))
+            limpieza += time.perf_counter() - t0
+            if limpio:
+                yield {"type": "segment", "start": seg["start"], "end": seg["end"], "text": limpio}
+
+    if ventanas:
+        _aprender_rtf(motor, model_name, audio, vad_stats, inicio, timings, 0.0)
+    text = "".join(textos).strip()
+    if key is not None:
+        transcript_cache.put_json(key, {"text": text, "language": lang_code,
+                                        "segments": segments, "vad": vad_stats})
+    t0 = time.perf_counter()
+    limpio = _clean_transcript(text)
+    observe_stage(timings, "clean", limpieza + time.perf_counter() - t0)
+    if redecode:
+        redecode["total_s"] = round(len(audio) / SAMPLE_RATE, 2)
+        redecode["ratio"] = round(redecode["audio_s"] / redecode["total_s"], 4) if redecode["total_s"] else 0.0
+        registrar_stats(redecode)
+    yield {"type": "result", "text": limpio, "language": lang_code,
+           "segments_count": len(segments), "vad": vad_stats, "cached": False,
+           "decode": dec.get("decode"), "timings": timings, "redecode": redecode}
+
+
+def transcribe_window(
+    audio,
+    language_profile: str = "es-chile",
+    model_name: str = "mlx-community/whisper-large-v3-turbo",
+    context_text: str = "",
+    previous_text: str = "",
+    engine: Optional[str] = None,
+    timings: Optional[dict] = None,
+) -> list[dict]:
+    """
+    Una inferencia sobre un array ya decodificado (16 kHz), sin caché, VAD
+    ni segunda pasada: la usa el modo en vivo, que vuelve a transcribir la
+    ventana abierta cada pocos segundos con el modelo ya residente.
+    `previous_text` (el texto ya confirmado) se suma al prompt igual que en
+    transcribe_stream. Devuelve los segmentos en tiempos de `audio`.
+    """
+    if not len(audio):
+        return []
+    lang_code = LANGUAGE_CODE.get(language_profile, "es")
+    initial_prompt = _build_initial_prompt(language_profile, context_text)
+    previo = previous_text[-200:].strip()
+    prompt = f"{initial_prompt}\n{previo}" if previo else initial_prompt
+    _, _, segs = _run_engine(get_engine(engine), audio, lang_code, prompt, model_name,
+                             language_profile, timings, lotes=False)
+    return segs
+
+
+def _sumar_redecode(total: Optional[dict], stats: dict) -> dict:
+    """Acumula las estadísticas de la segunda pasada de cada ventana del streaming."""
+    if total is None:
+        return dict(stats)
+    for k in ("segments", "windows", "replaced", "attempts"):
+        total[k] += stats[k]
+    for k in ("audio_s", "seconds"):
+        total[k] = round(total[k] + stats[k], 3)
+    return total
+
+
+def _run_engine(engine: "Engine", audio, lang_code, initial_prompt, model_name, language_profile,
+                timings: Optional[dict] = None, lotes: bool = True,
+                check_cancel: Optional[Callable[[], None]] = None,
+                ejecucion: Optional[dict] = None):
+    """
+    Carga del modelo e inferencia se miden por separado; la carga es casi
+    gratis si el modelo ya está residente en el registro. Con lotes activos
+    y un motor que los soporta, la inferencia pasa por batch_scheduler.
+    En `ejecucion["lotes"]` se anota si el resultado salió de un lote.
+    """
+    with stage(timings, "model_load"):
+        if engine.loads_in_process:
+            engine.load(model_name)
+    t0 = time.perf_counter()
+    with stage(timings, "inference"):
+        resultado = None
+        if lotes and config.BATCH_SIZE > 1 and engine.supports_batch and not isinstance(audio, str):
+            resultado = _transcribe_batched(engine, audio, lang_code, initial_prompt,
+                                            model_name, language_profile, timings, check_cancel)
+        if ejecucion is not None:
+            ejecucion["lotes"] = resultado is not None
+        if resultado is None:
+            resultado = engine.transcribe(audio, lang_code, initial_prompt, model_name, language_profile,
+                                          check_cancel=check_cancel)
+    if not isinstance(audio, str) and len(audio):
+        audio_s = len(audio) / 16000
+        RTF.observe((time.perf_counter() - t0) / audio_s, engine=engine.name, model=model_name)
+        AUDIO_SECONDS.inc(audio_s, engine=engine.name, model=model_name)
+    return resultado
+
+
+def _transcribe_batched(engine: "Engine", audio, lang_code, initial_prompt, model_name,
+                        language_profile, timings: Optional[dict] = None,
+                        check_cancel: Optional[Callable[[], None]] = None):
+    """
+    Parte el audio en ventanas de ≤30 s cortadas en silencios, calcula el
+    mel de cada una aquí (en el hilo de la petición) y deja que el
+    planificador las junte con las de otras peticiones. Sin
+    condition_on_previous_text: todas las ventanas llevan solo el prompt
+    inicial, que es lo que permite agruparlas. None si el lote falla y hay
+    que usar el camino normal: solo para esta petición, salvo que el motor
+    no sepa decodificar en lote (NotImplementedError/AttributeError), y
+    entonces se desactiva para él.
+    `check_cancel` se comprueba mientras se esperan los lotes; una
+    cancelación se propaga tal cual, sin caer al camino normal.
+    """
+    from backend.audio import SAMPLE_RATE
+    from backend.chunking import plan_chunks
+    temperatura = _temperatura(language_profile)
     try:
-        result = mlx_whisper.transcribe(audio_path, **kwargs)
-    except TypeError:
-        result = None
-        for key in ["initial_prompt", "compression_ratio_threshold", "no_speech_threshold"]:
-            kwargs.pop(key, None)
+        ventanas = plan_chunks(audio, config.STREAM_WINDOW_SECONDS, 0.0, search_s=5.0) if len(audio) else []
+        mels = [engine.batch_features(model_name, audio[a:b]) for a, b in ventanas]
+        clave_lote = (engine.name, engine.resolve(model_name), lang_code, initial_prompt, temperatura)
+        resultados, espera = batch_scheduler.run(
+            clave_lote,
+            lambda lote: engine.decode_batch(model_name, lote, lang_code, initial_prompt, temperatura),
+            mels,
+            check_cancel,
+        )
+    except (NotImplementedError, AttributeError) as e:
+        print(f"⚠️ {engine.name}: modo lote desactivado ({type(e).__name__}: {e})", flush=True)
+        engine.supports_batch = False
+        return None
+    except Exception as e:
+        if check_cancel is not None:
+            check_cancel()  # si lo que saltó fue la cancelación, vuelve a lanzarla
+        # Un audio raro o un fallo pasajero no debe apagar los lotes para todos
+        print(f"⚠️ {engine.name}: lote fallido, este audio va por el camino normal "
+              f"({type(e).__name__}: {e})", flush=True)
+        return None
+    observe_stage(timings, "batch_wait", espera)
+    segments: list[dict] = []
+    for (a, b), segs in zip(ventanas, resultados):
+        for seg in segs:
+            seg["start"] = round(a / SAMPLE_RATE + seg["start"], 3)
+            seg["end"] = round(a / SAMPLE_RATE + min(seg["end"], (b - a) / SAMPLE_RATE), 3)
+            segments.append(seg)
+    return "".join(s["text"] for s in segments).strip(), lang_code, segments
+
+
+def _compresion(texto: str) -> float:
+    datos = texto.encode("utf-8")
+    return round(len(datos) / len(zlib.compress(datos)), 3) if datos else 0.0
+
+
+def _segmentos_de_tokens(tokens, inicio_marcas: int, decodificar, duracion: float, **metricas) -> list[dict]:
+    """
+    Tokens de una ventana (con marcas de tiempo <|t|>, 20 ms cada una) a
+    segmentos {start, end, text, …}. Las métricas de confianza de la
+    ventana se copian a cada segmento; la razón de compresión se calcula
+    por segmento, como hace Whisper.
+    """
+    segmentos: list[dict] = []
+    inicio: Optional[float] = None
+    texto: list[int] = []
+
+    def cerrar(fin: float) -> None:
+        contenido = decodificar(texto)
+        if contenido.strip():
+            segmentos.append({"start": inicio or 0.0, "end": fin, "text": contenido,
+                              "compression_ratio": _compresion(contenido), **metricas})
+
+    for t in tokens:
+        if t < inicio_marcas:
+            texto.append(t)
+            continue
+        tiempo = (t - inicio_marcas) * 0.02
+        if inicio is None or not texto:
+            inicio = tiempo
+        else:
+            cerrar(tiempo)
+            inicio, texto = tiempo, []
+    if texto:
+        cerrar(duracion)
+    return segmentos
+
+
+# ══════════════════════════════════════════════════════════════════
+# MOTORES
+# ══════════════════════════════════════════════════════════════════
+
+def _parametros(fn, opciones=None) -> Optional[frozenset]:
+    """
+    Argumentos que acepta `fn` según su firma. Si además recibe **kwargs
+    que reenvía a un dataclass de opciones (DecodingOptions), se suman sus
+    campos. None si no se puede saber: entonces no se filtra nada.
+    """
+    try:
+        params = inspect.signature(fn).parameters.values()
+    except (TypeError, ValueError):
+        return None
+    nombres = {p.name for p in params if p.kind not in (p.VAR_POSITIONAL, p.VAR_KEYWORD)}
+    if any(p.kind is p.VAR_KEYWORD for p in params):
+        if opciones is None or not dataclasses.is_dataclass(opciones):
+            return None
+        nombres |= {f.name for f in dataclasses.fields(opciones)}
+    return frozenset(nombres)
+
+
+def _instalado(modulo: str) -> bool:
+    """Busca el paquete sin importarlo: importar torch o mlx cuesta segundos al arrancar."""
+    if modulo in sys.modules:
+        return sys.modules[modulo] is not None
+    try:
+        return importlib.util.find_spec(modulo) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+def _temperatura(language_profile: str) -> float:
+    return 0.2 if language_profile == "accento-mixto" else 0.0
+
+
+class Engine:
+    """
+    Interfaz de un motor de inferencia. Cada motor sabe si está instalado,
+    cómo se llama cada modelo en su mundo, cómo cargarlo (siempre a través
+    del registro) y qué opciones acepta la versión instalada: las opciones
+    que no soporta se descartan antes de llamar, en vez de reintentar al
+    recibir un TypeError.
+    """
+    name = ""
+    loads_in_process = True  # False si el modelo vive en otros procesos
+    supports_batch = False   # True si implementa batch_features/decode_batch
+
+    def available(self) -> bool:
+        raise NotImplementedError
+
+    def resolve(self, model_name: str) -> str:
+        return model_name
+
+    def load(self, model_name: str):
+        raise NotImplementedError
+
+    def _capacidades(self) -> Optional[frozenset]:
+        return None
+
+    def capabilities(self) -> Optional[frozenset]:
+        if not hasattr(self, "_caps"):
             try:
-                result = mlx_whisper.transcribe(audio_path, **kwargs)
-                break
-            except TypeError:
-                pass
-        if result is None:
-            result = mlx_whisper.transcribe(audio_path, path_or_hf_repo=hf_name, language=lang_code)
-    return result.get("text", "").strip(), lang_code, len(result.get("segments", []))
-
-
-def _transcribe_openai(audio_path, lang_code, initial_prompt, model_name, language_profile="es-chile"):
-    model = _get_whisper_model(model_name)
-    temperature = 0.2 if language_profile == "accento-mixto" else 0.0
-    result = model.transcribe(
-        audio_path, language=lang_code, initial_prompt=initial_prompt,
-        no_speech_threshold=0.6, compression_ratio_threshold=2.4,
-        condition_on_previous_text=True, temperature=temperature, fp16=False,
+                self._caps = self._capacidades()
+            except ImportError:
+                return None
+        return self._caps
+
+    def options(self, **kwargs) -> dict:
+        """Quita las opciones None y las que el motor instalado no acepta."""
+        caps = self.capabilities()
+        descartadas = [k for k, v in kwargs.items() if v is not None and caps is not None and k not in caps]
+        if descartadas and not getattr(self, "_avisado", False):
+            print(f"⚠️ {self.name}: la versión instalada no acepta {', '.join(descartadas)}; se omiten", flush=True)
+            self._avisado = True
+        return {k: v for k, v in kwargs.items() if v is not None and k not in descartadas}
+
+    def transcribe(self, audio, lang_code, initial_prompt, model_name, language_profile,
+                   temperature: Optional[float] = None,
+                   check_cancel: Optional[Callable[[], None]] = None) -> Tuple[str, str, list]:
+        """
+        `temperature` fuerza la del muestreo (segunda pasada); None = la del
+        perfil de idioma. `check_cancel` se llama donde el motor deja parar
+        a medio audio (entre segmentos o trozos); los que no, lo ignoran.
+        """
+        raise NotImplementedError
+
+    def batch_features(self, model_name: str, audio):
+        """Mel de una ventana de ≤30 s (rellenada a 30 s), listo para apilar."""
+        raise NotImplementedError
+
+    def decode_batch(self, model_name: str, mels: list, lang_code, initial_prompt,
+                     temperature: float) -> list[list[dict]]:
+        """Encoder y decoder sobre varias ventanas a la vez: segmentos por ventana."""
+        raise NotImplementedError
+
+    def describe(self) -> dict:
+        disponible = self.available()
+        caps = self.capabilities() if disponible else None
+        return {"name": self.name, "available": disponible, "batch": bool(self.supports_batch),
+                "capabilities": sorted(caps) if caps is not None else None}
+
+
+class MlxEngine(Engine):
+    """mlx-whisper en Apple Silicon (GPU, fp16)."""
+    name = "mlx"
+
+    def available(self) -> bool:
+        return _instalado("mlx_whisper")
+
+    def resolve(self, model_name: str) -> str:
+        return _mlx_hf_name(model_name)
+
+    def load(self, model_name: str):
+        return _get_mlx_model(self.resolve(model_name))
+
+    def _capacidades(self):
+        import mlx_whisper
+        try:
+            from mlx_whisper.decoding import DecodingOptions
+        except ImportError:
+            DecodingOptions = None
+        return _parametros(mlx_whisper.transcribe, DecodingOptions)
+
+    def transcribe(self, audio, lang_code, initial_prompt, model_name, language_profile, temperature=None,
+                   check_cancel=None):
+        import mlx_whisper
+        hf_name = self.resolve(model_name)
+        kwargs = self.options(language=lang_code, initial_prompt=initial_prompt or None,
+                              no_speech_threshold=0.6, compression_ratio_threshold=2.4,
+                              temperature=temperature)
+        with _mlx_lock:
+            _activar_mlx(hf_name, self.load(model_name))
+            result = mlx_whisper.transcribe(audio, path_or_hf_repo=hf_name, **kwargs)
+        return result.get("text", "").strip(), lang_code, _segmentos(result)
+
+
+class WhisperEngine(Engine):
+    """openai-whisper en CPU (PyTorch, fp32). Admite el modo audio largo en paralelo."""
+    name = "whisper"
+
+    @property
+    def loads_in_process(self) -> bool:
+        return config.CHUNK_WORKERS <= 1  # en modo paralelo el modelo vive en cada proceso
+
+    @property
+    def supports_batch(self) -> bool:
+        # Lotes y procesos en paralelo son alternativas: con CHUNK_WORKERS manda el pool
+        return config.CHUNK_WORKERS <= 1 and not getattr(self, "_sin_lotes", False)
+
+    @supports_batch.setter
+    def supports_batch(self, valor: bool) -> None:
+        self._sin_lotes = not valor
+
+    def available(self) -> bool:
+        return _instalado("whisper")
+
+    def resolve(self, model_name: str) -> str:
+        return OPENAI_FALLBACK_MODELS.get(model_name, model_name)
+
+    def load(self, model_name: str):
+        return _get_whisper_model(self.resolve(model_name))
+
+    def _capacidades(self):
+        from whisper.transcribe import transcribe
+        try:
+            from whisper.decoding import DecodingOptions
+        except ImportError:
+            DecodingOptions = None
+        return _parametros(transcribe, DecodingOptions)
+
+    def transcribe(self, audio, lang_code, initial_prompt, model_name, language_profile, temperature=None,
+                   check_cancel=None):
+        if temperature is None:
+            temperature = _temperatura(language_profile)
+        kwargs = self.options(
+            language=lang_code, initial_prompt=initial_prompt,
+            no_speech_threshold=0.6, compression_ratio_threshold=2.4,
+            condition_on_previous_text=True, temperature=temperature, fp16=False,
+        )
+        if config.CHUNK_WORKERS > 1:
+            paralelo = _transcribe_openai_chunks(audio, self.resolve(model_name), kwargs, check_cancel)
+            if paralelo is not None:
+                return paralelo[0], lang_code, paralelo[1]
+        result = self.load(model_name).transcribe(audio, **kwargs)
+        return (result.get("text") or "").strip(), lang_code, _segmentos(result)
+
+    def batch_features(self, model_name, audio):
+        import numpy as np
+        import torch
+        import whisper
+        model = self.load(model_name)
+        pcm = whisper.pad_or_trim(torch.from_numpy(np.asarray(audio, dtype=np.float32)))
+        return whisper.log_mel_spectrogram(pcm, model.dims.n_mels)
+
+    def decode_batch(self, model_name, mels, lang_code, initial_prompt, temperature):
+        import torch
+        import whisper
+        from whisper.tokenizer import get_tokenizer
+        model = self.load(model_name)
+        opciones = whisper.DecodingOptions(language=lang_code, prompt=initial_prompt or None,
+                                           temperature=temperature, fp16=False)
+        with torch.no_grad():
+            resultados = whisper.decode(model, torch.stack(mels).to(model.device), opciones)
+        tokenizer = get_tokenizer(model.is_multilingual, num_languages=model.num_languages,
+                                  language=lang_code, task="transcribe")
+        return [
+            _segmentos_de_tokens(r.tokens, tokenizer.timestamp_begin, tokenizer.decode, 30.0,
+                                 avg_logprob=r.avg_logprob, no_speech_prob=r.no_speech_prob)
+            if r.no_speech_prob <= 0.6 or r.avg_logprob >= -1.0 else []  # mismo umbral que transcribe()
+            for r in resultados
+        ]
+
+
+class FasterWhisperEngine(Engine):
+    """
+    faster-whisper sobre CTranslate2 en CPU con pesos cuantizados
+    (TRANSCRIPTOTEM_CT2_COMPUTE_TYPE, int8 por defecto): mismo modelo,
+    varias veces más rápido que openai-whisper en fp32 y con menos RAM.
+    """
+    name = "faster-whisper"
+    supports_batch = True
+
+    def available(self) -> bool:
+        return _instalado("faster_whisper")
+
+    def resolve(self, model_name: str) -> str:
+        return FASTER_WHISPER_MODELS.get(model_name) or OPENAI_FALLBACK_MODELS.get(model_name, model_name)
+
+    def load(self, model_name: str):
+        return _get_ct2_model(self.resolve(model_name))
+
+    def _capacidades(self):
+        from faster_whisper import WhisperModel
+        return _parametros(WhisperModel.transcribe)
+
+    def transcribe(self, audio, lang_code, initial_prompt, model_name, language_profile, temperature=None,
+                   check_cancel=None):
+        import numpy as np
+        if not isinstance(audio, str):
+            audio = np.asarray(audio, dtype=np.float32)
+        if temperature is None:
+            temperature = _temperatura(language_profile)
+        kwargs = self.options(
+            language=lang_code, initial_prompt=initial_prompt or None,
+            beam_size=config.CT2_BEAM_SIZE, temperature=temperature,
+            no_speech_threshold=0.6, compression_ratio_threshold=2.4,
+            condition_on_previous_text=True, vad_filter=False,  # el VAD ya se aplicó antes
+        )
+        generador, _ = self.load(model_name).transcribe(audio, **kwargs)
+        campos = ("start", "end", "text", "avg_logprob", "compression_ratio", "no_speech_prob")
+        segments = []
+        for seg in generador:  # la inferencia avanza al recorrerlo: se puede parar entre segmentos
+            segments.append({k: getattr(seg, k) for k in campos if hasattr(seg, k)})
+            if check_cancel is not None:
+                check_cancel()
+        return "".join(s.get("text", "") for s in segments).strip(), lang_code, segments
+
+    def batch_features(self, model_name, audio):
+        import numpy as np
+        extractor = self.load(model_name).feature_extractor
+        pcm = np.zeros(extractor.n_samples, dtype=np.float32)
+        trozo = np.asarray(audio[:extractor.n_samples], dtype=np.float32)
+        pcm[:len(trozo)] = trozo
+        mel = extractor(pcm)[:, :extractor.nb_max_frames]
+        return np.ascontiguousarray(mel, dtype=np.float32)
+
+    def decode_batch(self, model_name, mels, lang_code, initial_prompt, temperature):
+        import numpy as np
+        from faster_whisper.tokenizer import Tokenizer
+        model = self.load(model_name)
+        tokenizer = Tokenizer(model.hf_tokenizer, model.model.is_multilingual,
+                              task="transcribe", language=lang_code)
+        previos = tokenizer.encode(" " + initial_prompt.strip()) if initial_prompt else []
+        prompt = model.get_prompt(tokenizer, previos, without_timestamps=False)
+        salida = model.encode(np.stack(mels))
+        opciones = {"beam_size": config.CT2_BEAM_SIZE}
+        if temperature > 0:
+            opciones.update(beam_size=1, sampling_topk=0, sampling_temperature=temperature)
+        resultados = model.model.generate(
+            salida, [prompt] * len(mels), max_length=448, return_scores=True,
+            return_no_speech_prob=True, suppress_blank=True, suppress_tokens=[-1],
+            max_initial_timestamp_index=50, **opciones,
+        )
+        lotes = []
+        for r in resultados:
+            tokens = r.sequences_ids[0]
+            avg_logprob = r.scores[0] * len(tokens) / (len(tokens) + 1)  # igual que faster-whisper
+            if r.no_speech_prob > 0.6 and avg_logprob < -1.0:
+                lotes.append([])
+                continue
+            lotes.append(_segmentos_de_tokens(tokens, tokenizer.timestamp_begin, tokenizer.decode, 30.0,
+                                              avg_logprob=round(avg_logprob, 4),
+                                              no_speech_prob=round(r.no_speech_prob, 4)))
+        return lotes
+
+
+def _transcribe_openai_chunks(audio, model_name, kwargs, check_cancel=None):
+    """Modo audio largo: trozos en paralelo en un pool de procesos. None si no aplica."""
+    if isinstance(audio, str):
+        try:
+            from backend.audio import load_audio_cached
+            audio = load_audio_cached(audio)
+        except Exception as e:
+            print(f"⚠️ Modo paralelo desactivado: {e}", flush=True)
+            return None
+    if len(audio) < config.CHUNK_MIN_SECONDS * 16000:
+        return None
+    from backend.chunking import transcribe_parallel
+    text, segments, n = transcribe_parallel(
+        audio, model_name, kwargs,
+        workers=config.CHUNK_WORKERS, threads=config.CHUNK_THREADS,
+        chunk_s=config.CHUNK_SECONDS, overlap_s=config.CHUNK_OVERLAP, check_cancel=check_cancel,
     )
-    return (result.get("text") or "").strip(), lang_code, len(result.get("segments", []))
+    print(f"Modo paralelo: {n} trozos en {config.CHUNK_WORKERS} procesos "
+          f"× {config.CHUNK_THREADS} threads", flush=True)
+    return text, segments
+
+
+# Orden = preferencia de "auto": GPU de Apple, luego CPU cuantizado, luego CPU fp32
+ENGINES: dict[str, Engine] = {e.name: e for e in (MlxEngine(), FasterWhisperEngine(), WhisperEngine())}
+ENGINE_ALIASES = {
+    "mlx-whisper": "mlx",
+    "openai-whisper": "whisper",
+    "faster_whisper": "faster-whisper",
+    "ct2": "faster-whisper",
+    "ctranslate2": "faster-whisper",
+}
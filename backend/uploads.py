@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+"""
+Subidas por trozos, reanudables y deduplicadas por contenido.
+
+Protocolo (ver README, "Subidas reanudables"):
+  1. POST /api/uploads {filename, size, chunk_size?, chunks?, sha256?}
+     `chunks` es la lista de SHA-256 de cada trozo de `chunk_size` bytes.
+     Con ella (o con el `sha256` del archivo entero) el servidor reconoce un
+     audio que ya tiene y responde `complete` sin que se envíe nada; si no,
+     abre (o retoma) una sesión y responde el `offset` desde el que seguir.
+  2. PUT /api/uploads/{id}?offset=N con el trozo en el cuerpo y, opcional,
+     X-Chunk-Sha256. El trozo se escribe a disco en bloques a medida que
+     llega y solo avanza el offset si su checksum cuadra; si la conexión se
+     corta, GET /api/uploads/{id} dice dónde retomar.
+  3. Al completar, el archivo queda en un almacén direccionado por su
+     SHA-256 (DiskCache con LRU), que es también el `upload_id` con el que
+     se transcribe y la clave que usa la caché de transcripciones.
+
+La sesión vive en disco (partial/<id>.part + .json): sobrevive a reinicios
+y la puede continuar cualquier worker; un lock por sesión impide que dos
+peticiones escriban el mismo trozo a la vez.
+"""
+import hashlib
+import json
+import os
+import re
+import time
+import uuid
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Optional
+
+from backend.cache import DiskCache, clave, sha256_archivo
+from backend.workers import file_lock
+
+_RE_HEX = re.compile(r"^[0-9a-f]{64}$")
+_RE_ID = re.compile(r"^[0-9a-f]{32,64}$")
+
+
+class SubidaNoEncontrada(KeyError):
+    """No hay sesión ni archivo con ese id."""
+
+
+class ConflictoOffset(Exception):
+    """El trozo no empieza donde va la subida (o hay otro trozo en curso)."""
+
+    def __init__(self, mensaje: str, offset: int):
+        super().__init__(mensaje)
+        self.offset = offset
+
+
+class ChecksumInvalido(ValueError):
+    """El SHA-256 del trozo (o del archivo) no es el anunciado."""
+
+
+class TrozoDemasiadoGrande(ValueError):
+    """El cuerpo supera el trozo anunciado o lo que falta del archivo."""
+
+
+def _hex(valor, campo: str) -> Optional[str]:
+    if valor is None:
+        return None
+    valor = str(valor).lower()
+    if not _RE_HEX.match(valor):
+        raise ValueError(f"{campo} debe ser un SHA-256 en hexadecimal")
+    return valor
+
+
+class EscritorTrozo:
+    """Escribe un trozo a disco por bloques; solo commit() lo da por bueno."""
+
+    def __init__(self, almacen: "UploadStore", meta: dict, pila: ExitStack,
+                 esperado: Optional[str], limite: int):
+        self.almacen, self.meta, self._pila = almacen, meta, pila
+        self.esperado = esperado
+        self.limite = limite
+        self.inicio = meta["offset"]
+        self.escritos = 0
+        self._hash = hashlib.sha256()
+        self._f = pila.enter_context(open(almacen._parte(meta["id"]), "r+b"))
+        self._f.truncate(self.inicio)  # restos de un trozo anterior que no se confirmó
+        self._f.seek(self.inicio)
+
+    def write(self, datos: bytes) -> None:
+        self.escritos += len(datos)
+        if self.escritos > self.limite:
+            raise TrozoDemasiadoGrande(f"El trozo supera el máximo permitido ({self.limite} bytes)")
+        self._f.write(datos)
+        self._hash.update(datos)
+
+    def commit(self) -> dict:
+        try:
+            if not self.escritos:
+                raise ValueError("Trozo vacío")
+            if self.esperado and self._hash.hexdigest() != self.esperado:
+                raise ChecksumInvalido("El checksum del trozo no coincide; reenvíalo")
+            self._f.flush()
+            os.fsync(self._f.fileno())
+            self.meta["offset"] = self.inicio + self.escritos
+            self.meta["updated_at"] = time.time()
+            self.almacen._guardar_meta(self.meta)
+        except Exception:
+            self.abort()
+            raise
+        self._pila.close()
+        if self.meta["offset"] == self.meta["size"]:
+            return self.almacen._completar(self.meta)
+        return self.almacen._estado(self.meta)
+
+    def abort(self) -> None:
+        try:
+            self._f.truncate(self.inicio)
+        except (OSError, ValueError):
+            pass
+        self._pila.close()
+
+
+class UploadStore:
+    def __init__(self, directorio: Path, max_bytes: int, chunk_bytes: int,
+                 max_file_bytes: int, partial_ttl_s: float):
+        self.dir = Path(directorio)
+        self.partial = self.dir / "partial"
+        self.blobs = DiskCache(self.dir / "blobs", max_bytes, sufijo=".audio")
+        # sha256 -> {filename, size}; id de lista de trozos -> {sha256}
+        self.indice = DiskCache(self.dir / "index", 64 * 1024 * 1024, sufijo=".json")
+        self.chunk_bytes = chunk_bytes
+        self.max_file_bytes = max_file_bytes
+        self.partial_ttl_s = partial_ttl_s
+
+    # ── API ──────────────────────────────────────────────────
+
+    def create(self, filename: str, size: int, chunk_size: Optional[int] = None,
+               chunks: Optional[list] = None, sha256: Optional[str] = None) -> dict:
+        size = int(size)
+        if size <= 0:
+            raise ValueError("size debe ser mayor que 0")
+        if size > self.max_file_bytes:
+            raise ValueError(f"Archivo demasiado grande (máximo {self.max_file_bytes // (1024 * 1024)} MB)")
+        sha256 = _hex(sha256, "sha256")
+        chunk_size = int(chunk_size or self.chunk_bytes)
+        if chunks is not None:
+            chunks = [_hex(c, "chunks[]") for c in chunks]
+            if chunk_size <= 0 or len(chunks) != -(-size // chunk_size):
+                raise ValueError("chunks no cuadra con size / chunk_size")
+        self._limpiar()
+
+        # ¿Ya lo tenemos entero?
+        conocido = sha256
+        lista_id = clave("chunks", size, chunk_size, chunks) if chunks else None
+        if conocido is None and lista_id:
+            conocido = (self.indice.get_json(lista_id) or {}).get("sha256")
+        if conocido and self.blobs.get_path(conocido) is not None:
+            self._nombrar(conocido, filename, size)
+            return self.status(conocido) | {"deduplicated": True}
+
+        # Misma lista de trozos o mismo sha256 = misma sesión: se retoma
+        upload_id = lista_id or sha256 or uuid.uuid4().hex
+        with file_lock(f"upload-{upload_id}"):
+            meta = self._meta(upload_id)
+            if meta is None:
+                meta = {"id": upload_id, "filename": filename, "size": size, "chunk_size": chunk_size,
+                        "chunks": chunks, "sha256": sha256, "offset": 0,
+                        "created_at": time.time(), "updated_at": time.time()}
+                self.partial.mkdir(parents=True, exist_ok=True)
+                self._parte(upload_id).touch()
+                self._guardar_meta(meta)
+        return self._estado(meta) | {"deduplicated": False}
+
+    def status(self, upload_id: str) -> dict:
+        meta = self._meta(upload_id)
+        if meta is not None:
+            return self._estado(meta)
+        info = self.indice.get_json(upload_id) if _RE_ID.match(upload_id) else None
+        if info and "sha256" in info and "filename" not in info:  # id de lista de trozos
+            upload_id, info = info["sha256"], self.indice.get_json(info["sha256"])
+        if info is None or self.blobs.get_path(upload_id) is None:
+            raise SubidaNoEncontrada(upload_id)
+        return {"upload_id": upload_id, "filename": info.get("filename"), "size": info.get("size"),
+                "offset": info.get("size"), "complete": True, "sha256": upload_id}
+
+    def begin_chunk(self, upload_id: str, offset: int, checksum: Optional[str] = None) -> EscritorTrozo:
+        """Reserva la sesión para escribir un trozo que empieza en `offset`."""
+        checksum = _hex(checksum, "X-Chunk-Sha256")
+        pila = ExitStack()
+        try:
+            pila.enter_context(file_lock(f"upload-{upload_id}", esperar=False))
+        except BlockingIOError:
+            pila.close()
+            meta = self._meta(upload_id)
+            raise ConflictoOffset("Hay otro trozo de esta subida en curso", meta["offset"] if meta else 0)
+        try:
+            meta = self._meta(upload_id)
+            if meta is None:
+                raise SubidaNoEncontrada(upload_id)
+            if offset != meta["offset"]:
+                raise ConflictoOffset(f"La subida va en el byte {meta['offset']}", meta["offset"])
+            tamano = meta["chunk_size"]
+            esperado = checksum
+            if meta["chunks"]:
+                if offset % tamano:
+                    raise ConflictoOffset("El offset debe ser múltiplo de chunk_size", meta["offset"])
+                anunciado = meta["chunks"][offset // tamano]
+                if checksum and checksum != anunciado:
+                    raise ChecksumInvalido("X-Chunk-Sha256 no es el anunciado para este trozo")
+                esperado = anunciado
+            limite = min(tamano, meta["size"] - offset) if meta["chunks"] else meta["size"] - offset
+            return EscritorTrozo(self, meta, pila, esperado, limite)
+        except Exception:
+            pila.close()
+            raise
+
+    def delete(self, upload_id: str) -> bool:
+        with file_lock(f"upload-{upload_id}"):
+            if self._meta(upload_id) is None:
+                return False
+            self._borrar_sesion(upload_id)
+            return True
+
+    def path(self, upload_id: str) -> tuple[Path, str, Optional[str]]:
+        """(ruta, sha256, nombre) de una subida completa, para transcribirla."""
+        estado = self.status(upload_id)
+        if not estado["complete"]:
+            raise ConflictoOffset("La subida aún no está completa", estado["offset"])
+        ruta = self.blobs.get_path(estado["sha256"])
+        if ruta is None:
+            raise SubidaNoEncontrada(upload_id)
+        return ruta, estado["sha256"], estado.get("filename")
+
+    def stats(self) -> dict:
+        try:
+            sesiones = sum(1 for p in self.partial.iterdir() if p.suffix == ".json")
+        except OSError:
+            sesiones = 0
+        return {"partial_sessions": sesiones, **self.blobs.stats()}
+
+    # ── internos ─────────────────────────────────────────────
+
+    def _parte(self, upload_id: str) -> Path:
+        return self.partial / f"{upload_id}.part"
+
+    def _meta(self, upload_id: str) -> Optional[dict]:
+        if not _RE_ID.match(upload_id):
+            return None
+        try:
+            return json.loads((self.partial / f"{upload_id}.json").read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def _guardar_meta(self, meta: dict) -> None:
+        destino = self.partial / f"{meta['id']}.json"
+        tmp = destino.with_suffix(".tmp")
+        tmp.write_text(json.dumps(meta), encoding="utf-8")
+        os.replace(tmp, destino)
+
+    def _estado(self, meta: dict) -> dict:
+        return {"upload_id": meta["id"], "filename": meta["filename"], "size": meta["size"],
+                "offset": meta["offset"], "chunk_size": meta["chunk_size"], "complete": False}
+
+    def _nombrar(self, sha256: str, filename: str, size: int) -> None:
+        self.indice.put_json(sha256, {"filename": filename, "size": size})
+
+    def _completar(self, meta: dict) -> dict:
+        """Verifica el archivo entero y lo mueve al almacén por contenido."""
+        with file_lock(f"upload-{meta['id']}"):
+            parte = self._parte(meta["id"])
+            if self._meta(meta["id"]) is None:  # otra petición la completó primero
+                return self.status(meta["sha256"] or meta["id"])
+            sha = sha256_archivo(parte)
+            if meta["sha256"] and sha != meta["sha256"]:
+                self._borrar_sesion(meta["id"])
+                raise ChecksumInvalido("El SHA-256 del archivo no coincide; la subida se descartó")
+            self.blobs.put_file(sha, parte)
+            self._nombrar(sha, meta["filename"], meta["size"])
+            if meta["chunks"]:
+                self.indice.put_json(meta["id"], {"sha256": sha})
+            self._borrar_sesion(meta["id"])
+        return {"upload_id": sha, "filename": meta["filename"], "size": meta["size"],
+                "offset": meta["size"], "complete": True, "sha256": sha}
+
+    def _borrar_sesion(self, upload_id: str) -> None:
+        for p in (self._parte(upload_id), self.partial / f"{upload_id}.json"):
+            try:
+                p.unlink()
+            except OSError:
+                pass
+
+    def _limpiar(self) -> None:
+        """Borra sesiones abandonadas hace más de partial_ttl_s."""
+        limite = time.time() - self.partial_ttl_s
+        try:
+            metas = [p for p in self.partial.iterdir() if p.suffix == ".json"]
+        except OSError:
+            return
+        for p in metas:
+            try:
+                if p.stat().st_mtime < limite:
+                    self._borrar_sesion(p.stem)
+            except OSError:
+                pass
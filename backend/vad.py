@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Detección de voz (VAD) antes de la inferencia.
+
+Las grabaciones de clase tienen tramos largos sin voz (recreos, alumnos
+trabajando, la grabadora encendida antes de empezar). Enviarlos a Whisper
+cuesta cómputo y es justo donde aparecen las alucinaciones que luego
+_clean_transcript tiene que borrar.
+
+Todo está vectorizado con NumPy sobre tramas de 30 ms, por bloques de
+BLOQUE_TRAMAS tramas en float32 (la memoria extra no crece con la duración
+del audio):
+  1. energía (dB) por trama con umbral adaptativo al ruido de fondo;
+  2. fracción de energía espectral en la banda de voz (300–3400 Hz);
+  3. suavizado: margen alrededor de la voz, se rellenan pausas cortas
+     y se descartan ráfagas demasiado breves.
+El resultado es un mapa de regiones con voz. Solo esas regiones se
+concatenan (separadas por un breve silencio) y el mapa permite devolver
+los tiempos de cada segmento a la línea de tiempo original.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+FRAME_MS = 30
+BLOQUE_TRAMAS = 4096  # ~2 min de audio por bloque
+
+
+@dataclass
+class SpeechMap:
+    regions: np.ndarray        # (n, 2) muestras [inicio, fin) en el audio original
+    offsets: np.ndarray        # inicio de cada región dentro del audio comprimido
+    total_samples: int
+    gap_samples: int
+
+    @property
+    def speech_samples(self) -> int:
+        return int((self.regions[:, 1] - self.regions[:, 0]).sum()) if len(self.regions) else 0
+
+    def stats(self) -> dict:
+        total_s = self.total_samples / SAMPLE_RATE
+        voz_s = self.speech_samples / SAMPLE_RATE
+        return {
+            "audio_s": round(total_s, 2),
+            "speech_s": round(voz_s, 2),
+            "skipped_s": round(total_s - voz_s, 2),
+            "skipped_ratio": round(1 - voz_s / total_s, 4) if total_s else 0.0,
+            "regions": int(len(self.regions)),
+        }
+
+    def compress(self, audio: np.ndarray) -> np.ndarray:
+        """Concatena solo las regiones con voz, separadas por `gap_samples` de silencio."""
+        if not len(self.regions):
+            return np.zeros(0, dtype=np.float32)
+        hueco = np.zeros(self.gap_samples, dtype=np.float32)
+        partes = []
+        for i, (a, b) in enumerate(self.regions):
+            if i:
+                partes.append(hueco)
+            partes.append(audio[a:b])
+        return np.concatenate(partes).astype(np.float32, copy=False)
+
+    def to_original(self, t: float) -> float:
+        """Segundos en el audio comprimido → segundos en el audio original."""
+        if not len(self.regions):
+            return t
+        muestra = t * SAMPLE_RATE
+        i = int(np.searchsorted(self.offsets, muestra, side="right")) - 1
+        i = max(0, min(i, len(self.regions) - 1))
+        a, b = self.regions[i]
+        dentro = min(max(muestra - self.offsets[i], 0), b - a)
+        return float((a + dentro) / SAMPLE_RATE)
+
+    def remap_segments(self, segments: list[dict]) -> list[dict]:
+        for seg in segments:
+            seg["start"] = round(self.to_original(seg.get("start", 0.0)), 3)
+            seg["end"] = round(self.to_original(seg.get("end", 0.0)), 3)
+        return segments
+
+
+def _runs(mask: np.ndarray) -> np.ndarray:
+    """Pares [inicio, fin) de los tramos True consecutivos de una máscara booleana."""
+    d = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    return np.stack([np.flatnonzero(d == 1), np.flatnonzero(d == -1)], axis=1)
+
+
+def _medir(tramas: np.ndarray, ventana: np.ndarray, banda: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """(energía en dB, fracción de energía espectral en `banda`) de un bloque de tramas."""
+    energia_db = 10 * np.log10(np.einsum("ij,ij->i", tramas, tramas) / tramas.shape[1] + 1e-12)
+    espectro = np.fft.rfft(tramas * ventana, axis=1)
+    potencia = espectro.real ** 2 + espectro.imag ** 2
+    ratio = potencia[:, banda].sum(axis=1) / (potencia.sum(axis=1) + 1e-12)
+    return energia_db.astype(np.float32, copy=False), ratio.astype(np.float32, copy=False)
+
+
+def _dilatar(mask: np.ndarray, pad: int) -> np.ndarray:
+    """True en cada trama a ≤ `pad` tramas de una True (sumas acumuladas en int32)."""
+    n = len(mask)
+    acumulado = np.concatenate(([0], np.cumsum(mask, dtype=np.int32)))
+    i = np.arange(n)
+    return acumulado[np.minimum(i + pad + 1, n)] - acumulado[np.maximum(i - pad, 0)] > 0
+
+
+def detect_speech(
+    audio: np.ndarray,
+    sr: int = SAMPLE_RATE,
+    margin_db: float = 12.0,
+    min_db: float = -50.0,
+    band_ratio: float = 0.35,
+    pad_ms: int = 300,
+    min_silence_ms: int = 1500,
+    min_speech_ms: int = 250,
+    gap_ms: int = 400,
+) -> SpeechMap:
+    frame = sr * FRAME_MS // 1000
+    n = len(audio) // frame
+    if n == 0:
+        return SpeechMap(np.zeros((0, 2), dtype=np.int64), np.zeros(0, dtype=np.int64),
+                         len(audio), sr * gap_ms // 1000)
+    ventana = np.hanning(frame).astype(np.float32)
+    freqs = np.fft.rfftfreq(frame, 1 / sr)
+    banda = (freqs >= 300) & (freqs <= 3400)
+    energia_db = np.empty(n, dtype=np.float32)
+    ratio = np.empty(n, dtype=np.float32)
+    for i in range(0, n, BLOQUE_TRAMAS):
+        j = min(i + BLOQUE_TRAMAS, n)
+        # Vista sin copia si `audio` ya es float32 (también sobre un memmap)
+        tramas = np.asarray(audio[i * frame: j * frame], dtype=np.float32).reshape(j - i, frame)
+        energia_db[i:j], ratio[i:j] = _medir(tramas, ventana, banda)
+
+    # 1. Energía con umbral adaptativo: el percentil 10 se toma como ruido de fondo
+    umbral = max(np.percentile(energia_db, 10) + margin_db, min_db)
+    voz = energia_db > umbral
+
+    # 2. Proporción de energía en la banda de la voz humana
+    voz &= ratio > band_ratio
+
+    # 3. Suavizado: margen a cada lado, relleno de pausas cortas, descarte de ráfagas
+    pad = max(1, pad_ms // FRAME_MS)
+    voz = _dilatar(voz, pad)
+    tramos = _runs(voz)
+    if len(tramos) > 1:
+        pausa = tramos[1:, 0] - tramos[:-1, 1]
+        cortas = np.flatnonzero(pausa < min_silence_ms // FRAME_MS)
+        for i in cortas:
+            voz[tramos[i, 1]:tramos[i + 1, 0]] = True
+        tramos = _runs(voz)
+    if len(tramos):
+        tramos = tramos[(tramos[:, 1] - tramos[:, 0]) >= max(1, min_speech_ms // FRAME_MS)]
+
+    regiones = (tramos * frame).astype(np.int64)
+    if len(regiones):
+        regiones[-1, 1] = min(regiones[-1, 1], len(audio))
+        if regiones[-1, 1] == n * frame:
+            regiones[-1, 1] = len(audio)  # incluir la cola que no llena una trama
+    gap = sr * gap_ms // 1000
+    largos = regiones[:, 1] - regiones[:, 0] if len(regiones) else np.zeros(0, dtype=np.int64)
+    offsets = np.concatenate(([0], np.cumsum(largos + gap)[:-1])).astype(np.int64) if len(regiones) else largos
+    return SpeechMap(regiones, offsets, len(audio), gap)
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+"""
+Vigilante incremental de la carpeta Pendientes.
+
+Un archivo está listo cuando su tamaño y mtime no cambian durante
+`estable_s` segundos (OneDrive terminó de sincronizarlo). En lugar de
+dormir 1 s por archivo, uno detrás de otro, se sigue el estado de todos
+a la vez en un hilo y se mantiene en memoria el conjunto de listos:
+la petición de carpeta arranca con el primero que ya esté estable.
+
+Con varios workers cada uno puede tener su vigilante: reclamar un archivo
+toma además un lock entre procesos (workers.try_lock) que se suelta al
+liberarlo, así dos procesos nunca transcriben el mismo audio. Los que
+tiene otro worker no se ofrecen; se reintentan en el siguiente escaneo.
+
+Usa watchdog (inotify en Linux, FSEvents en macOS) si está instalado;
+si no, sondea la carpeta cada `intervalo` segundos con un solo scandir.
+La carpeta no se crea: si aún no existe (OneDrive sin montar) se sigue
+sondeando y los eventos se activan cuando aparece.
+"""
+import hashlib
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from backend import workers
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # watchdog es opcional
+    Observer = None
+    FileSystemEventHandler = object
+
+
+class _Avisador(FileSystemEventHandler):
+    def __init__(self, evento: threading.Event):
+        self.evento = evento
+
+    def on_any_event(self, event):
+        self.evento.set()
+
+
+class FolderWatcher:
+    def __init__(self, carpeta: Path, extensiones: set[str],
+                 estable_s: float = 1.0, intervalo: float = 1.0):
+        self.carpeta = Path(carpeta)
+        self.extensiones = {e.lower() for e in extensiones}
+        self.estable_s = estable_s
+        self.intervalo = intervalo
+        # ruta -> (tamaño, mtime, momento desde el que no cambia)
+        self._estado: dict[Path, tuple[int, float, float]] = {}
+        self._listos: set[Path] = set()
+        self._reclamados: set[Path] = set()
+        self._fallidos: dict[Path, tuple[int, float]] = {}
+        self._ajenos: set[Path] = set()  # listos, pero reclamados por otro worker
+        self._locks: dict[Path, Any] = {}  # reclamados -> lock entre procesos
+        self._cond = threading.Condition()
+        self._sucio = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+        self._observer = None
+        self._sin_eventos = Observer is None  # watchdog ausente o falló al arrancar
+        self._parar = False
+
+    # ── ciclo de vida ──────────────────────────────────────────
+
+    def start(self) -> None:
+        if self._hilo is not None:
+            return
+        self._parar = False
+        self._observar()
+        self._hilo = threading.Thread(target=self._bucle, name="watcher", daemon=True)
+        self._hilo.start()
+
+    def _observar(self) -> None:
+        """Arranca watchdog sobre la carpeta si existe; si no, se reintenta desde _bucle."""
+        if self._sin_eventos or self._observer is not None or not self.carpeta.is_dir():
+            return
+        try:
+            self._observer = Observer()
+            self._observer.schedule(_Avisador(self._sucio), str(self.carpeta), recursive=False)
+            self._observer.start()
+        except Exception as e:
+            print(f"⚠️ watchdog no disponible ({e}); se usará sondeo", flush=True)
+            self._observer = None
+            self._sin_eventos = True
+
+    def stop(self) -> None:
+        self._parar = True
+        self._sucio.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join(2)
+            self._observer = None
+        if self._hilo is not None:
+            self._hilo.join(2)
+            self._hilo = None
+
+    @property
+    def mode(self) -> str:
+        return "events" if self._observer is not None else "polling"
+
+    def _bucle(self) -> None:
+        while not self._parar:
+            self._observar()
+            self.refresh()
+            hay_inestables = self.pending_count() > 0
+            if self._observer is not None and not hay_inestables:
+                espera = 30.0  # solo un repaso de seguridad; los eventos despiertan antes
+            else:
+                espera = min(self.intervalo, self.estable_s) if hay_inestables else self.intervalo
+            self._sucio.wait(espera)
+            self._sucio.clear()
+
+    # ── escaneo ───────────────────────────────────────────────
+
+    def refresh(self) -> None:
+        """Un único scandir: actualiza tamaños/mtimes y promueve los estables."""
+        ahora = time.time()
+        vistos: dict[Path, tuple[int, float]] = {}
+        try:
+            with os.scandir(self.carpeta) as it:
+                for e in it:
+                    if os.path.splitext(e.name)[1].lower() not in self.extensiones:
+                        continue
+                    try:
+                        if not e.is_file():
+                            continue
+                        st = e.stat()
+                    except FileNotFoundError:
+                        continue
+                    vistos[Path(e.path)] = (st.st_size, st.st_mtime)
+        except FileNotFoundError:
+            pass
+
+        with self._cond:
+            self._ajenos.clear()  # se vuelven a ofrecer: su dueño pudo soltarlos sin terminar
+            for p in list(self._estado):
+                if p not in vistos:
+                    del self._estado[p]
+                    self._listos.discard(p)
+                    self._reclamados.discard(p)
+                    self._fallidos.pop(p, None)
+            for p, (size, mtime) in vistos.items():
+                previo = self._estado.get(p)
+                if previo is None or previo[:2] != (size, mtime):
+                    self._estado[p] = (size, mtime, ahora)
+                    self._listos.discard(p)
+                    if self._fallidos.get(p) != (size, mtime):
+                        self._fallidos.pop(p, None)
+            nuevos = False
+            for p, (size, mtime, desde) in self._estado.items():
+                if p in self._reclamados or p in self._fallidos or p in self._listos:
+                    continue
+                if size > 0 and ahora - desde >= self.estable_s:
+                    self._listos.add(p)
+                    nuevos = True
+            if nuevos:
+                self._cond.notify_all()
+
+    # ── consumo ───────────────────────────────────────────────
+
+    def ready(self) -> list[Path]:
+        with self._cond:
+            return sorted(self._listos)
+
+    def pending_count(self) -> int:
+        """Archivos vistos que aún están cambiando (sincronizándose)."""
+        with self._cond:
+            return sum(1 for p in self._estado
+                       if p not in self._listos and p not in self._reclamados
+                       and p not in self._fallidos and p not in self._ajenos)
+
+    def _bloquear(self, p: Path) -> bool:
+        """Lock entre procesos de un archivo listo (con self._cond tomado)."""
+        self._listos.discard(p)
+        nombre = "claim-" + hashlib.sha1(str(p.absolute()).encode("utf-8")).hexdigest()[:16]
+        lock = workers.try_lock(nombre)
+        if lock is None:
+            self._ajenos.add(p)
+            return False
+        if not p.exists():  # otro worker lo terminó y archivó entre el escaneo y el lock
+            workers.unlock(lock, borrar=True)
+            return False
+        self._locks[p] = lock
+        self._reclamados.add(p)
+        return True
+
+    def claim_next(self, timeout: float, follow: bool = False,
+                   orden: Optional[Callable[[Path], Any]] = None) -> Optional[Path]:
+        """
+        Reserva el siguiente archivo listo que no tenga otro worker: el
+        menor según `orden` (se llama con el lock tomado: debe ser barato)
+        o, sin él, el primero por nombre. Espera mientras haya archivos sincronizándose, o siempre con
+        `follow`, hasta `timeout`.
+        """
+        limite = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                for p in sorted(self._listos, key=orden) if orden else sorted(self._listos):
+                    if self._bloquear(p):
+                        return p
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    return None
+                if not follow and not any(p not in self._reclamados and p not in self._fallidos
+                                          and p not in self._ajenos for p in self._estado):
+                    return None
+                self._cond.wait(min(restante, self.intervalo))
+
+    def claim(self, ruta: Path) -> bool:
+        """Reserva un archivo concreto si está listo."""
+        with self._cond:
+            return ruta in self._listos and self._bloquear(ruta)
+
+    def release(self, ruta: Path, failed: bool = False) -> None:
+        """
+        Libera un archivo reservado. Si se procesó bien se olvida (si siguiera
+        en la carpeta, el próximo escaneo lo trataría como nuevo). Si falló,
+        no se vuelve a ofrecer hasta que cambie en disco, así el modo continuo
+        no reintenta en bucle.
+        """
+        with self._cond:
+            self._reclamados.discard(ruta)
+            workers.unlock(self._locks.pop(ruta, None), borrar=True)
+            previo = self._estado.pop(ruta, None)
+            if previo is not None and failed:
+                self._estado[ruta] = previo
+                self._fallidos[ruta] = previo[:2]
+
+    def forget_failures(self) -> None:
+        with self._cond:
+            self._fallidos.clear()
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Coordinación entre los procesos del modo servidor (main.py --prod --workers N).
+
+Cada worker de uvicorn es un proceso aparte que comparte DATA_DIR con los
+demás (cachés de transcripciones y de audio decodificado, journal de
+trabajos, manifiesto de la carpeta). Se coordinan con flock sobre archivos
+de DATA_DIR/locks, que el sistema libera solo si un proceso muere:
+  - slot(): índice estable del worker (0..N-1), el primer lock libre.
+    La cola de trabajos usa un journal por slot y el slot 0 es el líder,
+    el único que vigila Pendientes en modo continuo.
+  - file_lock(nombre): exclusión entre procesos (y entre hilos), p. ej.
+    para que dos workers no descarguen el mismo modelo a la vez.
+  - try_lock(nombre) / unlock(): el mismo lock sin bloque `with`, para
+    reservas que duran más que una llamada (un audio de Pendientes que un
+    worker está transcribiendo).
+Sin fcntl (Windows) todo proceso es el slot 0 y los locks no hacen nada:
+allí solo tiene sentido un worker.
+"""
+import os
+import re
+import threading
+from contextlib import contextmanager
+from typing import Optional
+
+from backend import config
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+LOCKS_DIR = config.DATA_DIR / "locks"
+
+_slot: Optional[int] = None
+_slot_archivo = None  # abierto mientras viva el proceso: mantiene el lock
+_slot_lock = threading.Lock()
+
+# Lo que devuelve try_lock() sin fcntl: siempre se concede
+SIN_LOCK = object()
+
+
+def slot(max_slots: int = 256) -> int:
+    """Índice de este worker; se reserva la primera vez que se pide."""
+    global _slot, _slot_archivo
+    with _slot_lock:
+        if _slot is None:
+            _slot = 0
+            if fcntl is not None:
+                LOCKS_DIR.mkdir(parents=True, exist_ok=True)
+                for i in range(max_slots):
+                    f = open(LOCKS_DIR / f"worker-{i}.lock", "a+")
+                    try:
+                        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except OSError:
+                        f.close()
+                        continue
+                    _slot, _slot_archivo = i, f
+                    break
+        return _slot
+
+
+def is_leader() -> bool:
+    return slot() == 0
+
+
+def _ruta_lock(nombre: str):
+    LOCKS_DIR.mkdir(parents=True, exist_ok=True)
+    return LOCKS_DIR / (re.sub(r"[^\w.-]", "_", nombre) + ".lock")
+
+
+@contextmanager
+def file_lock(nombre: str, esperar: bool = True):
+    """
+    Lock exclusivo entre procesos sobre DATA_DIR/locks/<nombre>.lock. Con
+    esperar=False lanza BlockingIOError si otro lo tiene.
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(_ruta_lock(nombre), "a+") as f:
+        fcntl.flock(f, fcntl.LOCK_EX if esperar else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def try_lock(nombre: str):
+    """
+    Toma DATA_DIR/locks/<nombre>.lock sin esperar: devuelve el archivo
+    abierto (se suelta con unlock) o None si lo tiene otro proceso u otro
+    hilo. El lock no se hereda al reabrir: cada llamada abre el suyo.
+    """
+    if fcntl is None:
+        return SIN_LOCK
+    ruta = _ruta_lock(nombre)
+    f = open(ruta, "a+")
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        # Si quien lo tenía lo borró al soltarlo, este inodo ya no es el lock
+        if os.fstat(f.fileno()).st_ino != os.stat(ruta).st_ino:
+            raise FileNotFoundError(ruta)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+
+def unlock(f, borrar: bool = False) -> None:
+    """Suelta un lock de try_lock(); con `borrar` elimina antes su archivo."""
+    if f is SIN_LOCK or f is None:
+        return
+    try:
+        if borrar:
+            try:
+                os.unlink(f.name)
+            except OSError:
+                pass
+        fcntl.flock(f, fcntl.LOCK_UN)
+    finally:
+        f.close()
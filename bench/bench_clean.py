@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""
+Equivalencia y coste de _clean_transcript.
+
+    python -m bench.bench_clean            # corpus dorado + fuzz + escalado
+    python -m bench.bench_clean --regen    # regenera los .golden con la versión regex
+
+1. Corpus dorado: cada bench/corpus/*.txt tiene su salida esperada en
+   *.golden, generada con la implementación original basada en regex
+   (copiada abajo tal cual como referencia).
+2. Fuzz: miles de textos aleatorios con repeticiones, mayúsculas, acentos
+   y puntuación; la versión nueva debe coincidir carácter a carácter.
+3. Escalado: tiempo de ambas versiones al duplicar el tamaño del texto,
+   con texto de clase normal y con el peor caso repetitivo.
+Sale con código 1 si alguna salida difiere.
+"""
+import argparse
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+from backend.transcriber import _clean_transcript
+
+CORPUS = Path(__file__).resolve().parent / "corpus"
+
+
+def _clean_transcript_regex(text: str) -> str:
+    """Implementación original (referencia). No tocar."""
+    if not text:
+        return ""
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    text = re.sub(r"\b(\w+)(?:\s+\1){4,}\b", r"\1", text, flags=re.IGNORECASE)
+    text = re.sub(r"\b((?:\w+\s+){1,4}\w+)(?:\s+\1){4,}\b", r"\1", text, flags=re.IGNORECASE)
+    cleaned_lines = []
+    for line in text.split("\n"):
+        raw = line.strip()
+        if not raw:
+            cleaned_lines.append("")
+            continue
+        if re.fullmatch(r"[.\s…]+", raw):
+            continue
+        if re.fullmatch(r"[^\wáéíóúñÁÉÍÓÚÑ]+", raw):
+            continue
+        tokens = re.findall(r"[a-záéíóúñ]+", raw.lower())
+        if len(tokens) >= 2 and len(set(tokens)) == 1:
+            continue
+        if re.search(r"(.)\1{4,}", raw):
+            continue
+        raw_stripped = re.sub(r"\s+", " ", raw.strip())
+        if re.search(r"\b(\w{1,3})(?:\s+\1){4,}\b", raw_stripped, re.IGNORECASE):
+            continue
+        letters = re.findall(r"[a-záéíóúñ]", raw.lower())
+        if letters and (len(letters) / max(len(raw), 1)) < 0.25:
+            continue
+        cleaned_lines.append(line)
+    out = "\n".join(cleaned_lines)
+    out = re.sub(r"\n{4,}", "\n\n\n", out)
+    return out.strip()
+
+
+# ══════════════════════════════════════════════════════════════════
+# GENERADORES
+# ══════════════════════════════════════════════════════════════════
+
+VOCAB = (
+    "la de el que y en los se del las un por con no una su para es al lo como más "
+    "utilidad marginal función demanda elasticidad precio consumidor preferencias "
+    "Kahneman Lagrange óptimo restricción presupuestaria economía conductual "
+    "entonces bueno ya ok sí claro Gracias EL LA Función Económica niño año "
+    "x2 3 10 modelo_1"
+).split()
+SEPS = [" "] * 12 + ["  ", "\n", " \n", "\t", ", ", ". ", "... ", "\n\n", "\n\n\n\n\n", " ¿", "? "]
+RUIDO = ["...", "♪♪♪", "…", "[Música]", "aaaaaa", "jajajajaja", "- -", "¡¡¡", "123 456", "¿?"]
+
+
+def texto_aleatorio(rng: random.Random, palabras: int) -> str:
+    partes = []
+    while len(partes) < palabras * 2:
+        r = rng.random()
+        if r < 0.08:
+            # frase repetida: Whisper atascado
+            k = rng.randint(1, 6)
+            frase = [rng.choice(VOCAB) for _ in range(k)]
+            sep_int = rng.choice([" ", " ", "  ", "\n"])
+            reps = rng.randint(3, 9)
+            for _ in range(reps):
+                f = [w.upper() if rng.random() < 0.1 else w for w in frase]
+                partes.append(sep_int.join(f))
+                partes.append(rng.choice([" ", " ", " ", "\n", "  ", ", "]))
+        elif r < 0.11:
+            partes.append(rng.choice(RUIDO))
+            partes.append(rng.choice(SEPS))
+        else:
+            partes.append(rng.choice(VOCAB))
+            partes.append(rng.choice(SEPS))
+    return "".join(partes)
+
+
+def clase_realista(rng: random.Random, palabras: int) -> str:
+    """Texto de clase con alguna alucinación aislada, líneas de ~20 palabras."""
+    lineas, n = [], 0
+    while n < palabras:
+        k = rng.randint(8, 30)
+        linea = " ".join(rng.choice(VOCAB[:60]) for _ in range(k))
+        if rng.random() < 0.02:
+            linea += " " + " ".join(["Gracias por ver el video."] * rng.randint(5, 12))
+        lineas.append(linea.capitalize() + ".")
+        n += k
+    return "\n".join(lineas)
+
+
+def peor_caso(palabras: int) -> str:
+    """
+    Frases de 4 palabras repetidas 4 veces (una menos de lo que colapsa) con
+    palabras largas: obliga a la regex a probar todas las longitudes de
+    grupo en cada posición y a retroceder carácter a carácter.
+    """
+    bloques, n, i = [], 0, 0
+    while n < palabras:
+        frase = " ".join(f"palabralarguisima{i % 7}{j}" * 3 for j in range(4))
+        bloques.append(" ".join([frase] * 4))
+        n += 16
+        i += 1
+    return " ".join(bloques)
+
+
+# ══════════════════════════════════════════════════════════════════
+# COMPROBACIONES
+# ══════════════════════════════════════════════════════════════════
+
+def comprobar_corpus(regen: bool) -> int:
+    fallos = 0
+    entradas = sorted(CORPUS.glob("*.txt"))
+    for entrada in entradas:
+        texto = entrada.read_text(encoding="utf-8")
+        dorado = entrada.with_suffix(".golden")
+        if regen:
+            dorado.write_text(_clean_transcript_regex(texto), encoding="utf-8")
+        esperado = dorado.read_text(encoding="utf-8")
+        if _clean_transcript(texto) != esperado:
+            fallos += 1
+            print(f"  ✗ {entrada.name}")
+    print(f"Corpus dorado: {len(entradas) - fallos}/{len(entradas)} idénticos")
+    return fallos
+
+
+def comprobar_fuzz(casos: int, seed: int = 1234) -> int:
+    rng = random.Random(seed)
+    fallos = 0
+    for i in range(casos):
+        texto = texto_aleatorio(rng, rng.randint(1, 300))
+        if _clean_transcript(texto) != _clean_transcript_regex(texto):
+            fallos += 1
+            if fallos <= 3:
+                print(f"  ✗ caso {i}: {texto[:120]!r}")
+    print(f"Fuzz: {casos - fallos}/{casos} idénticos")
+    return fallos
+
+
+def _medir(fn, texto: str, repeticiones: int = 3) -> float:
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        fn(texto)
+        mejor = min(mejor, time.perf_counter() - t0)
+    return mejor
+
+
+def escalado(max_palabras: int) -> list[dict]:
+    rng = random.Random(7)
+    filas = []
+    for nombre, gen in (("clase", lambda n: clase_realista(rng, n)), ("peor_caso", peor_caso)):
+        n = 2000
+        while n <= max_palabras:
+            texto = gen(n)
+            t_old = _medir(_clean_transcript_regex, texto)
+            t_new = _medir(_clean_transcript, texto)
+            filas.append({"input": nombre, "words": n, "chars": len(texto),
+                          "regex_s": round(t_old, 4), "linear_s": round(t_new, 4),
+                          "speedup": round(t_old / t_new, 2) if t_new else None})
+            n *= 2
+    return filas
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--regen", action="store_true", help="regenerar los .golden con la versión regex")
+    ap.add_argument("--fuzz", type=int, default=3000, help="nº de textos aleatorios")
+    ap.add_argument("--max-words", type=int, default=256000, help="tamaño máximo en el escalado")
+    args = ap.parse_args(argv)
+
+    fallos = comprobar_corpus(args.regen) + comprobar_fuzz(args.fuzz)
+    print(f"\n{'entrada':<10} {'palabras':>9} {'regex (s)':>10} {'lineal (s)':>11} {'×':>7}")
+    for f in escalado(args.max_words):
+        print(f"{f['input']:<10} {f['words']:>9} {f['regex_s']:>10} {f['linear_s']:>11} {f['speedup']:>7}")
+    return 1 if fallos else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
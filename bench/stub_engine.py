@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Sustitutos deterministas de mlx_whisper, faster-whisper y openai-whisper.
+
+install() registra módulos falsos `whisper`, `faster_whisper` o
+`mlx_whisper` (+ `mlx.core`) en sys.modules y oculta los otros motores, así que transcriber.py recorre su camino real —registro
+de modelos, calentamiento, VAD, cachés— y solo la
+inferencia se reemplaza por:
+  - una espera de `rtf` × duración del audio recibido (y `load_s` al cargar),
+    serializada entre hilos como en un dispositivo real;
+  - segmentos de 2–8 s con texto de clase, métricas de confianza
+    plausibles y, de vez en cuando, una alucinación repetida para que
+    _clean_transcript tenga trabajo.
+La salida depende solo del audio (longitud y primeras muestras).
+"""
+import random
+import sys
+import threading
+import time
+import types
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+FRASES = (
+    "Bueno, entonces la utilidad marginal es la derivada de la función de utilidad.",
+    "Si el precio sube, la cantidad demandada baja, eso es lo que vimos la clase pasada.",
+    "Fíjense que la restricción presupuestaria es una recta con pendiente menos p1 sobre p2.",
+    "Kahneman y Tversky muestran que las pérdidas pesan más que las ganancias.",
+    "Ok, ¿alguna pregunta hasta aquí?",
+    "Planteamos el lagrangiano y derivamos con respecto a x1, x2 y lambda.",
+    "La elasticidad precio de la demanda mide la sensibilidad de la cantidad.",
+    "Esto va a salir en la prueba, así que anótenlo.",
+    "En el óptimo, la tasa marginal de sustitución iguala el cociente de precios.",
+    "Ya, sigamos con el ejemplo del consumidor que tiene preferencias Cobb-Douglas.",
+)
+ALUCINACION = "Gracias por ver el video."
+
+# Una inferencia a la vez, como un dispositivo (GPU o todos los cores) saturado
+_dispositivo = threading.Lock()
+
+
+def _semilla(audio: np.ndarray) -> int:
+    cabeza = np.asarray(audio[:SAMPLE_RATE], dtype=np.float32)
+    return len(audio) * 1000003 + int(np.abs(cabeza).sum() * 1000)
+
+
+def fake_result(audio, language: str = "es", rtf: float = 0.05) -> dict:
+    """Lo que devolvería model.transcribe(audio) tras `rtf` × duración de espera."""
+    if isinstance(audio, str):
+        from backend.audio import load_audio
+        audio = load_audio(audio)
+    duracion = len(audio) / SAMPLE_RATE
+    if rtf:
+        with _dispositivo:
+            time.sleep(duracion * rtf)
+    rng = random.Random(_semilla(audio))
+    segmentos, t = [], 0.0
+    while t < duracion - 0.5:
+        fin = min(duracion, t + rng.uniform(2.0, 8.0))
+        texto = " " + rng.choice(FRASES)
+        if rng.random() < 0.02:
+            texto += (" " + ALUCINACION) * rng.randint(5, 10)
+        segmentos.append({
+            "id": len(segmentos), "start": round(t, 2), "end": round(fin, 2), "text": texto,
+            "avg_logprob": round(rng.uniform(-0.9, -0.1), 3),
+            "compression_ratio": round(rng.uniform(1.1, 2.2), 3),
+            "no_speech_prob": round(rng.uniform(0.0, 0.3), 3),
+        })
+        t = fin
+    return {"text": "".join(s["text"] for s in segmentos), "segments": segmentos,
+            "language": language}
+
+
+class StubModel:
+    """Sustituto de whisper.model.Whisper."""
+
+    def __init__(self, name: str, rtf: float):
+        self.name = name
+        self.rtf = rtf
+
+    def transcribe(self, audio, language: str = "es", **kwargs) -> dict:
+        return fake_result(audio, language, self.rtf)
+
+
+class StubCT2Model(StubModel):
+    """Sustituto de faster_whisper.WhisperModel: devuelve (generador de segmentos, info)."""
+
+    def transcribe(self, audio, language: str = "es", **kwargs):
+        resultado = fake_result(audio, language, self.rtf)
+        segmentos = (types.SimpleNamespace(**s) for s in resultado["segments"])
+        return segmentos, types.SimpleNamespace(language=language)
+
+
+def install(engine: str = "whisper", rtf: float = 0.05, load_s: float = 0.5) -> None:
+    """
+    Instala el motor falso y lo deja como único detectable. Debe llamarse
+    antes de la primera transcripción (transcriber detecta el motor una vez).
+    """
+    # Aunque los reales estén instalados, que "auto" elija el falso
+    for nombre in ("mlx_whisper", "faster_whisper", "whisper"):
+        sys.modules[nombre] = None
+    if engine == "whisper":
+        mod = types.ModuleType("whisper")
+
+        def load_model(name, device="cpu", **kwargs):
+            time.sleep(load_s)
+            return StubModel(name, rtf)
+
+        mod.load_model = load_model
+        sys.modules["whisper"] = mod
+    elif engine == "faster-whisper":
+        mod = types.ModuleType("faster_whisper")
+
+        class WhisperModel(StubCT2Model):
+            def __init__(self, name, device="cpu", compute_type="default", **kwargs):
+                time.sleep(load_s)
+                super().__init__(name, rtf)
+
+        mod.WhisperModel = WhisperModel
+        sys.modules["faster_whisper"] = mod
+    elif engine == "mlx":
+        mlx = types.ModuleType("mlx")
+        core = types.ModuleType("mlx.core")
+        core.float16 = "float16"
+        mlx.core = core
+        paquete = types.ModuleType("mlx_whisper")
+        paquete.__path__ = []
+        cargas = types.ModuleType("mlx_whisper.load_models")
+
+        def load_model(hf_name, dtype=None):
+            time.sleep(load_s)
+            return StubModel(hf_name, rtf)
+
+        def transcribe(audio, path_or_hf_repo=None, language="es", **kwargs):
+            return fake_result(audio, language, rtf)
+
+        cargas.load_model = load_model
+        paquete.load_models = cargas
+        paquete.transcribe = transcribe
+        sys.modules.update({"mlx": mlx, "mlx.core": core, "mlx_whisper": paquete,
+                            "mlx_whisper.load_models": cargas})
+    else:
+        raise ValueError(f"motor desconocido: {engine}")
+
+    from backend import transcriber
+    transcriber._engine = None  # que vuelva a detectar
+    for motor in transcriber.ENGINES.values():
+        motor.__dict__.pop("_caps", None)
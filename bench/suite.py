@@ -0,0 +1,488 @@
+# -*- coding: utf-8 -*-
+"""
+Suite de rendimiento reproducible, sin red ni GPU.
+
+    python -m bench.suite                        # motor falso, tamaños por defecto
+    python -m bench.suite --quick                # pasada corta (~1 min)
+    python -m bench.suite --real                 # Whisper `tiny` real si está instalado
+    python -m bench.suite --real --engine faster-whisper   # idem con CTranslate2 int8
+    python -m bench.suite --compare a.json b.json
+
+Mide, con audio sintético de clase (bench/synth.py) y el motor falso de
+bench/stub_engine.py (o uno real):
+
+  latencia     transcribe() de extremo a extremo por duración de audio,
+               con la caché de audio decodificado fría y caliente; RTF
+  concurrencia N subidas a /api/transcribe contra un uvicorn local con
+               distintos niveles de concurrencia: archivos/s, p50/p95
+  carpeta      FolderPipeline sobre una carpeta Pendientes temporal
+  limpieza     coste de _clean_transcript sobre transcripciones largas
+  exportacion  /api/export/pdf, /docx y /zip con una clase de 1 h: primera
+               exportación y repetida (caché)
+  busqueda     índice FTS5 de N horas de clases (search.py): indexado y
+               latencia p50/p95 de palabras frecuentes, raras, frases y prefijos
+
+Cada ejecución usa un DATA_DIR temporal (cachés vacías) y escribe un JSON
+en bench/results/<fecha>-<commit>.json con los metadatos de la máquina y
+del commit; --compare muestra la razón nueva/vieja de cada métrica.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+RESULTS_DIR = BENCH_DIR / "results"
+
+
+# ══════════════════════════════════════════════════════════════════
+# ENTORNO
+# ══════════════════════════════════════════════════════════════════
+
+def _git(*args) -> str | None:
+    try:
+        return subprocess.run(["git", *args], cwd=BENCH_DIR, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _preparar_entorno(args) -> dict:
+    """
+    Debe correr antes de importar backend: config lee las variables al
+    importarse. Devuelve los metadatos que acompañan a los resultados.
+    """
+    data_dir = Path(tempfile.mkdtemp(prefix="transcriptotem-bench-"))
+    os.environ["TRANSCRIPTOTEM_DATA_DIR"] = str(data_dir)
+    os.environ.setdefault("TRANSCRIPTOTEM_CHUNK_WORKERS", "0")  # el pool no ve el motor falso
+
+    if args.real:
+        if args.engine:
+            os.environ["TRANSCRIPTOTEM_ENGINE"] = args.engine
+    else:
+        from bench import stub_engine
+        stub_engine.install(args.engine or "whisper", rtf=args.rtf, load_s=args.load_s)
+
+    ffmpeg = shutil.which("ffmpeg") is not None
+    if not ffmpeg:
+        # Sin ffmpeg se leen los WAV sintéticos directamente (audio.probe ya mide WAV sin ffprobe)
+        from backend import audio
+        from bench.synth import read_wav
+        audio.load_audio = read_wav
+
+    from backend import config
+    from backend.transcriber import _detect_engine
+    return {
+        "commit": _git("rev-parse", "--short", "HEAD"),
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "engine": _detect_engine(),
+        "stub": not args.real,
+        "stub_rtf": None if args.real else args.rtf,
+        "model": args.model,
+        "ffmpeg": ffmpeg,
+        "vad": config.VAD_ENABLED,
+        "data_dir": str(data_dir),
+    }
+
+
+def _percentil(valores: list[float], p: float) -> float:
+    v = sorted(valores)
+    return v[min(len(v) - 1, int(round(p / 100 * (len(v) - 1))))]
+
+
+def _r(x: float, n: int = 4) -> float:
+    return round(x, n)
+
+
+# ══════════════════════════════════════════════════════════════════
+# AUDIO
+# ══════════════════════════════════════════════════════════════════
+
+def _audios(carpeta: Path, duraciones: list[float], seed: int) -> list[Path]:
+    """Un WAV por duración; semillas distintas = contenidos (hashes) distintos."""
+    from bench.synth import lecture_audio, write_wav
+    carpeta.mkdir(parents=True, exist_ok=True)
+    rutas = []
+    for i, d in enumerate(duraciones):
+        ruta = carpeta / f"clase_{seed}_{i}_{int(d)}s.wav"
+        if not ruta.exists():
+            write_wav(ruta, lecture_audio(d, seed=seed * 1000 + i))
+        rutas.append(ruta)
+    return rutas
+
+
+# ══════════════════════════════════════════════════════════════════
+# MEDICIONES
+# ══════════════════════════════════════════════════════════════════
+
+def medir_latencia(tmp: Path, duraciones: list[float], model: str) -> dict:
+    from backend.transcriber import transcribe
+    from bench.synth import wav_duration
+
+    # El primer uso carga (y calienta) el modelo: se mide aparte
+    corto = _audios(tmp / "calentamiento", [5.0], seed=99)[0]
+    t0 = time.perf_counter()
+    transcribe(str(corto), model_name=model, use_cache=False)
+    salida = {"model_load_s": _r(time.perf_counter() - t0)}
+
+    for ruta in _audios(tmp / "latencia", duraciones, seed=1):
+        dur = wav_duration(ruta)
+        fila = {"audio_s": dur}
+        for fase in ("frio", "caliente"):
+            info = {}
+            t0 = time.perf_counter()
+            text, _, n = transcribe(str(ruta), model_name=model, use_cache=False, info=info)
+            lat = time.perf_counter() - t0
+            fila[fase] = {"latency_s": _r(lat), "rtf": _r(lat / dur, 5),
+                          "decode_s": (info.get("decode") or {}).get("decode_s"),
+                          "vad_skipped_s": (info.get("vad") or {}).get("skipped_s"),
+                          "segments": n, "chars": len(text)}
+        transcribe(str(ruta), model_name=model, use_cache=True)  # llena la caché de texto
+        t0 = time.perf_counter()
+        transcribe(str(ruta), model_name=model, use_cache=True)  # acierto
+        fila["cache_hit_latency_s"] = _r(time.perf_counter() - t0)
+        salida[f"{int(dur)}s"] = fila
+        print(f"  latencia {int(dur):>5}s  frío {fila['frio']['latency_s']:>8.3f}s "
+              f"(RTF {fila['frio']['rtf']:.4f})  caliente {fila['caliente']['latency_s']:>8.3f}s  "
+              f"caché {fila['cache_hit_latency_s']:.3f}s", flush=True)
+    return salida
+
+
+class _Servidor:
+    """uvicorn con la app real en un hilo, en un puerto libre de localhost."""
+
+    def __init__(self):
+        import uvicorn
+        from backend.app import app
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            self.port = s.getsockname()[1]
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=self.port,
+                                                    log_level="warning", access_log=False))
+        self.hilo = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self):
+        self.hilo.start()
+        limite = time.monotonic() + 30
+        while not self.server.started:
+            if time.monotonic() > limite or not self.hilo.is_alive():
+                raise RuntimeError("uvicorn no arrancó")
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.hilo.join(10)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def post(self, ruta: str, cuerpo: bytes, tipo: str) -> tuple[int, bytes]:
+        req = urllib.request.Request(self.url + ruta, data=cuerpo, method="POST",
+                                     headers={"Content-Type": tipo})
+        with urllib.request.urlopen(req, timeout=3600) as r:
+            return r.status, r.read()
+
+    def post_json(self, ruta: str, obj) -> tuple[int, bytes]:
+        return self.post(ruta, json.dumps(obj).encode("utf-8"), "application/json")
+
+    def post_audio(self, ruta: str, archivo: Path, campos: dict) -> tuple[int, bytes]:
+        limite = uuid.uuid4().hex
+        partes = []
+        for k, v in campos.items():
+            partes.append(f'--{limite}\r\nContent-Disposition: form-data; name="{k}"\r\n\r\n{v}\r\n'.encode())
+        partes.append(f'--{limite}\r\nContent-Disposition: form-data; name="file"; '
+                      f'filename="{archivo.name}"\r\nContent-Type: audio/wav\r\n\r\n'.encode())
+        partes.append(archivo.read_bytes())
+        partes.append(f"\r\n--{limite}--\r\n".encode())
+        return self.post(ruta, b"".join(partes), f"multipart/form-data; boundary={limite}")
+
+
+def medir_concurrencia(srv: _Servidor, tmp: Path, subidas: int, niveles: list[int],
+                       segundos: float, model: str) -> dict:
+    from bench.synth import wav_duration
+    salida = {}
+    for nivel in niveles:
+        # Audios nuevos en cada nivel: ni la caché de texto ni la de audio ayudan
+        rutas = _audios(tmp / f"subidas_c{nivel}", [segundos] * subidas, seed=100 + nivel)
+        audio_total = sum(wav_duration(r) for r in rutas)
+        latencias = []
+
+        def subir(ruta):
+            t0 = time.perf_counter()
+            estado, _ = srv.post_audio("/api/transcribe", ruta,
+                                       {"language": "es-chile", "model": model, "cache": "false"})
+            if estado != 200:
+                raise RuntimeError(f"/api/transcribe → {estado}")
+            latencias.append(time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=nivel) as ex:
+            list(ex.map(subir, rutas))
+        total = time.perf_counter() - t0
+        salida[f"c{nivel}"] = {
+            "uploads": subidas, "concurrency": nivel, "wall_s": _r(total),
+            "files_per_s": _r(subidas / total), "audio_s_per_s": _r(audio_total / total, 2),
+            "latency_p50_s": _r(statistics.median(latencias)),
+            "latency_p95_s": _r(_percentil(latencias, 95)),
+        }
+        print(f"  concurrencia {nivel:>2}: {subidas} subidas en {total:.2f}s "
+              f"({subidas / total:.2f} arch/s, p95 {salida[f'c{nivel}']['latency_p95_s']:.2f}s)", flush=True)
+    return salida
+
+
+def medir_carpeta(tmp: Path, archivos: int, segundos: float, model: str) -> dict:
+    from backend.app import EXTENSIONES
+    from backend.pipeline import FolderPipeline, Manifest
+    from backend.watcher import FolderWatcher
+    from bench.synth import wav_duration
+
+    base = tmp / "carpeta"
+    pendientes = base / "Pendientes"
+    for ruta in _audios(tmp / "carpeta_origen", [segundos] * archivos, seed=7):
+        pendientes.mkdir(parents=True, exist_ok=True)
+        shutil.copy(ruta, pendientes / ruta.name)
+    audio_total = sum(wav_duration(p) for p in pendientes.iterdir())
+
+    watcher = FolderWatcher(pendientes, EXTENSIONES, estable_s=0.0, intervalo=0.2)
+    pipe = FolderPipeline(watcher, base / "Transcritas", base / "Archivados",
+                          Manifest(base / "manifest.json"), "es-chile", model,
+                          cache=False, prefetch=True)
+    t0 = time.perf_counter()
+    eventos = list(pipe.run(follow=False, idle=5.0))
+    total = time.perf_counter() - t0
+    watcher.stop()
+    fin = eventos[-1] if eventos else {}
+    if fin.get("type") != "done" or fin.get("errores"):
+        raise RuntimeError(f"modo carpeta terminó con {fin}")
+    print(f"  carpeta: {archivos} archivos en {total:.2f}s "
+          f"({audio_total / total:.1f} s de audio por segundo)", flush=True)
+    return {"files": archivos, "wall_s": _r(total), "files_per_s": _r(archivos / total),
+            "audio_s_per_s": _r(audio_total / total, 2)}
+
+
+def _transcripcion_larga(segundos: float) -> str:
+    """Texto con la forma de la salida del motor falso, en párrafos como el frontend."""
+    import numpy as np
+    from bench.stub_engine import fake_result
+    segs = fake_result(np.zeros(int(segundos * 16000), np.float32), rtf=0.0)["segments"]
+    return "\n\n".join("".join(s["text"] for s in segs[i:i + 6]).strip()
+                       for i in range(0, len(segs), 6))
+
+
+def medir_limpieza(horas: list[float]) -> dict:
+    from backend.transcriber import _clean_transcript
+    salida = {}
+    for h in horas:
+        texto = _transcripcion_larga(h * 3600)
+        mejor = float("inf")
+        for _ in range(3):
+            t0 = time.perf_counter()
+            _clean_transcript(texto)
+            mejor = min(mejor, time.perf_counter() - t0)
+        salida[f"{h:g}h"] = {"chars": len(texto), "words": len(texto.split()), "best_s": _r(mejor, 5)}
+        print(f"  _clean_transcript {h:g} h ({len(texto)} car.): {mejor * 1000:.1f} ms", flush=True)
+    return salida
+
+
+def medir_exportacion(srv: _Servidor, repeticiones: int = 3) -> dict:
+    texto = _transcripcion_larga(3600)
+    cargas = {
+        "pdf": ("/api/export/pdf", {"text": texto, "filename": "clase"}),
+        "docx": ("/api/export/docx", {"text": texto, "filename": "clase"}),
+        "zip": ("/api/export/zip", {"items": [{"text": texto, "filename": f"clase_{i}.m4a"}
+                                              for i in range(20)]}),
+    }
+    salida = {}
+    for nombre, (ruta, cuerpo) in cargas.items():
+        tiempos, tam = [], 0
+        for _ in range(repeticiones):
+            t0 = time.perf_counter()
+            estado, datos = srv.post_json(ruta, cuerpo)
+            if estado != 200:
+                raise RuntimeError(f"{ruta} → {estado}")
+            tiempos.append(time.perf_counter() - t0)
+            tam = len(datos)
+        # La primera renderiza (y arranca el pool); las siguientes salen de la caché de exportaciones
+        salida[nombre] = {"first_s": _r(tiempos[0]), "best_s": _r(min(tiempos)), "bytes": tam}
+        print(f"  exportar {nombre:<4}: {tiempos[0] * 1000:.0f} ms, repetida {min(tiempos) * 1000:.0f} ms "
+              f"({tam // 1024} KB)", flush=True)
+    return salida
+
+
+def _clases_sinteticas(horas: float, seed: int = 1):
+    """
+    Clases de 1,5 h con segmentos de 2–8 s: frases del motor falso (muy
+    repetidas: el peor caso para el ranking) más palabras de un vocabulario
+    inventado con frecuencias tipo Zipf (hay términos raros que buscar).
+    """
+    import itertools
+    import random
+    from bench.stub_engine import FRASES
+    rng = random.Random(seed)
+    vocabulario = ["".join(rng.choice("abcdefgilmnoprstuáéíóúñ") for _ in range(rng.randint(4, 10)))
+                   for _ in range(30000)]
+    acumulados = list(itertools.accumulate(1 / (i + 1) for i in range(len(vocabulario))))
+    for c in range(max(1, int(horas / 1.5))):
+        segmentos, t = [], 0.0
+        while t < 5400:
+            d = rng.uniform(2, 8)
+            texto = " " + rng.choice(FRASES) + " " + " ".join(rng.choices(vocabulario, cum_weights=acumulados, k=6))
+            segmentos.append({"start": round(t, 2), "end": round(t + d, 2), "text": texto})
+            t += d
+        yield f"clase_{c}.m4a", segmentos, vocabulario
+
+
+def medir_busqueda(tmp: Path, horas: float, repeticiones: int = 5) -> dict:
+    from backend.search import SearchIndex
+    indice = SearchIndex(tmp / "search.db", tmp / "transcritas")
+    t0 = time.perf_counter()
+    clases = 0
+    for nombre, segmentos, vocabulario in _clases_sinteticas(horas):
+        indice.add_text(nombre, "".join(s["text"] for s in segmentos), segmentos)
+        clases += 1
+    indexado = time.perf_counter() - t0
+    stats = indice.stats()
+    print(f"  índice {horas:g} h ({clases} clases, {stats['passages']} pasajes, "
+          f"{stats['bytes'] // 2**20} MB): {indexado:.1f} s", flush=True)
+    consultas = {
+        "frecuente": "utilidad",
+        "frase": '"tasa marginal de sustitución"',
+        "prefijo": "elastic*",
+        "exclusion": "precio -demanda",
+        "rara": vocabulario[20000],
+    }
+    salida = {"hours": horas, "passages": stats["passages"], "bytes": stats["bytes"],
+              "index_s": _r(indexado), "queries": {}}
+    for tipo, q in consultas.items():
+        tiempos = []
+        for _ in range(repeticiones):
+            t1 = time.perf_counter()
+            r = indice.search(q)
+            tiempos.append(time.perf_counter() - t1)
+        salida["queries"][tipo] = {"p50_s": _r(_percentil(tiempos, 50), 5),
+                                   "p95_s": _r(_percentil(tiempos, 95), 5), "total": r["total"]}
+        print(f"  buscar {tipo:<9}: p50 {_percentil(tiempos, 50) * 1000:.1f} ms "
+              f"({r['total']}{'' if r['total_exact'] else '+'} pasajes)", flush=True)
+    return salida
+
+
+# ══════════════════════════════════════════════════════════════════
+# COMPARACIÓN
+# ══════════════════════════════════════════════════════════════════
+
+def _aplanar(obj, prefijo: str = "") -> dict[str, float]:
+    plano = {}
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            plano.update(_aplanar(v, f"{prefijo}.{k}" if prefijo else k))
+    elif isinstance(obj, (int, float)) and not isinstance(obj, bool):
+        plano[prefijo] = obj
+    return plano
+
+
+def comparar(viejo: Path, nuevo: Path) -> None:
+    a, b = (json.loads(Path(p).read_text(encoding="utf-8")) for p in (viejo, nuevo))
+    print(f"viejo: {a['meta'].get('commit')} {a['meta'].get('date')}  "
+          f"nuevo: {b['meta'].get('commit')} {b['meta'].get('date')}")
+    pa, pb = _aplanar(a["results"]), _aplanar(b["results"])
+    ancho = max((len(k) for k in pa.keys() | pb.keys()), default=10)
+    for k in sorted(pa.keys() | pb.keys()):
+        va, vb = pa.get(k), pb.get(k)
+        razon = f"{vb / va:7.2f}×" if va and vb is not None else "       "
+        print(f"{k:<{ancho}}  {va if va is not None else '-':>12}  {vb if vb is not None else '-':>12}  {razon}")
+
+
+# ══════════════════════════════════════════════════════════════════
+# MAIN
+# ══════════════════════════════════════════════════════════════════
+
+def _lista(tipo):
+    return lambda s: [tipo(x) for x in s.split(",") if x.strip()]
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--compare", nargs=2, metavar=("VIEJO", "NUEVO"), help="comparar dos resultados")
+    ap.add_argument("--quick", action="store_true", help="tamaños pequeños para una pasada rápida")
+    ap.add_argument("--real", action="store_true", help="usar el Whisper instalado en vez del falso")
+    ap.add_argument("--engine", choices=("whisper", "faster-whisper", "mlx"), default=None,
+                    help="motor (falso: a imitar, whisper por defecto; con --real: el que se usa)")
+    ap.add_argument("--rtf", type=float, default=0.02, help="factor de tiempo real del motor falso")
+    ap.add_argument("--load-s", type=float, default=0.5, help="segundos de carga del modelo falso")
+    ap.add_argument("--model", default=None, help="modelo (por defecto `tiny` con --real)")
+    ap.add_argument("--durations", type=_lista(float), default=[60, 600, 1800], help="segundos de audio (latencia)")
+    ap.add_argument("--uploads", type=int, default=8, help="subidas por nivel de concurrencia")
+    ap.add_argument("--concurrency", type=_lista(int), default=[1, 4], help="niveles de concurrencia")
+    ap.add_argument("--upload-seconds", type=float, default=120, help="duración de cada subida")
+    ap.add_argument("--folder-files", type=int, default=6)
+    ap.add_argument("--folder-seconds", type=float, default=300)
+    ap.add_argument("--clean-hours", type=_lista(float), default=[1, 4])
+    ap.add_argument("--search-hours", type=float, default=300, help="horas de clases en el índice de búsqueda")
+    ap.add_argument("--only", type=_lista(str), default=None,
+                    help="subconjunto: latencia,concurrencia,carpeta,limpieza,exportacion,busqueda")
+    ap.add_argument("--out", type=Path, default=None, help="ruta del JSON de resultados")
+    args = ap.parse_args(argv)
+
+    if args.compare:
+        comparar(*args.compare)
+        return 0
+    if args.quick:
+        args.durations, args.uploads, args.upload_seconds = [30, 300], 4, 30
+        args.folder_files, args.folder_seconds, args.clean_hours = 3, 60, [1]
+        args.search_hours = 15
+    args.model = args.model or ("tiny" if args.real else "mlx-community/whisper-large-v3-turbo")
+
+    meta = _preparar_entorno(args)
+    print(f"Motor: {meta['engine']} ({'falso, RTF %g' % args.rtf if meta['stub'] else 'real'}), "
+          f"modelo {args.model}, ffmpeg {'sí' if meta['ffmpeg'] else 'no'}", flush=True)
+    tmp = Path(meta["data_dir"]) / "bench"
+    partes = set(args.only or ("latencia", "concurrencia", "carpeta", "limpieza", "exportacion", "busqueda"))
+    resultados = {}
+    try:
+        if "latencia" in partes:
+            resultados["latencia"] = medir_latencia(tmp, args.durations, args.model)
+        if "carpeta" in partes:
+            resultados["carpeta"] = medir_carpeta(tmp, args.folder_files, args.folder_seconds, args.model)
+        if "limpieza" in partes:
+            resultados["limpieza"] = medir_limpieza(args.clean_hours)
+        if "busqueda" in partes:
+            resultados["busqueda"] = medir_busqueda(tmp, args.search_hours)
+        if partes & {"concurrencia", "exportacion"}:
+            with _Servidor() as srv:
+                if "concurrencia" in partes:
+                    resultados["concurrencia"] = medir_concurrencia(
+                        srv, tmp, args.uploads, args.concurrency, args.upload_seconds, args.model)
+                if "exportacion" in partes:
+                    resultados["exportacion"] = medir_exportacion(srv)
+    finally:
+        shutil.rmtree(meta["data_dir"], ignore_errors=True)
+
+    salida = args.out or RESULTS_DIR / f"{time.strftime('%Y%m%d-%H%M%S')}-{meta['commit'] or 'nogit'}.json"
+    salida.parent.mkdir(parents=True, exist_ok=True)
+    salida.write_text(json.dumps({"meta": meta, "results": resultados}, ensure_ascii=False, indent=1),
+                      encoding="utf-8")
+    print(f"\nResultados: {salida}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Audio sintético con forma de clase grabada.
+
+No es voz, pero se le parece en lo que importa para medir: una fuente
+glotal (diente de sierra con f0 que deriva entre ~100 y 220 Hz) filtrada a
+la banda vocal, modulada en sílabas de 120–300 ms agrupadas en palabras y
+frases, con pausas cortas entre frases y silencios largos ocasionales
+(la profesora escribiendo en la pizarra), sobre un ruido de sala de -45 dB.
+Es determinista: la misma semilla y duración dan el mismo WAV.
+"""
+import wave
+from pathlib import Path
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+
+def _envolvente(rng: np.random.Generator, n: int, sr: int) -> np.ndarray:
+    """Amplitud 0–1 por muestra: sílabas, palabras, frases y pausas."""
+    env = np.zeros(n, dtype=np.float32)
+    i = int(rng.uniform(0.2, 1.0) * sr)
+    while i < n:
+        if rng.random() < 0.03:  # silencio largo
+            i += int(rng.uniform(5, 20) * sr)
+            continue
+        for _ in range(rng.integers(3, 15)):  # palabras de la frase
+            for _ in range(rng.integers(1, 5)):  # sílabas de la palabra
+                largo = int(rng.uniform(0.12, 0.30) * sr)
+                if i + largo >= n:
+                    return env
+                env[i:i + largo] = np.hanning(largo) * rng.uniform(0.4, 1.0)
+                i += largo
+            i += int(rng.uniform(0.05, 0.15) * sr)
+        i += int(rng.uniform(0.3, 1.5) * sr)
+    return env
+
+
+def _banda_vocal(x: np.ndarray, sr: int) -> np.ndarray:
+    """Filtro 300–3400 Hz con caída hacia agudos, aplicado por FFT."""
+    espectro = np.fft.rfft(x)
+    f = np.fft.rfftfreq(len(x), 1 / sr)
+    ganancia = ((f > 300) & (f < 3400)) / (1 + f / 1000)
+    return np.fft.irfft(espectro * ganancia, len(x)).astype(np.float32)
+
+
+def lecture_audio(segundos: float, seed: int = 0, sr: int = SAMPLE_RATE) -> np.ndarray:
+    """PCM float32 mono de `segundos` de duración."""
+    rng = np.random.default_rng(seed)
+    n = int(segundos * sr)
+    salida = np.empty(n, dtype=np.float32)
+    bloque = 60 * sr  # por bloques: una hora entera no pasa por una sola FFT
+    fase = 0.0
+    for a in range(0, n, bloque):
+        b = min(n, a + bloque)
+        f0 = 160 + 60 * np.sin(np.linspace(0, rng.uniform(2, 8), b - a) + rng.uniform(0, 6))
+        ciclos = fase + np.cumsum(f0 / sr)
+        fase = float(ciclos[-1] % 1.0)
+        fuente = 2 * (ciclos % 1.0) - 1
+        voz = _banda_vocal(fuente, sr) * _envolvente(rng, b - a, sr)
+        voz *= 0.3 / (np.abs(voz).max() + 1e-9)
+        salida[a:b] = voz + rng.normal(0, 10 ** (-45 / 20), b - a).astype(np.float32)
+    return salida
+
+
+def write_wav(ruta: Path, audio: np.ndarray, sr: int = SAMPLE_RATE) -> Path:
+    pcm = (np.clip(audio, -1, 1) * 32767).astype("<i2")
+    with wave.open(str(ruta), "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sr)
+        w.writeframes(pcm.tobytes())
+    return Path(ruta)
+
+
+def read_wav(ruta, sr: int = SAMPLE_RATE) -> np.ndarray:
+    """Lector mínimo para cuando no hay ffmpeg (solo WAV PCM 16 bit mono a `sr`)."""
+    with wave.open(str(ruta), "rb") as w:
+        if (w.getnchannels(), w.getsampwidth(), w.getframerate()) != (1, 2, sr):
+            raise RuntimeError(f"{ruta}: sin ffmpeg solo se leen WAV mono 16 bit a {sr} Hz")
+        datos = w.readframes(w.getnframes())
+    return np.frombuffer(datos, "<i2").astype(np.float32) / 32768.0
+
+
+def wav_duration(ruta) -> float | None:
+    try:
+        with wave.open(str(ruta), "rb") as w:
+            return w.getnframes() / w.getframerate()
+    except (OSError, wave.Error):
+        return None
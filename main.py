@@ -2,33 +2,103 @@
 Punto de entrada para ejecutar el servidor de Transcriptotem.
 
 Uso:
-    python main.py
+    python main.py                         # desarrollo (Mac): recarga automática, 1 proceso
+    python main.py --prod --workers 4      # servidor: N procesos, sin recarga
 
 O con uvicorn directamente:
     uvicorn backend.app:app --reload --host 0.0.0.0 --port 8000
+
+Todas las opciones de --prod también se leen del entorno
+(TRANSCRIPTOTEM_MODE=prod, TRANSCRIPTOTEM_WORKERS, TRANSCRIPTOTEM_THREADS…).
+Este archivo no importa el backend: cada worker lo importa al arrancar.
 """
+import argparse
 import os
+
 import uvicorn
 
-# ── Optimización térmica para Apple Silicon M3 ──────────────────────────────
-# Limita los threads de operaciones matemáticas para reducir calor.
-# Whisper seguirá usando la GPU del M3 (vía MLX) pero con menos presión
-# en los cores de CPU. Efecto: ~20% menos calor, ~10% más lento.
-# Cambiar "4" a "6" si prefieres más velocidad y aceptas más calor.
-os.environ["OMP_NUM_THREADS"] = "4"
-os.environ["MKL_NUM_THREADS"] = "4"
-os.environ["OPENBLAS_NUM_THREADS"] = "4"
 
-# Evita que MLX acapare toda la memoria unificada del M3.
-# Limita el uso de memoria de la GPU al 70% (ajusta si tienes errores de RAM).
-os.environ["MLX_GPU_MEMORY_LIMIT"] = "0.70"
-# ─────────────────────────────────────────────────────────────────────────────
+def _modo_desarrollo() -> None:
+    # ── Optimización térmica para Apple Silicon M3 ──────────────────────────────
+    # Limita los threads de operaciones matemáticas para reducir calor.
+    # Whisper seguirá usando la GPU del M3 (vía MLX) pero con menos presión
+    # en los cores de CPU. Efecto: ~20% menos calor, ~10% más lento.
+    # Cambiar "4" a "6" si prefieres más velocidad y aceptas más calor.
+    os.environ["OMP_NUM_THREADS"] = "4"
+    os.environ["MKL_NUM_THREADS"] = "4"
+    os.environ["OPENBLAS_NUM_THREADS"] = "4"
 
-if __name__ == "__main__":
-    # host 0.0.0.0 permite conexiones desde otras máquinas en la red (ej: Android)
+    # Evita que MLX acapare toda la memoria unificada del M3.
+    # Limita el uso de memoria de la GPU al 70% (ajusta si tienes errores de RAM).
+    os.environ["MLX_GPU_MEMORY_LIMIT"] = "0.70"
+    # ─────────────────────────────────────────────────────────────────────────────
+
+
+def _modo_produccion(args) -> None:
+    """
+    Fija el entorno que heredan los workers antes de lanzarlos: threads de
+    cómputo repartidos entre procesos (cores / workers, sin sobresuscribir),
+    modelos a precargar y carpetas compartidas.
+    """
+    nucleos = os.cpu_count() or 4
+    hilos = args.threads or max(1, nucleos // args.workers)
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(hilos)
+    os.environ["TRANSCRIPTOTEM_THREADS"] = str(hilos)
+    if args.preload:
+        os.environ["TRANSCRIPTOTEM_PRELOAD_MODELS"] = args.preload
+    if args.data_dir:
+        os.environ["TRANSCRIPTOTEM_DATA_DIR"] = args.data_dir
+    if args.model_cache:
+        os.environ["TRANSCRIPTOTEM_MODEL_CACHE_DIR"] = args.model_cache
+        os.environ.setdefault("HF_HUB_CACHE", args.model_cache)  # mlx y faster-whisper usan el hub
+    print(f"Transcriptotem (producción): {args.workers} workers × {hilos} threads "
+          f"en {nucleos} cores, http://{args.host}:{args.port}", flush=True)
+
+
+def main() -> None:
+    entorno = os.environ.get
+    p = argparse.ArgumentParser(description="Servidor de Transcriptotem")
+    p.add_argument("--prod", action="store_true",
+                   default=entorno("TRANSCRIPTOTEM_MODE", "").lower() in {"prod", "production"},
+                   help="modo servidor: varios workers, sin recarga (TRANSCRIPTOTEM_MODE=prod)")
+    p.add_argument("--host", default=entorno("TRANSCRIPTOTEM_HOST", "0.0.0.0"))
+    p.add_argument("--port", type=int, default=int(entorno("TRANSCRIPTOTEM_PORT", "8000")))
+    p.add_argument("--workers", type=int, default=int(entorno("TRANSCRIPTOTEM_WORKERS", "1")),
+                   help="procesos de uvicorn (solo --prod)")
+    p.add_argument("--threads", type=int, default=int(entorno("TRANSCRIPTOTEM_THREADS", "0")),
+                   help="threads de cómputo por worker (0 = cores / workers)")
+    p.add_argument("--preload", default=entorno("TRANSCRIPTOTEM_PRELOAD_MODELS", ""),
+                   help="modelos a cargar antes de aceptar tráfico, separados por comas")
+    p.add_argument("--data-dir", default=entorno("TRANSCRIPTOTEM_DATA_DIR", ""))
+    p.add_argument("--model-cache", default=entorno("TRANSCRIPTOTEM_MODEL_CACHE_DIR", ""),
+                   help="carpeta de pesos descargados, compartida por los workers")
+    p.add_argument("--log-level", default=entorno("TRANSCRIPTOTEM_LOG_LEVEL", "info"))
+    args = p.parse_args()
+    args.workers = max(1, args.workers)
+
+    if not args.prod:
+        _modo_desarrollo()
+        # host 0.0.0.0 permite conexiones desde otras máquinas en la red (ej: Android)
+        uvicorn.run(
+            "backend.app:app",
+            host=args.host,
+            port=args.port,
+            reload=True,  # Recarga automática al cambiar código
+        )
+        return
+
+    _modo_produccion(args)
     uvicorn.run(
         "backend.app:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True,  # Recarga automática al cambiar código
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        reload=False,
+        log_level=args.log_level,
+        timeout_graceful_shutdown=30,  # deja terminar las transcripciones en curso
     )
+
+
+if __name__ == "__main__":
+    main()